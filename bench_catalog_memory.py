@@ -0,0 +1,69 @@
+"""店舗カタログのメモリ使用量を、辞書のリストと CompactCatalog で比較する
+
+使い方:
+    python bench_catalog_memory.py                 # meguro_shops.json をそのまま
+    python bench_catalog_memory.py --shops 134000  # 件数を増やして比較（IDを付け替えて複製）
+"""
+import argparse, copy, gc, json, time, tracemalloc
+
+from utils.compact_catalog import CompactCatalog
+
+
+def load_shops(json_path: str, count: int):
+    with open(json_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    if not count or count <= len(base):
+        return base[:count] if count else base
+    shops = []
+    while len(shops) < count:
+        for shop in base:
+            if len(shops) >= count:
+                break
+            replica = copy.deepcopy(shop)
+            replica["id"] = f"{shop['id']}_{len(shops)}"
+            shops.append(replica)
+    return shops
+
+
+def measure(build):
+    """build() が作ったオブジェクトが保持しているメモリ（MB）と構築時間（秒）"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current / 1024 / 1024, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="店舗カタログのメモリ比較")
+    parser.add_argument("--json", default="meguro_shops.json")
+    parser.add_argument("--shops", type=int, default=0, help="比較する店舗数（0ならファイルの件数）")
+    args = parser.parse_args()
+
+    payload = json.dumps(load_shops(args.json, args.shops), ensure_ascii=False)
+    print(f"店舗数: {len(json.loads(payload))}  JSON: {len(payload.encode('utf-8')) / 1024 / 1024:.1f}MB")
+
+    dicts, dict_mb, dict_sec = measure(lambda: json.loads(payload))
+    print(f"辞書のリスト:    {dict_mb:8.1f}MB  ({dict_sec:.2f}s)")
+    del dicts
+
+    table, compact_mb, compact_sec = measure(lambda: CompactCatalog(json.loads(payload)))
+    print(f"CompactCatalog: {compact_mb:8.1f}MB  ({compact_sec:.2f}s)  {dict_mb / compact_mb:.1f}倍小さい")
+
+    rows = range(0, len(table), max(1, len(table) // 1000))
+    start = time.perf_counter()
+    for row in rows:
+        table.record(row)["name"]
+    print(f"名前の取得:      {(time.perf_counter() - start) / len(rows) * 1e6:.1f}µs/件")
+    start = time.perf_counter()
+    for row in rows:
+        table.record(row).to_dict()
+    print(f"to_dict():      {(time.perf_counter() - start) / len(rows) * 1e6:.1f}µs/件")
+
+
+if __name__ == "__main__":
+    main()
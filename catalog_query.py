@@ -0,0 +1,87 @@
+"""クロール結果（hotpepper_data/shards）から、エリア・ジャンル・駅で店舗カタログを切り出す
+
+使い方:
+    python catalog_query.py build                                   # インデックスを作る（追記分だけ更新）
+    python catalog_query.py query --small-area 目黒 -o meguro_shops.json
+    python catalog_query.py query --station 恵比寿 --genre G001 G002 -o ebisu_izakaya.json
+    python catalog_query.py split --by small_area 目黒 恵比寿 中目黒 --output-dir catalogs
+    python catalog_query.py values small_area                       # 値と店舗数の一覧
+
+条件は項目間がAND、同じ項目の複数の値がOR。エリア・ジャンルはコードでも名前でも指定できる。
+query / split は先にインデックスを更新するので、build を先に実行しなくてもよい。
+"""
+import argparse, os, sys, time
+from typing import Dict, List, Optional
+
+from utils.catalog_index import INDEXED_FIELDS, CatalogIndex
+
+DEFAULT_SHARDS_DIR = os.path.join("hotpepper_data", "shards")
+
+
+def _filters(args) -> Dict[str, List[str]]:
+    return {field: getattr(args, field) for field in INDEXED_FIELDS if getattr(args, field)}
+
+
+def _open(args) -> CatalogIndex:
+    if not os.path.isdir(args.shards):
+        sys.exit(f"シャードのディレクトリがありません: {args.shards}（hotpepper_collector.py で取得してください）")
+    index = CatalogIndex(args.shards)
+    start = time.perf_counter()
+    added = index.refresh()
+    if added:
+        print(f"インデックスに {added} 件追加 ({(time.perf_counter() - start) * 1000:.0f}ms)")
+    return index
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="店舗カタログの切り出し")
+    parser.add_argument("--shards", default=DEFAULT_SHARDS_DIR, help="クロール結果のシャードのディレクトリ")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("build", help="インデックスを作る・更新する")
+
+    for name in ("query", "split"):
+        command = commands.add_parser(name)
+        for field in INDEXED_FIELDS:
+            command.add_argument(f"--{field.replace('_', '-')}", dest=field, nargs="+", metavar="VALUE")
+        command.add_argument("--indent", type=int, default=2, help="出力のインデント（0で1行ずつ詰める）")
+        if name == "query":
+            command.add_argument("-o", "--output", help="書き出すカタログファイル（省略時は件数だけ表示）")
+        else:
+            command.add_argument("--by", required=True, choices=INDEXED_FIELDS, help="ファイルを分ける項目")
+            command.add_argument("values", nargs="+", help="ファイルを作る値（1つにつき1ファイル）")
+            command.add_argument("--output-dir", default="catalogs")
+
+    values = commands.add_parser("values", help="項目の値と店舗数")
+    values.add_argument("field", choices=INDEXED_FIELDS)
+    values.add_argument("--limit", type=int, default=50)
+
+    args = parser.parse_args(argv)
+    index = _open(args)
+    try:
+        if args.command == "build":
+            print(f"インデックス: {index.index_path}（{index.count()} 店舗）")
+        elif args.command == "values":
+            for value, count in index.values(args.field)[:args.limit]:
+                print(f"{count:8d}  {value}")
+        elif args.command == "query":
+            start = time.perf_counter()
+            filters = _filters(args)
+            if args.output:
+                count = index.export(args.output, args.indent or None, **filters)
+                print(f"{count} 店舗を書き出しました: {args.output} ({(time.perf_counter() - start) * 1000:.0f}ms)")
+            else:
+                print(f"{index.count(**filters)} 店舗 ({(time.perf_counter() - start) * 1000:.0f}ms)")
+        elif args.command == "split":
+            start = time.perf_counter()
+            written = index.export_many(args.output_dir, args.by, args.values, args.indent or None, **_filters(args))
+            for value, (path, count) in written.items():
+                print(f"{count:8d}  {value} -> {path}")
+            print(f"{len(written)} ファイル ({(time.perf_counter() - start) * 1000:.0f}ms)")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,87 +2,79 @@
 import os
 import re
 import json
-from typing import List, Dict, Any, Optional
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain.schema import BaseMessage, HumanMessage, AIMessage
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 
-from utils.vector_store import VectorStore
+from utils.vector_store import BaseVectorStore, get_vector_store
+from utils.restaurant_catalog import get_catalog
+from utils.geo_index import range_to_meters
+from utils.keyword_index import reciprocal_rank_fusion
+from utils.llm_clients import get_llm_clients
+
+if TYPE_CHECKING:
+    # langchainの読み込みは重いので、使うメソッドの中でインポートする
+    from langchain_core.messages import BaseMessage
+
+# vector: 埋め込みのみ / keyword: BM25のみ / hybrid: 両方の順位をRRFでまとめる
+SEARCH_MODES = ("hybrid", "vector", "keyword")
 
 class RestaurantSearchTool:
     def __init__(self, json_path='meguro_shops.json', language: str = "ja"):
-        # ベクトルストアの初期化
-        self.vector_store = VectorStore()
-        
-        # JSONファイルを読み込む
-        with open(json_path, 'r', encoding='utf-8') as f:
-            self.restaurants_data = json.load(f)
-        
-        # IDでインデックスを作成して高速検索
-        self.restaurants_by_id = {
-            restaurant['id']: restaurant 
-            for restaurant in self.restaurants_data
-        }
+        # ベクトルストア・カタログ・LLMは最初に使うときに用意する（インポート・起動を速くするため）
+        self.json_path = json_path
+        self._llm = None
         
         # 言語設定
         self.language = language
         
+        # 検索方式（環境変数 RESTAURANT_SEARCH_MODE で変更可）
+        # （既定はベクトル検索のみ。hybrid・keyword は呼び出し側が選んだときだけ使う）
+        self.search_mode = os.getenv("RESTAURANT_SEARCH_MODE", "vector")
+        if self.search_mode not in SEARCH_MODES:
+            print(f"Unknown RESTAURANT_SEARCH_MODE={self.search_mode}, using vector")
+            self.search_mode = "vector"
+        
         self.name = "restaurant_search"
         self.description = "Search for restaurants in Tokyo with context-aware search"
-        
-        # LLMの初期化
-        self.llm = ChatOpenAI(
-            model_name="gpt-3.5-turbo",
-            temperature=0.3,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        # エリアキャッシュの初期化
-        self.area_cache = {}
-        self._build_area_index()
-    
-    def _build_area_index(self):
-        """エリアインデックスを構築して高速検索を可能に"""
-        for restaurant in self.restaurants_data:
-            # 複数のエリア関連フィールドからインデックスを作成
-            areas = []
-            
-            # small_area（例：目黒）
-            if 'small_area' in restaurant and 'name' in restaurant['small_area']:
-                areas.append(restaurant['small_area']['name'])
-            
-            # middle_area（例：品川･目黒･田町･浜松町･五反田）
-            if 'middle_area' in restaurant and 'name' in restaurant['middle_area']:
-                areas.append(restaurant['middle_area']['name'])
-            
-            # station_name（例：目黒）
-            if 'station_name' in restaurant:
-                areas.append(restaurant['station_name'])
-            
-            # addressから抽出（例：東京都目黒区...）
-            if 'address' in restaurant:
-                # 例：「東京都目黒区」から「目黒」を抽出
-                address_match = re.search(r'(新宿|渋谷|池袋|銀座|上野|秋葉原|新橋|浅草|品川|六本木|目黒)', restaurant['address'])
-                if address_match:
-                    areas.append(address_match.group(1))
-            
-            # 各エリアでインデックスを作成
-            for area in areas:
-                if area:
-                    if area not in self.area_cache:
-                        self.area_cache[area] = []
-                    self.area_cache[area].append(restaurant)
+
+    @property
+    def vector_store(self) -> BaseVectorStore:
+        # アプリ全体で共有するベクトルストア
+        return get_vector_store()
+
+    @property
+    def catalog(self):
+        # 共有カタログ（プロセス内で1回だけ読み込み、IDで高速検索）
+        return get_catalog(self.json_path)
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_openai import ChatOpenAI
+            self._llm = ChatOpenAI(
+                model_name="gpt-3.5-turbo",
+                temperature=0.3,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                **get_llm_clients().langchain_http_clients()
+            )
+        return self._llm
     
+    @property
+    def restaurants_data(self) -> List[Mapping]:
+        return self.catalog.all()
+
     def validate_query(self, query: str) -> bool:
         """エリアの検証を含む高度なクエリバリデーション"""
         # 東京の主要エリアが含まれているかチェック
         return bool(re.search(r'東京|新宿|渋谷|池袋|銀座|上野|秋葉原|新橋|浅草|品川|六本木|目黒', query))
     
-    async def _rephrase_query_with_history(self, query: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
+    async def _rephrase_query_with_history(self, query: str, chat_history: Optional[List["BaseMessage"]] = None) -> str:
         """チャット履歴を考慮してクエリを再構築"""
         if not chat_history:
             return query
+        from langchain_core.messages import AIMessage, HumanMessage
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate
         
         rephrase_prompt = ChatPromptTemplate.from_messages([
             ("system", """チャット履歴と最新のユーザー質問を使用して、レストラン検索に適した独立した質問に言い換えてください。
@@ -109,12 +101,12 @@ class RestaurantSearchTool:
         
         return rephrased.strip()
     
-    def _extract_restaurant_info(self, restaurant_data: Dict[str, Any]) -> Dict[str, Any]:
-        """レストランの全情報を構造化して抽出"""
+    def _extract_restaurant_info(self, restaurant_data: Mapping) -> Dict[str, Any]:
+        """レストランの全情報を構造化して抽出（辞書またはカタログのShopRecord）"""
         # 必要な情報を安全に取得
         def safe_get(data, *keys):
             for key in keys:
-                if isinstance(data, dict) and key in data:
+                if isinstance(data, Mapping) and key in data:
                     data = data[key]
                 else:
                     return ""
@@ -199,30 +191,85 @@ class RestaurantSearchTool:
             "wedding": restaurant_data.get("wedding", ""),
         }
     
-    def search_restaurants(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
-        """拡張されたレストラン検索：完全な情報を含む結果を返す"""
-        # ベクトル検索で候補レストランを取得
-        search_results = self.vector_store.search_restaurants(query, max_results)
+    def search_restaurants(self, query: str, max_results: int = 10,
+                           preferences: Optional[Dict[str, Any]] = None,
+                           mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """拡張されたレストラン検索：完全な情報を含む結果を返す
+
+        preferences（エリア・ジャンル・予算・設備の希望）があれば、カタログで候補を絞ってから
+        その中だけで検索する。hybrid ではベクトル検索とBM25（店名・読み・駅などの完全一致に強い）の
+        順位をRRFでまとめ、ベクトル検索に失敗したときはBM25の結果だけを返す（mode 省略時は self.search_mode）。
+        """
+        mode = mode or self.search_mode
+        candidate_ids = None
+        if preferences:
+            candidates = self.catalog.candidates(preferences)
+            print(f"Catalog filter: {candidates}")
+            candidate_ids = candidates.ids
+
+        # まとめる前にそれぞれ多めに取る
+        depth = max_results * 2 if mode == "hybrid" else max_results
+        vector_matches = []
+        if mode != "keyword":
+            try:
+                vector_matches = self.vector_store.search_restaurants(query, depth, candidate_ids)
+            except Exception as e:
+                if mode == "vector":
+                    raise
+                print(f"Vector search failed, using keyword search only: {e}")
+        keyword_matches = [] if mode == "vector" else self.catalog.bm25().search_ids(query, depth, candidate_ids)
+
+        vector_scores = {match['id']: match['score'] for match in vector_matches}
+        keyword_scores = dict(keyword_matches)
+        if mode == "vector":
+            ranked = list(vector_scores.items())
+        elif mode == "keyword":
+            ranked = keyword_matches
+        else:
+            ranked = reciprocal_rank_fusion([list(vector_scores), [shop_id for shop_id, _ in keyword_matches]])
         
         # 結果を整形
         restaurants = []
-        for match in search_results:
-            restaurant_id = match['id']
-            
+        for restaurant_id, score in ranked[:max_results]:
             # JSONデータから完全な情報を取得
-            restaurant_data = self.restaurants_by_id.get(restaurant_id, {})
+            restaurant_data = self.catalog.get(restaurant_id) or {}
             
             if restaurant_data:
                 # 完全なレストラン情報を抽出
                 restaurant_info = self._extract_restaurant_info(restaurant_data)
                 
-                # ベクトル検索のスコアを追加
-                restaurant_info["score"] = match['score']
+                # 検索スコアを追加（score は vector ではコサイン類似度、keyword ではBM25。
+                # hybrid では score はコサイン類似度のままにし、順位に使ったRRFの値は fusion_score に入れる）
+                if mode == "hybrid":
+                    restaurant_info["score"] = vector_scores.get(restaurant_id)
+                    restaurant_info["keyword_score"] = keyword_scores.get(restaurant_id)
+                    restaurant_info["fusion_score"] = score
+                else:
+                    restaurant_info["score"] = score
                 
                 restaurants.append(restaurant_info)
         
         return restaurants
     
+    def search_nearby(self, lat: float, lng: float, search_range: int = 3,
+                      max_results: int = 10) -> List[Dict[str, Any]]:
+        """指定地点の近くのレストランを近い順に返す（range は HotPepper と同じ 1〜5）"""
+        nearby = self.catalog.nearby(lat, lng, range_to_meters(search_range), max_results)
+        restaurants = []
+        for restaurant_data, distance in nearby:
+            restaurant_info = self._extract_restaurant_info(restaurant_data)
+            restaurant_info["distance_m"] = round(distance)
+            restaurants.append(restaurant_info)
+        return restaurants
+
+    def search_near_station(self, station: str, search_range: int = 3,
+                            max_results: int = 10) -> List[Dict[str, Any]]:
+        """駅の近くのレストランを近い順に返す（駅がカタログにない場合は空）"""
+        location = self.catalog.geo().station_location(station)
+        if location is None:
+            return []
+        return self.search_nearby(location[0], location[1], search_range, max_results)
+
     async def _rank_restaurants(self, query: str, restaurants: List[Dict[str, Any]], top_k: int = 5) -> str:
         """LLMを使用してレストランをランク付けして表示（全情報を考慮）"""
         # より詳細なレストラン情報を作成
@@ -239,6 +286,8 @@ class RestaurantSearchTool:
             for i, r in enumerate(restaurants[:20])
         ])
         
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate
         rank_prompt = ChatPromptTemplate.from_template(
             """あなたは親切なレストランコンシェルジュです。以下のレストランリストからユーザーの質問に最も適したものを選んでください。
 
@@ -265,12 +314,13 @@ class RestaurantSearchTool:
     
     def get_restaurant_details(self, restaurant_id: str) -> Optional[Dict[str, Any]]:
         """特定のレストランの詳細情報を取得"""
-        restaurant_data = self.restaurants_by_id.get(restaurant_id)
+        restaurant_data = self.catalog.get(restaurant_id)
         if restaurant_data:
             return self._extract_restaurant_info(restaurant_data)
         return None
     
-    async def invoke(self, query: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
+    async def invoke(self, query: str, chat_history: Optional[List["BaseMessage"]] = None,
+                     preferences: Optional[Dict[str, Any]] = None) -> str:
         try:
             # 1. チャット履歴を考慮してクエリを再構築
             rephrased_query = await self._rephrase_query_with_history(query, chat_history)
@@ -280,7 +330,7 @@ class RestaurantSearchTool:
                 return "どのエリアのレストランを探していますか？東京の主要エリア（新宿、渋谷、銀座など）を指定してください。"
             
             # 3. レストラン検索（10件まで取得）
-            restaurants = self.search_restaurants(rephrased_query, max_results=10)
+            restaurants = self.search_restaurants(rephrased_query, max_results=10, preferences=preferences)
             
             # 4. 結果が見つからない場合
             if not restaurants:
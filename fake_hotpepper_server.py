@@ -0,0 +1,113 @@
+"""クローラーやAPIラッパー（hotpepper.py）のテスト用のHotPepperグルメAPIの偽サーバー
+
+エリアごとに決まった件数の店舗をページ単位で返す。失敗（500）やレート制限（429）も再現できる。
+
+使い方:
+    python fake_hotpepper_server.py --shops Z011=5000 Z012=800 --port 8010
+    HotpepperDataCollector(api_key, output_dir, base_url="http://localhost:8010/hotpepper") から接続する
+"""
+import argparse, asyncio, time
+from typing import Dict, Optional, Set, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+
+def fake_shop(area_code: str, index: int) -> Dict:
+    return {
+        "id": f"J{area_code}{index:06d}",
+        "name": f"テスト店舗 {area_code}-{index}",
+        "address": f"東京都テスト区{index}-{index % 10}",
+        "urls": {"pc": f"https://www.hotpepper.jp/strJ{area_code}{index:06d}/"},
+        "large_area": {"code": area_code, "name": f"エリア{area_code}"},
+        "middle_area": {"code": f"Y{index % 7:03d}", "name": f"中エリア{index % 7}"},
+        "small_area": {"code": f"X{index % 13:03d}", "name": f"小エリア{index % 13}"},
+        "genre": {"code": f"G{index % 17 + 1:03d}", "name": "居酒屋"},
+        "station_name": f"駅{index % 5}",
+        "lat": 35.6 + index * 1e-5,
+        "lng": 139.7 + index * 1e-5,
+    }
+
+
+def create_app(shops_per_area: Dict[str, int], fail_pages: Optional[Set[Tuple[str, int]]] = None,
+               max_rps: Optional[float] = None, latency: float = 0.0,
+               broken_pages: Optional[Set[Tuple[str, int]]] = None) -> FastAPI:
+    """偽サーバーのアプリ
+
+    fail_pages: 最初の1回だけ500を返す (エリアコード, start)
+    broken_pages: 最初の1回だけ途中で切れたJSONを200で返す (エリアコード, start)
+    max_rps: 直近1秒のリクエストがこれを超えたら429（Retry-After付き）を返す
+    latency: 応答までの待ち時間（秒）
+    """
+    app = FastAPI()
+    failed_once: Set[Tuple[str, int]] = set()
+    broken_once: Set[Tuple[str, int]] = set()
+    recent = []
+    app.state.stats = {"requests": 0, "rate_limited": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+    @app.get("/hotpepper/gourmet/v1/")
+    async def gourmet(request: Request):
+        stats = app.state.stats
+        stats["requests"] += 1
+        now = time.monotonic()
+        recent[:] = [t for t in recent if now - t < 1.0]
+        recent.append(now)
+        if max_rps is not None and len(recent) > max_rps:
+            stats["rate_limited"] += 1
+            return JSONResponse({"results": {"error": [{"message": "rate limited"}]}}, status_code=429,
+                                headers={"Retry-After": "1"})
+
+        params = request.query_params
+        area_code = params.get("large_area") or params.get("middle_area") or params.get("small_area") or ""
+        start = int(params.get("start", 1))
+        count = min(int(params.get("count", 10)), 100)
+        if fail_pages and (area_code, start) in fail_pages and (area_code, start) not in failed_once:
+            failed_once.add((area_code, start))
+            stats["failed"] += 1
+            return JSONResponse({"error": "temporary failure"}, status_code=500)
+        if broken_pages and (area_code, start) in broken_pages and (area_code, start) not in broken_once:
+            broken_once.add((area_code, start))
+            stats["failed"] += 1
+            return Response('{"results": {"shop": [', media_type="application/json")
+
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            if latency:
+                await asyncio.sleep(latency)
+        finally:
+            stats["in_flight"] -= 1
+
+        total = shops_per_area.get(area_code, 0)
+        shops = [fake_shop(area_code, index) for index in range(start, min(total, start + count - 1) + 1)]
+        return {"results": {
+            "api_version": "1.26",
+            "results_available": total,
+            "results_returned": str(len(shops)),
+            "results_start": start,
+            "shop": shops,
+        }}
+
+    @app.get("/hotpepper/large_area/v1/")
+    async def large_areas():
+        areas = [{"code": code, "name": f"エリア{code}"} for code in shops_per_area]
+        return {"results": {"large_area": areas, "results_available": len(areas)}}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="HotPepperグルメAPIの偽サーバー")
+    parser.add_argument("--shops", nargs="+", default=["Z011=1000"], help="エリアコード=店舗数")
+    parser.add_argument("--max-rps", type=float, default=None)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8010)
+    args = parser.parse_args()
+    shops = {code: int(count) for code, count in (item.split("=") for item in args.shops)}
+    uvicorn.run(create_app(shops, max_rps=args.max_rps, latency=args.latency), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,16 @@
-import json
+"""目黒（小エリア）の店舗カタログ meguro_shops.json をクロール結果から作る
 
-# Input and output file paths
-input_file = '/Users/mbp231/Desktop/Ninja/hotpepper_data/shops/large_area_Z011_shops.json'
-output_file = '/Users/mbp231/Desktop/Ninja/meguro_shops.json'
+    python filter_meguro_shops.py [--shards hotpepper_data/shards] [-o meguro_shops.json]
 
-# Read the input JSON file
-with open(input_file, 'r', encoding='utf-8') as f:
-    shops = json.load(f)
+他のエリアは catalog_query.py query / split を使う。
+"""
+import argparse, sys
 
-# Filter shops with small_area name as "目黒"
-meguro_shops = [
-    shop for shop in shops 
-    if shop.get('small_area', {}).get('name') == '目黒'
-]
+import catalog_query
 
-# Write filtered shops to a new JSON file
-with open(output_file, 'w', encoding='utf-8') as f:
-    json.dump(meguro_shops, f, ensure_ascii=False, indent=2)
-
-print(f"Total shops in original file: {len(shops)}")
-print(f"Shops in 目黒: {len(meguro_shops)}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="目黒の店舗カタログを作る")
+    parser.add_argument("--shards", default=catalog_query.DEFAULT_SHARDS_DIR)
+    parser.add_argument("-o", "--output", default="meguro_shops.json")
+    args = parser.parse_args()
+    sys.exit(catalog_query.main(["--shards", args.shards, "query", "--small-area", "目黒", "-o", args.output]))
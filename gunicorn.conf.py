@@ -1 +1,52 @@
-timeout = 300
\ No newline at end of file
+# gunicorn.conf.py
+# 使い方: gunicorn wsgi:app -c gunicorn.conf.py
+#
+# ワーカー間で共有する状態は、セッションストア（SQLite / SESSION_STORE=redis）と
+# ロック付きで書き込むJSONファイルに置いている。応答キャッシュ・カタログ・ベクトルストア・
+# LLMとHotPepperの接続プールはワーカーごとに持つ（fork後に各ワーカーで作る）。
+import multiprocessing, os, sys, threading
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# 既定はCPU数+1（最大4）。WEB_CONCURRENCY で変更できる
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() + 1, 4)))
+
+timeout = 300
+graceful_timeout = 30
+keepalive = 5
+# メモリの増加を抑えるため、一定数のリクエストでワーカーを入れ替える（同時に入れ替わらないよう揺らす）
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+# アプリはワーカーごとにfork後に読み込む（接続プールやSQLiteの接続をプロセス間で共有しないため）
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+
+
+# プロセス単位の共有オブジェクト（モジュール, 変数, 空の値を作る関数, ロックの変数）。
+# 接続プール・SQLiteの接続・読み直しのスレッドはforkを越えて使えないので、ワーカーで作り直させる
+PER_PROCESS_SINGLETONS = (
+    ("utils.llm_clients", "_registry", lambda: None, "_registry_lock"),
+    ("utils.session_store", "_store", lambda: None, "_store_lock"),
+    ("utils.vector_store", "_shared_store", lambda: None, "_shared_store_lock"),
+    ("utils.restaurant_catalog", "_catalogs", dict, "_catalogs_lock"),
+    ("utils.hotpepper_client", "_client", lambda: None, "_client_lock"),
+    ("utils.jsonl_log", "_logs", dict, "_logs_lock"),
+)
+
+
+def post_fork(server, worker):
+    # preload_app=True で起動された場合に備えて、親プロセスで作られたプロセス単位の共有オブジェクトを捨てる
+    # （fork時に親のスレッドが持っていたロックも取り直せるように新しくする）
+    for module_name, attribute, empty, lock_attribute in PER_PROCESS_SINGLETONS:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            setattr(module, attribute, empty())
+            setattr(module, lock_attribute, threading.Lock())
+    server.log.info(f"Worker spawned (pid: {worker.pid})")
+
+
+def when_ready(server):
+    server.log.info(f"Serving with {workers} {worker_class} workers on {bind}")
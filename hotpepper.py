@@ -1,25 +1,52 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Response
 from pydantic import BaseModel
-import requests
 import os
 from typing import List, Optional
 from dotenv import load_dotenv
 
+from utils.geo_index import range_to_meters
+from utils.hotpepper_client import UpstreamError, get_hotpepper_client
+from utils.restaurant_catalog import get_catalog
+
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the local catalogue indexes up front so the first search does not pay for it
+    catalog = local_catalog()
+    if catalog is not None:
+        await asyncio.to_thread(lambda: (catalog.keywords(), catalog.geo(), catalog.large_area_codes()))
+    yield
+    # Close the shared upstream connection pool
+    await get_hotpepper_client().aclose()
+
+
 # Create FastAPI app instance
 app = FastAPI(
     title="Hotpepper API Wrapper",
     description="A simple API wrapper for the Hotpepper Gourmet API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Get API key from environment variable (more secure) or set it directly
-# You can set this environment variable with: export HOTPEPPER_API_KEY="your_api_key"
-API_KEY = os.environ.get("HOTPEPPER_API_KEY")  # Replace with your actual API key if not using env var
+# Upstream calls go through utils.hotpepper_client, which reads the API key from the environment:
+#   export HOTPEPPER_API_KEY="your_api_key"
+# HOTPEPPER_CACHE_TTL (seconds, default 300) and HOTPEPPER_RATE (requests/second, default 5)
+# tune the response cache and the upstream rate limit.
 
-# Base URL for Hotpepper API
-BASE_URL = "http://webservice.recruit.co.jp/hotpepper"
+# Path to a local shop catalogue (e.g. meguro_shops.json, or a file written by catalog_query.py).
+# When set, searches it covers are answered from it instead of calling the Hotpepper API: searches
+# in one of its large areas, and searches without an area only when the catalogue is marked
+# complete (a "<catalogue>.complete" file, written by catalog_query.py for a full crawl).
+LOCAL_CATALOG_ENV = "HOTPEPPER_LOCAL_CATALOG"
+
+# A local catalogue older than this many seconds is stale: searches go to the API first and use
+# the local copy only if the API fails. 0 disables the check.
+LOCAL_MAX_AGE_ENV = "HOTPEPPER_LOCAL_MAX_AGE"
+DEFAULT_LOCAL_MAX_AGE = 7 * 24 * 3600
 
 # Define Pydantic models for data validation and documentation
 class Restaurant(BaseModel):
@@ -42,6 +69,91 @@ class RestaurantResponse(BaseModel):
     results_start: int
     restaurants: List[Restaurant]
 
+def format_results(data: dict) -> dict:
+    """Shape a gourmet API response like RestaurantResponse"""
+    return {
+        "results_available": data["results"]["results_available"],
+        "results_returned": data["results"]["results_returned"],
+        "results_start": data["results"]["results_start"],
+        "restaurants": data["results"]["shop"]  # 'shop' is the key for restaurants in the API response
+    }
+
+
+async def fetch_gourmet(params: dict, response: Response) -> dict:
+    """Call the gourmet API through the shared client (cached, coalesced and rate limited)"""
+    try:
+        data, headers = await get_hotpepper_client().get("gourmet/v1/", params)
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    response.headers.update(headers)
+    return format_results(data)
+
+
+def local_catalog():
+    """Shared local catalogue, or None when location searches should go to the API"""
+    path = os.environ.get(LOCAL_CATALOG_ENV)
+    return get_catalog(path) if path else None
+
+
+def local_is_stale(catalog) -> bool:
+    max_age = float(os.environ.get(LOCAL_MAX_AGE_ENV, DEFAULT_LOCAL_MAX_AGE))
+    return max_age > 0 and catalog.age_seconds() > max_age
+
+
+def paginate(shops: list, count: int, start: int) -> dict:
+    """Slice one page of local results (same shape as the API result)"""
+    page = shops[start - 1:start - 1 + count]
+    return {
+        "results_available": len(shops),
+        "results_returned": len(page),
+        "results_start": start,
+        "restaurants": [shop.to_dict() for shop in page]
+    }
+
+
+def search_local(catalog, keyword: Optional[str], area: Optional[str], genre: Optional[str],
+                 budget: Optional[str], count: int, start: int) -> dict:
+    """Keyword/area/genre/budget search over the local catalogue, in catalogue order"""
+    index = catalog.keywords()
+    table = index.table
+    rows = index.search(keyword) if keyword else range(len(table))
+    filters = [(field, code) for field, code in (("large_area", area), ("genre", genre), ("budget", budget)) if code]
+    rows = [row for row in rows if all(table.code(row, field) == code for field, code in filters)]
+    return paginate([table.record(row) for row in rows], count, start)
+
+
+def search_local_by_location(catalog, lat: float, lng: float, range: int, keyword: Optional[str],
+                             genre: Optional[str], count: int, start: int) -> dict:
+    """Radius search over the local catalogue, nearest first (same shape as the API result)"""
+    shops = [shop for shop, _ in catalog.nearby(lat, lng, range_to_meters(range))]
+    if genre:
+        shops = [shop for shop in shops if (shop.get("genre") or {}).get("code") == genre]
+    if keyword:
+        matched = set(catalog.keywords().search(keyword, rows=[shop.row for shop in shops]))
+        shops = [shop for shop in shops if shop.row in matched]
+    return paginate(shops, count, start)
+
+
+async def answer(response: Response, catalog, search_locally, params: dict, covered: bool = True) -> dict:
+    """Answer from the local catalogue when it is fresh and covers the query, otherwise from the API
+    (falling back to the stale local copy if the API fails)
+
+    Local searches run in a worker thread: after the catalogue file changes, the first search may
+    have to build its indexes, and that must not block the event loop.
+    """
+    if catalog is not None and covered and not local_is_stale(catalog):
+        response.headers["X-Source"] = "local"
+        return await asyncio.to_thread(search_locally)
+    try:
+        result = await fetch_gourmet(params, response)
+    except HTTPException:
+        if catalog is None or not covered:
+            raise
+        response.headers["X-Source"] = "local-stale"
+        return await asyncio.to_thread(search_locally)
+    response.headers["X-Source"] = "remote"
+    return result
+
 # Routes
 @app.get("/")
 async def root():
@@ -53,7 +165,8 @@ async def root():
         "available_endpoints": [
             "/api/health-check",
             "/api/restaurants/search",
-            "/api/restaurants/location"
+            "/api/restaurants/location",
+            "/api/metrics"
         ]
     }
 
@@ -63,39 +176,39 @@ async def health_check():
     Check if the API is functioning and if the API key is valid.
     """
     try:
-        # Test the API key with a simple request to large_area endpoint
-        url = f"{BASE_URL}/large_area/v1/"
-        params = {
-            "key": API_KEY,
-            "format": "json"
-        }
-        
-        response = requests.get(url, params=params)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if "results" in data and "large_area" in data["results"]:
-                return {
-                    "status": "ok",
-                    "message": "API key is valid",
-                    "areas_available": len(data["results"]["large_area"])
-                }
+        # Test the API key with a simple request to large_area endpoint (cached like other calls,
+        # so frequent health checks do not use up the upstream rate limit)
+        data, _ = await get_hotpepper_client().get("large_area/v1/", {})
+        if "results" in data and "large_area" in data["results"]:
+            return {
+                "status": "ok",
+                "message": "API key is valid",
+                "areas_available": len(data["results"]["large_area"])
+            }
         
         return {
             "status": "error",
             "message": "Invalid API key or API error",
-            "details": response.text
+            "details": data.get("results", {}).get("error")
         }
     
-    except Exception as e:
+    except UpstreamError as e:
         return {
             "status": "error",
             "message": "Failed to connect to Hotpepper API",
-            "details": str(e)
+            "details": e.detail
         }
 
+@app.get("/api/metrics")
+async def metrics():
+    """
+    Upstream cache, request coalescing and rate limiter statistics.
+    """
+    return {"hotpepper_client": get_hotpepper_client().get_stats()}
+
 @app.get("/api/restaurants/search", response_model=RestaurantResponse)
 async def search_restaurants(
+    response: Response,
     keyword: Optional[str] = None,
     area: Optional[str] = None,
     genre: Optional[str] = None,
@@ -114,12 +227,7 @@ async def search_restaurants(
     - **start**: Starting position of the results
     """
     try:
-        # Prepare the API request
-        url = f"{BASE_URL}/gourmet/v1/"
-        
         params = {
-            "key": API_KEY,
-            "format": "json",
             "count": count,
             "start": start
         }
@@ -134,23 +242,15 @@ async def search_restaurants(
         if budget:
             params["budget"] = budget
             
-        # Send the request to Hotpepper API
-        response = requests.get(url, params=params)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Error from Hotpepper API")
-            
-        data = response.json()
-        
-        # Format the response according to our model
-        result = {
-            "results_available": data["results"]["results_available"],
-            "results_returned": data["results"]["results_returned"],
-            "results_start": data["results"]["results_start"],
-            "restaurants": data["results"]["shop"]  # 'shop' is the key for restaurants in the API response
-        }
-        
-        return result
+        # Answer locally when possible; otherwise send the request to Hotpepper API
+        # (identical concurrent queries share one upstream call)
+        catalog = local_catalog()
+        covered = catalog is not None and (area in catalog.large_area_codes() if area else catalog.complete)
+        return await answer(
+            response, catalog,
+            lambda: search_local(catalog, keyword, area, genre, budget, count, max(1, start)),
+            params, covered
+        )
         
     except HTTPException:
         raise
@@ -159,6 +259,7 @@ async def search_restaurants(
 
 @app.get("/api/restaurants/location", response_model=RestaurantResponse)
 async def search_restaurants_by_location(
+    response: Response,
     lat: float = Query(..., description="Latitude"),
     lng: float = Query(..., description="Longitude"),
     range: int = Query(3, ge=1, le=5, description="Search radius (1: 300m, 2: 500m, 3: 1000m, 4: 2000m, 5: 3000m)"),
@@ -179,12 +280,7 @@ async def search_restaurants_by_location(
     - **start**: Starting position of the results
     """
     try:
-        # Prepare the API request
-        url = f"{BASE_URL}/gourmet/v1/"
-        
         params = {
-            "key": API_KEY,
-            "format": "json",
             "lat": lat,
             "lng": lng,
             "range": range,
@@ -198,23 +294,15 @@ async def search_restaurants_by_location(
         if genre:
             params["genre"] = genre
             
-        # Send the request to Hotpepper API
-        response = requests.get(url, params=params)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Error from Hotpepper API")
-            
-        data = response.json()
-        
-        # Format the response according to our model
-        result = {
-            "results_available": data["results"]["results_available"],
-            "results_returned": data["results"]["results_returned"],
-            "results_start": data["results"]["results_start"],
-            "restaurants": data["results"]["shop"]  # 'shop' is the key for restaurants in the API response
-        }
-        
-        return result
+        # Answer from the local catalogue when it has shops around the point (no network round trip);
+        # points outside the catalogue go to the API
+        catalog = local_catalog()
+        covered = catalog is not None and (await asyncio.to_thread(catalog.geo)).covers(lat, lng)
+        return await answer(
+            response, catalog,
+            lambda: search_local_by_location(catalog, lat, lng, range, keyword, genre, count, max(1, start)),
+            params, covered
+        )
         
     except HTTPException:
         raise
@@ -1,12 +1,16 @@
 import requests
+import asyncio
 import json
 import os
 import time
 from concurrent.futures import ThreadPoolExecutor
-import pandas as pd
 from tqdm import tqdm
 import logging
 
+from utils.file_operations import write_json_sync
+from utils.hotpepper_crawler import HOTPEPPER_BASE_URL, HotpepperCrawler
+from utils.shop_shards import ShopShards
+
 # ロギングの設定
 logging.basicConfig(
     level=logging.INFO,
@@ -20,17 +24,29 @@ logging.basicConfig(
 class HotpepperDataCollector:
     """ホットペッパーAPIを使用してデータを収集・保存するクラス"""
     
-    def __init__(self, api_key, output_dir='hotpepper_data'):
+    def __init__(self, api_key, output_dir='hotpepper_data', rate=None, max_concurrency=8,
+                 base_url=HOTPEPPER_BASE_URL, transport=None):
         """
         初期化
         
         Args:
             api_key (str): ホットペッパーAPIのAPIキー
             output_dir (str): データを保存するディレクトリ
+            rate (float): 店舗取得のリクエスト数の上限（回/秒、省略時は環境変数 HOTPEPPER_RATE か5）
+            max_concurrency (int): 店舗取得の同時リクエスト数
+            base_url (str): APIのURL（テスト用の偽サーバーを指定できる）
+            transport (httpx.AsyncBaseTransport): 店舗取得に使うHTTPトランスポート（テスト用）
         """
         self.api_key = api_key
-        self.base_url = "http://webservice.recruit.co.jp/hotpepper"
+        self.base_url = base_url
         self.output_dir = output_dir
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+        # エリア・ページごとの取得状況（途中で止まっても続きから取得できる）
+        self.checkpoint_path = os.path.join(output_dir, 'crawl_checkpoint.json')
+        # 取得した店舗はページごとにJSON Linesのシャードへ追記し、店舗IDで重複を除く
+        self.shards = ShopShards(os.path.join(output_dir, 'shards'))
         
         # 出力ディレクトリの作成
         os.makedirs(output_dir, exist_ok=True)
@@ -176,6 +192,38 @@ class HotpepperDataCollector:
             logging.error(f"店舗情報の取得に失敗: {area_type}={area_code}")
             return {'shops': [], 'results_available': 0, 'results_returned': 0, 'results_start': 0}
     
+    async def _save_page(self, area_code, area_type, start, shops):
+        """取得したページをすぐにシャードへ追記（再開時はチェックポイントに記録済みのページを飛ばす）"""
+        await asyncio.to_thread(self.shards.write_page, shops)
+
+    def crawl_areas(self, area_codes, area_type='large_area'):
+        """
+        複数エリアの店舗ページを、レート制限の範囲で並行して取得する
+        
+        Args:
+            area_codes (list): エリアコードのリスト
+            area_type (str): エリアタイプ (large_area, middle_area, small_area)
+            
+        Returns:
+            dict: エリアコード → 全ページ取得できたか
+        """
+        async def run():
+            crawler = HotpepperCrawler(
+                self.api_key, self.base_url, rate=self.rate, max_concurrency=self.max_concurrency,
+                checkpoint_path=self.checkpoint_path, transport=self.transport,
+            )
+            with tqdm(desc="pages", unit="page") as pbar:
+                async def on_page(area_code, area_type, start, shops):
+                    await self._save_page(area_code, area_type, start, shops)
+                    pbar.update(1)
+
+                async with crawler:
+                    completed = await crawler.crawl(area_codes, area_type, on_page)
+            logging.info(f"取得統計: {crawler.stats}")
+            return completed
+
+        return asyncio.run(run())
+
     def get_all_shops_by_area(self, area_code, area_type='large_area'):
         """
         エリアコードを指定して全店舗情報を取得
@@ -188,43 +236,24 @@ class HotpepperDataCollector:
             list: 全店舗情報のリスト
         """
         logging.info(f"エリア {area_code} の全店舗情報取得開始")
-        
-        all_shops = []
-        start = 1
-        count = 100  # APIの制限に合わせる
-        
-        # 最初のリクエスト
-        result = self.get_shops_by_area(area_code, area_type, start, count)
-        all_shops.extend(result['shops'])
-        
-        # 総店舗数
-        total_available = result['results_available']
-        logging.info(f"エリア {area_code} の総店舗数: {total_available}")
-        
-        # 残りの店舗を取得
-        with tqdm(total=total_available, initial=len(all_shops)) as pbar:
-            while len(all_shops) < total_available:
-                start += count
-                time.sleep(self.request_interval)  # API制限を考慮
-                
-                result = self.get_shops_by_area(area_code, area_type, start, count)
-                new_shops = result['shops']
-                all_shops.extend(new_shops)
-                
-                pbar.update(len(new_shops))
-                
-                if not new_shops:
-                    break
+        completed = self.crawl_areas([area_code], area_type)
+        file_path = self._save_area(area_code, area_type, completed.get(area_code, False))
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_area(self, area_code, area_type, completed):
+        """シャードからエリアの店舗だけをJSONファイルに書き出す"""
+        if not completed:
+            logging.warning(f"エリア {area_code} は一部のページを取得できていません（再実行で続きから取得します）")
         
         # 保存
         file_name = f"{area_type}_{area_code}_shops.json"
         file_path = os.path.join(self.output_dir, 'shops', file_name)
+        count = self.shards.export_json(
+            file_path, lambda shop: (shop.get(area_type) or {}).get('code') == area_code)
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(all_shops, f, ensure_ascii=False, indent=2)
-        
-        logging.info(f"エリア {area_code} の全店舗情報を保存: {file_path}")
-        return all_shops
+        logging.info(f"エリア {area_code} の全店舗情報を保存: {file_path} ({count}件)")
+        return file_path
     
     def get_shop_detail(self, shop_id):
         """
@@ -264,24 +293,23 @@ class HotpepperDataCollector:
         # ジャンル情報の取得
         genres = self.get_genres()
         
-        # エリアごとの店舗情報を取得
-        all_shops = []
-        
-        # 大エリアごとに店舗を取得
-        for area in large_areas:
-            area_code = area['code']
-            shops = self.get_all_shops_by_area(area_code, 'large_area')
-            all_shops.extend(shops)
-            time.sleep(self.request_interval)
+        # 大エリアの店舗ページをまとめて並行取得（ページごとにシャードへ追記される）
+        completed = self.crawl_areas([area['code'] for area in large_areas], 'large_area')
+        incomplete = [code for code, done in completed.items() if not done]
+        if incomplete:
+            logging.warning(f"一部のページを取得できていないエリア: {incomplete}（再実行で続きから取得します）")
+        # 全エリアを取り切ったときだけ全国分として記録する（エリア指定なしの検索をローカルで答えてよい）
+        if large_areas and not incomplete:
+            self.shards.mark_complete(completed)
+        else:
+            self.shards.clear_complete()
         
-        # 全店舗の詳細情報を取得（オプション）
-        # 注: 多数の店舗がある場合は時間がかかります
-        unique_shop_ids = set(shop['id'] for shop in all_shops)
-        logging.info(f"ユニーク店舗数: {len(unique_shop_ids)}")
+        shop_count = self.shards.count()
+        logging.info(f"ユニーク店舗数: {shop_count}")
         
-        # DataFrameに変換して保存
-        df_shops = pd.DataFrame(all_shops)
-        df_shops.to_csv(os.path.join(self.output_dir, 'all_shops.csv'), index=False)
+        # シャードから1件ずつ読んでCSVに書き出す
+        csv_path = os.path.join(self.output_dir, 'all_shops.csv')
+        self.shards.export_csv(csv_path)
         
         logging.info("全データ収集完了")
         return {
@@ -289,7 +317,9 @@ class HotpepperDataCollector:
             'middle_areas': middle_areas,
             'small_areas': small_areas,
             'genres': genres,
-            'shops': all_shops
+            'shop_count': shop_count,
+            'shards': [os.path.join(self.shards.directory, name) for name in self.shards.shard_names()],
+            'csv': csv_path,
         }
 
 
@@ -302,10 +332,10 @@ if __name__ == "__main__":
     collector = HotpepperDataCollector(API_KEY)
     
     # オプション1: 全データを収集
-    collector.collect_all_data()
+    result = collector.collect_all_data()
     
     # オプション2: 特定のエリアのみ収集
     # 東京エリア (Z011) の店舗を取得
     # shops = collector.get_all_shops_by_area('Z011', 'large_area')
     
-    print(f"取得した店舗数: {len(shops)}")
\ No newline at end of file
+    print(f"取得した店舗数: {result['shop_count']}")
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""ワーカー数ごとのスループットを測る負荷テスト
+
+gunicorn（gunicorn.conf.py）をワーカー数を変えて起動し、同じ負荷をかけて比較する。
+セッションごとにクッキーを分けるので、セッションストアをワーカー間で共有した状態で測れる。
+
+使い方:
+    python loadtest.py --workers 1 2 4                       # /api/chat（APIキーが必要）
+    python loadtest.py --workers 1 2 4 --path / --method GET # LLMを呼ばないページで比較
+    python loadtest.py --url http://localhost:5000           # 起動済みのサーバーに1回だけ負荷をかける
+"""
+import argparse, asyncio, os, statistics, subprocess, sys, time, uuid
+
+import httpx
+
+
+async def wait_until_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f"{url}/favicon.ico", timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server did not start within {timeout}s: {url}")
+
+
+async def run_load(url: str, path: str, method: str, requests: int, concurrency: int,
+                   sessions: int, message: str) -> dict:
+    """requests件をconcurrency並列で送り、スループットとレイテンシを返す"""
+    latencies, errors = [], 0
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            cookies = {"session_id": session_ids[i % len(session_ids)]}
+            start = time.perf_counter()
+            try:
+                if method == "GET":
+                    response = await client.get(path, cookies=cookies)
+                else:
+                    response = await client.post(path, json={"message": message}, cookies=cookies)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=300.0, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+    }
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "PORT": str(port)}
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "wsgi:app", "-c", "gunicorn.conf.py", "--access-logfile", "/dev/null"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def print_result(label: str, result: dict, baseline: float = 0.0) -> None:
+    scaling = f"  x{result['rps'] / baseline:.2f}" if baseline else ""
+    print(f"{label:>10}  {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.0f}ms  "
+          f"p95 {result['p95_ms']:7.0f}ms  errors {result['errors']}{scaling}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ワーカー数ごとのスループット比較")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--url", help="起動済みのサーバー（指定時はサーバーを起動しない）")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--path", default="/api/chat")
+    parser.add_argument("--method", default="POST", choices=["GET", "POST"])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=20, help="使うセッション（クッキー）の数")
+    parser.add_argument("--message", default="目黒でおすすめの和食のお店を教えて")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    load = dict(path=args.path, method=args.method, requests=args.requests, concurrency=args.concurrency,
+                sessions=args.sessions, message=args.message)
+
+    if args.url:
+        print_result("server", asyncio.run(run_load(args.url, **load)))
+        return
+
+    print(f"{args.method} {args.path}  requests={args.requests} concurrency={args.concurrency}")
+    baseline = 0.0
+    for workers in args.workers:
+        server = start_server(workers, args.port)
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            asyncio.run(wait_until_ready(url, args.startup_timeout))
+            result = asyncio.run(run_load(url, **load))
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or result["rps"]
+        print_result(f"{workers} worker{'s' if workers > 1 else ''}", result, baseline)
+
+
+if __name__ == "__main__":
+    main()
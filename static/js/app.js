@@ -108,54 +108,25 @@ document.addEventListener('DOMContentLoaded', function() {
         userInput.value = '';
         showTypingIndicator();
 
-        // Send to backend
-        fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({message: message}),
-        })
-        .then(response => response.json())
-        .then(data => {
-            removeTypingIndicator();
-            const botMessageElement = addMessage(data.response, false);
-            
-            if (data.image_urls && data.image_urls.length > 0) {
-                const imageDiv = document.createElement('div');
-                imageDiv.className = 'bot-message p-3 mb-4 ml-2';
-                const imageContainer = document.createElement('div');
-                imageContainer.className = 'flex flex-wrap gap-2 mt-2';
-
-                data.image_urls.forEach(url => {
-                    if (url) {
-                        const imgWrapper = document.createElement('div');
-                        imgWrapper.className = 'w-1/2 sm:w-1/3 md:w-1/4 p-1';
-
-                        const img = document.createElement('img');
-                        img.src = url;
-                        img.alt = "Restaurant image";
-                        img.className = "rounded-lg w-full h-32 object-cover shadow-md";
-
-                        imgWrapper.appendChild(img);
-                        imageContainer.appendChild(imgWrapper);
-                    }
-                });
-
-                imageDiv.appendChild(imageContainer);
-                imageDiv.innerHTML += `<p class="text-xs text-gray-500 mt-2">Restaurant images</p>`;
-                chatMessages.appendChild(imageDiv);
-            }
-            
-            const fallbackReplies = [
-                "Tell me more",
-                "What's the price range?",
-                "Any other recommendations?",
-                "How's the atmosphere?"
-            ];
-            
-            displayQuickReplies(data.quickReplies || fallbackReplies, botMessageElement);
-            chatMessages.scrollTop = chatMessages.scrollHeight;
+        // Send to backend (streamed; falls back to /api/chat if streaming is unavailable)
+        streamChat(message)
+        .catch(error => {
+            console.error('Streaming failed, falling back:', error);
+            return fetch('/api/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({message: message}),
+            })
+            .then(response => response.json())
+            .then(data => {
+                removeTypingIndicator();
+                const botMessageElement = addMessage(data.response, false);
+                displayImages(data.image_urls);
+                displayQuickReplies(data.quickReplies || fallbackReplies, botMessageElement);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            });
         })
         .catch(error => {
             console.error('Error:', error);
@@ -180,6 +151,150 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    const fallbackReplies = [
+        "Tell me more",
+        "What's the price range?",
+        "Any other recommendations?",
+        "How's the atmosphere?"
+    ];
+
+    function displayImages(imageUrls) {
+        if (!imageUrls || imageUrls.length === 0) return;
+
+        const imageDiv = document.createElement('div');
+        imageDiv.className = 'bot-message p-3 mb-4 ml-2';
+        const imageContainer = document.createElement('div');
+        imageContainer.className = 'flex flex-wrap gap-2 mt-2';
+
+        imageUrls.forEach(url => {
+            if (url) {
+                const imgWrapper = document.createElement('div');
+                imgWrapper.className = 'w-1/2 sm:w-1/3 md:w-1/4 p-1';
+
+                const img = document.createElement('img');
+                img.src = url;
+                img.alt = "Restaurant image";
+                img.className = "rounded-lg w-full h-32 object-cover shadow-md";
+
+                imgWrapper.appendChild(img);
+                imageContainer.appendChild(imgWrapper);
+            }
+        });
+
+        imageDiv.appendChild(imageContainer);
+        imageDiv.innerHTML += `<p class="text-xs text-gray-500 mt-2">Restaurant images</p>`;
+        chatMessages.appendChild(imageDiv);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    }
+
+    // Parse one Server-Sent Event block ("event: ...\ndata: ...")
+    function parseEvent(block) {
+        let event = 'message';
+        const data = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data.push(line.slice(5).trim());
+            }
+        });
+        return {event: event, data: data.length ? JSON.parse(data.join('\n')) : {}};
+    }
+
+    // POST to /api/chat/stream and render tokens as they arrive.
+    // Rejects only if the request fails before the first event arrives, so the caller can fall back
+    // to /api/chat. After that the turn has run on the server and must not be sent again.
+    async function streamChat(message) {
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({message: message}),
+        });
+        if (!response.ok || !response.body) {
+            throw new Error(`Streaming not available (${response.status})`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let botMessageElement = null;
+        let renderPending = false;
+        let started = false;
+        let failed = false;
+
+        // Re-render the markdown at most once per frame
+        function render() {
+            renderPending = false;
+            if (!botMessageElement) {
+                removeTypingIndicator();
+                botMessageElement = addMessage('', false);
+            }
+            botMessageElement.firstChild.innerHTML = parseMarkdown(text);
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+
+        function handleEvent({event, data}) {
+            if (event === 'token') {
+                text += data.text;
+                if (!renderPending) {
+                    renderPending = true;
+                    requestAnimationFrame(render);
+                }
+            } else if (event === 'reset') {
+                // The reply turned into a recommendation: replace the text streamed so far
+                text = '';
+                if (botMessageElement) {
+                    botMessageElement.remove();
+                    botMessageElement = null;
+                }
+                showTypingIndicator();
+            } else if (event === 'images') {
+                render();
+                displayImages(data.image_urls);
+            } else if (event === 'quick_replies') {
+                render();
+                displayQuickReplies(data.quickReplies || fallbackReplies, botMessageElement);
+            } else if (event === 'error') {
+                // Show the server's message instead of resending the turn
+                console.error('Stream error:', data.message);
+                text = data.message || 'Sorry, something went wrong. Please try again.';
+                failed = true;
+            }
+        }
+
+        try {
+            while (!failed) {
+                const {done, value} = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, {stream: true});
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    if (block.trim()) {
+                        started = true;
+                        handleEvent(parseEvent(block));
+                    }
+                }
+            }
+        } catch (error) {
+            // Once the server has started answering, keep what is on screen instead of resending
+            if (!started) throw error;
+            console.error('Stream interrupted:', error);
+        }
+        if (failed) {
+            reader.cancel().catch(() => {});
+        }
+        if (!text) {
+            // The stream ended without a reply: do not leave an empty bubble
+            text = 'Sorry, I could not generate a response. Please try again.';
+        }
+        render();
+    }
+
     function clearChat() {
         while (chatMessages.firstChild) {
             chatMessages.removeChild(chatMessages.firstChild);
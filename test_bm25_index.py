@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import development
+from utils.compact_catalog import CompactCatalog
+from utils.keyword_index import BM25Index, KeywordIndex, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture(scope="module")
+def shops():
+    with open("meguro_shops.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def index(shops):
+    return BM25Index(CompactCatalog(shops))
+
+
+def test_tokenize_folds_width_and_kana():
+    assert tokenize("ラーメン") == tokenize("らーめん") == ["らー", "ーめ", "めん"]
+    assert tokenize("ＢＡＲ・酒") == ["ba", "ar", "酒"]
+
+
+def test_exact_name_kana_and_station_rank_first(shops, index):
+    shop = shops[0]
+    assert index.search_ids(shop["name"], 1)[0][0] == shop["id"]
+    # 読み（ひらがな）はカタカナで入力しても一致する
+    kana = shop["name_kana"].split()[0]
+    assert index.search_ids(kana, 1)[0][0] == shop["id"]
+    katakana = "".join(chr(ord(c) + 0x60) if "ぁ" <= c <= "ゖ" else c for c in kana)
+    assert index.search_ids(katakana, 1)[0][0] == shop["id"]
+
+    # 駅名が一致する店舗が先に来る（名前の一部だけが重なる駅（西小山と武蔵小山）より先）
+    for station in ("不動前", "西小山"):
+        at_station = {s["id"] for s in shops if s["station_name"] == station}
+        assert {shop_id for shop_id, _ in index.search_ids(station, len(at_station))} == at_station
+
+
+def test_keyword_index_folds_kana_like_bm25(shops):
+    # /search のキーワード検索もカタカナで読み（ひらがな）に一致する
+    table = CompactCatalog(shops)
+    shop = shops[0]
+    katakana = "".join(chr(ord(c) + 0x60) if "ぁ" <= c <= "ゖ" else c for c in shop["name_kana"].split()[0])
+    assert 0 in KeywordIndex(table).search(katakana)
+
+
+def test_candidates_limit_results(shops, index):
+    candidates = [shop["id"] for shop in shops if shop["genre"]["code"] == "G013"]
+    results = index.search_ids("目黒 ラーメン 焼き鳥", 50, candidates)
+    assert results and {shop_id for shop_id, _ in results} <= set(candidates)
+    assert index.search_ids("ラーメン", 5, []) == []
+
+
+def test_reciprocal_rank_fusion_prefers_items_in_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]])
+    assert [item for item, _ in fused][:2] == ["a", "c"]
+
+
+class FakeVectorStore:
+    def __init__(self, ids, fail=False):
+        self.ids, self.fail = ids, fail
+
+    def search_restaurants(self, query, top_k=5, candidate_ids=None):
+        if self.fail:
+            raise RuntimeError("embedding API unavailable")
+        return [{"id": shop_id, "score": 0.9 - i * 0.01} for i, shop_id in enumerate(self.ids[:top_k])]
+
+
+def test_hybrid_search_fuses_vector_and_keyword_results(monkeypatch, shops):
+    tool = development.RestaurantSearchTool()
+    target = shops[0]
+    vector_ids = [shop["id"] for shop in shops[10:20]]
+    monkeypatch.setattr(development, "get_vector_store", lambda: FakeVectorStore(vector_ids))
+
+    results = tool.search_restaurants(target["name"], max_results=5, mode="hybrid")
+    # 店名の完全一致はベクトル検索に出てこなくても上位に入る
+    assert target["name"] in [r["name"] for r in results[:2]]
+    assert len(results) == 5 and results[0]["keyword_score"] is not None
+    assert [r["fusion_score"] for r in results] == sorted((r["fusion_score"] for r in results), reverse=True)
+
+    # 既定はベクトル検索のみで、score はこれまでどおりベクトル検索のスコア
+    vector_only = tool.search_restaurants(target["name"], max_results=3)
+    assert [r["name"] for r in vector_only] == [s["name"] for s in shops[10:13]]
+    assert [r["score"] for r in vector_only] == [0.9, 0.89, 0.88] and "fusion_score" not in vector_only[0]
+
+    monkeypatch.setattr(development, "get_vector_store", lambda: FakeVectorStore([], fail=True))
+    fallback = tool.search_restaurants(target["name"], max_results=3, mode="hybrid")
+    assert fallback[0]["name"] == target["name"]
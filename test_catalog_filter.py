@@ -0,0 +1,71 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from test_local_vector_store import FakeEmbeddingsAPI
+from utils.catalog_filter import CatalogFilter
+from utils.compact_catalog import CompactCatalog, is_yes
+from utils.embedding_cache import EmbeddingCache
+from utils.local_vector_store import LocalVectorStore
+
+
+@pytest.fixture(scope="module")
+def shops():
+    with open("meguro_shops.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def catalog_filter(shops):
+    return CatalogFilter(CompactCatalog(shops))
+
+
+def test_filters_by_genre_budget_and_facilities(catalog_filter, shops):
+    result = catalog_filter.candidates({
+        "location": "Meguro",
+        "cuisine_type": "イタリアン",
+        "budget_level": "中",
+        "english_menu_needed": "Yes",
+    })
+
+    expected = {
+        shop["id"] for shop in shops
+        if shop["genre"]["code"] == "G006" or shop.get("sub_genre", {}).get("code") == "G006"
+    }
+    expected &= {shop["id"] for shop in shops if shop["budget"]["code"] in ("B003", "B008", "B004")}
+    expected &= {shop["id"] for shop in shops if is_yes(shop["english"])}
+    assert result.applied == ["location", "cuisine", "budget", "english"]
+    assert set(result.ids) == expected
+
+
+def test_station_match_prefers_the_most_specific_name(catalog_filter, shops):
+    result = catalog_filter.candidates({"location": "中目黒"})
+
+    assert set(result.ids) == {shop["id"] for shop in shops if shop["station_name"] == "中目黒"}
+
+
+def test_relaxes_constraints_that_leave_no_candidates(catalog_filter):
+    result = catalog_filter.candidates({"location": "目黒", "cuisine_type": "ラーメン", "seating_preference": "個室"})
+
+    assert result.applied == ["location", "cuisine"]
+    assert result.relaxed == ["private_room"]
+    assert len(result.ids) == 5
+
+
+def test_unknown_preferences_do_not_filter(catalog_filter):
+    assert catalog_filter.candidates({"cuisine_type": "molecular gastronomy"}).ids is None
+    assert catalog_filter.candidates(None).ids is None
+
+
+def test_local_store_searches_only_candidates(tmp_path, monkeypatch, shops):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    store = LocalVectorStore(index_dir=str(tmp_path / "index"), embedding_cache=EmbeddingCache(path=""))
+    store.openai_client = SimpleNamespace(embeddings=FakeEmbeddingsAPI())
+    store.store_restaurants(shops[:40], batch_size=20)
+
+    candidates = [shops[2]["id"], shops[9]["id"], "missing"]
+    results = store.search_restaurants("居酒屋", top_k=5, candidate_ids=candidates)
+
+    assert {match["id"] for match in results} == {shops[2]["id"], shops[9]["id"]}
+    assert store.search_restaurants("居酒屋", top_k=5, candidate_ids=[]) == []
@@ -0,0 +1,83 @@
+import json
+
+import catalog_query
+from fake_hotpepper_server import fake_shop
+from utils.catalog_index import CatalogIndex
+from utils.shop_shards import ShopShards, catalog_is_complete
+
+
+def build_shards(directory):
+    with open("meguro_shops.json", "r", encoding="utf-8") as f:
+        meguro = json.load(f)
+    shards = ShopShards(directory, shard_size=100)
+    for start in range(0, len(meguro), 50):
+        shards.write_page(meguro[start:start + 50])
+    shards.write_page([fake_shop("Z011", i) for i in range(1, 101)])
+    return shards, meguro
+
+
+def test_query_matches_full_scan(tmp_path):
+    shards, meguro = build_shards(str(tmp_path / "shards"))
+    index = CatalogIndex(shards.directory)
+    assert index.refresh() == len(meguro) + 100
+    assert index.refresh() == 0
+
+    # コードでも名前でも同じ店舗が引ける
+    by_name = [shop["id"] for shop in index.query(small_area=["目黒"])]
+    assert by_name == [shop["id"] for shop in meguro if shop["small_area"]["name"] == "目黒"]
+    assert by_name == [shop["id"] for shop in index.query(small_area=[meguro[0]["small_area"]["code"]])]
+
+    # 項目間はAND、値はOR
+    genre = meguro[0]["genre"]["code"]
+    expected = [shop["id"] for shop in meguro if shop["genre"]["code"] == genre and shop["station_name"] == "目黒"]
+    assert [shop["id"] for shop in index.query(genre=[genre], station=["目黒"])] == expected
+    assert index.count(large_area=["Z011"]) == len(meguro) + 100
+
+
+def test_refresh_indexes_only_new_shops(tmp_path):
+    shards, meguro = build_shards(str(tmp_path / "shards"))
+    index = CatalogIndex(shards.directory)
+    index.refresh()
+    shards.write_page([fake_shop("Z099", i) for i in range(1, 11)])
+
+    assert index.refresh() == 10
+    assert index.count(large_area=["Z099"]) == 10
+    assert index.count(large_area=["Z011"]) == len(meguro) + 100
+
+
+def test_cli_writes_servable_catalogue(tmp_path):
+    shards, meguro = build_shards(str(tmp_path / "shards"))
+    output = str(tmp_path / "meguro.json")
+    assert catalog_query.main(["--shards", shards.directory, "query", "--small-area", "目黒", "-o", output]) == 0
+
+    with open(output, "r", encoding="utf-8") as f:
+        text = f.read()
+    expected = [shop for shop in meguro if shop["small_area"]["name"] == "目黒"]
+    assert json.loads(text) == expected
+    # 既存の meguro_shops.json と同じ書式
+    assert text == json.dumps(expected, ensure_ascii=False, indent=2) + "\n"
+
+    catalog_query.main(["--shards", shards.directory, "split", "--by", "large_area", "Z011", "Z099",
+                        "--output-dir", str(tmp_path / "catalogs"), "--indent", "0"])
+    with open(tmp_path / "catalogs" / "large_area_Z099.json", "r", encoding="utf-8") as f:
+        assert json.load(f) == []
+
+
+def test_full_crawl_export_is_marked_complete(tmp_path):
+    shards, _ = build_shards(str(tmp_path / "shards"))
+    index = CatalogIndex(shards.directory)
+    index.refresh()
+    catalog, meguro = str(tmp_path / "all.json"), str(tmp_path / "meguro.json")
+
+    # 全エリアを取り切ったクロールでなければ、全国分の目印は付けない
+    index.export(catalog)
+    assert not catalog_is_complete(catalog)
+
+    shards.mark_complete(["Z011"])
+    index.export(catalog)
+    index.export(meguro, small_area=["目黒"])
+    assert catalog_is_complete(catalog) and not catalog_is_complete(meguro)
+
+    shards.clear_complete()
+    index.export(catalog)
+    assert not catalog_is_complete(catalog)
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils.embedding_cache import EmbeddingCache
+from utils.local_vector_store import LocalVectorStore
+from utils.vector_store import EMBEDDING_MODEL
+
+
+class CountingEmbeddings:
+    """呼び出し回数を数えるOpenAIクライアントの代わり"""
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, input, model):
+        self.calls += 1
+        texts = input if isinstance(input, list) else [input]
+        data = [SimpleNamespace(embedding=[float(len(text)), 1.0, 0.5]) for text in texts]
+        return SimpleNamespace(data=data)
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path=path, max_memory_items=1)
+    cache.put(EMBEDDING_MODEL, "sushi", [0.25, 0.5])
+    cache.put(EMBEDDING_MODEL, "ramen", [0.75, 1.0])
+
+    # "sushi"はメモリから追い出されているのでディスクから読む
+    assert cache.get(EMBEDDING_MODEL, "ramen") == [0.75, 1.0]
+    assert cache.get(EMBEDDING_MODEL, "sushi") == [0.25, 0.5]
+    assert cache.get("other-model", "sushi") is None
+    assert cache.get_stats()["memory_hits"] == 1
+    assert cache.get_stats()["disk_hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+    cache.close()
+
+    # 再起動後も残っている
+    reopened = EmbeddingCache(path=path)
+    assert reopened.get(EMBEDDING_MODEL, "ramen") == [0.75, 1.0]
+    reopened.close()
+
+
+def test_repeated_query_skips_api(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    store = LocalVectorStore(index_dir=str(tmp_path / "index"), embedding_cache=EmbeddingCache(path=""))
+    embeddings = CountingEmbeddings()
+    store.openai_client = SimpleNamespace(embeddings=embeddings)
+
+    first = store.get_embedding("目黒 寿司 英語メニュー")
+    second = store.get_embedding("目黒 寿司 英語メニュー")
+
+    assert first == second
+    assert embeddings.calls == 1
+    assert store.embedding_cache.get_stats()["hit_rate"] == pytest.approx(0.5)
@@ -0,0 +1,118 @@
+import asyncio, json, multiprocessing, os
+
+import pytest
+
+import utils.file_operations as file_operations
+from utils.file_operations import clear_cache, get_cache_stats, load_json, save_json, update_json, write_json
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_callers_get_independent_copies(tmp_path):
+    path = str(tmp_path / "data.json")
+    run(save_json(path, {"messages": [1, 2]}))
+
+    first = run(load_json(path, {}))
+    first["messages"].append(3)
+    assert run(load_json(path, {})) == {"messages": [1, 2]}
+
+    # ファイルがないときのデフォルト値も呼び出し側ごとに別物
+    default = {"items": []}
+    missing = run(load_json(str(tmp_path / "missing.json"), default))
+    missing["items"].append("x")
+    assert default == {"items": []}
+
+    # 同じパスでも、呼び出しごとに渡した default を返す（最初の呼び出しの default を覚えない）
+    default["items"].append("changed")
+    assert run(load_json(str(tmp_path / "missing.json"), [])) == []
+    assert run(load_json(str(tmp_path / "missing.json"), default)) == {"items": ["changed"]}
+
+
+def test_external_write_invalidates_cache(tmp_path):
+    path = str(tmp_path / "data.json")
+    run(save_json(path, {"version": 1}))
+    assert run(load_json(path, {}))["version"] == 1
+
+    # 別のプロセスが書き換えた（更新日時・サイズが変わった）場合は読み直す
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": 22}, f)
+    os.utime(path, ns=(1, 1))
+    assert run(load_json(path, {}))["version"] == 22
+
+
+def test_concurrent_loads_read_once(tmp_path):
+    path = str(tmp_path / "data.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"shops": list(range(100))}, f)
+    clear_cache()
+    before = get_cache_stats()
+
+    async def load_many():
+        return await asyncio.gather(*[load_json(path, {}) for _ in range(10)])
+
+    results = run(load_many())
+    stats = get_cache_stats()
+    assert all(result == {"shops": list(range(100))} for result in results)
+    assert stats["misses"] - before["misses"] == 1
+    assert stats["coalesced"] - before["coalesced"] == 9
+
+
+def test_lru_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_operations, "CACHE_SIZE", 2)
+    clear_cache()
+    paths = [str(tmp_path / f"{i}.json") for i in range(3)]
+    for i, path in enumerate(paths):
+        run(save_json(path, {"i": i}))
+
+    assert get_cache_stats()["entries"] == 2
+    assert paths[0] not in file_operations._json_cache
+    assert run(load_json(paths[0], {})) == {"i": 0}
+
+
+def test_burst_of_writes_is_coalesced(tmp_path):
+    path = str(tmp_path / "state.json")
+    before = get_cache_stats()
+
+    async def burst():
+        await asyncio.gather(*[write_json(path, {"turn": i}) for i in range(20)])
+
+    run(burst())
+    stats = get_cache_stats()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == {"turn": 19}
+    assert stats["writes"] - before["writes"] < 20
+    assert (stats["writes"] - before["writes"]) + (stats["coalesced_writes"] - before["coalesced_writes"]) == 20
+    # 一時ファイルは残らない
+    assert sorted(os.listdir(tmp_path)) == ["state.json", "state.json.lock"]
+
+
+def _append_items(path, worker, count):
+    for i in range(count):
+        asyncio.run(update_json(path, [], lambda items: items.append(f"{worker}-{i}")))
+
+
+def test_update_json_across_processes(tmp_path):
+    path = str(tmp_path / "users.json")
+    processes = [multiprocessing.Process(target=_append_items, args=(path, worker, 25)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # 他のワーカーの更新を上書きで失わない
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)) == 100
+
+
+def test_failed_update_keeps_previous_file(tmp_path):
+    path = str(tmp_path / "users.json")
+    run(write_json(path, [{"username": "taro"}]))
+
+    def reject(users):
+        raise ValueError("既に存在するユーザーです")
+
+    with pytest.raises(ValueError):
+        run(update_json(path, [], reject))
+    assert run(load_json(path, [])) == [{"username": "taro"}]
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import hotpepper
+from utils.compact_catalog import CompactCatalog
+from utils.geo_index import GeoIndex, haversine_meters, range_to_meters
+
+MEGURO_STATION = (35.6336, 139.7157)
+
+
+@pytest.fixture(scope="module")
+def shops():
+    with open("meguro_shops.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def geo(shops):
+    return GeoIndex(CompactCatalog(shops))
+
+
+@pytest.mark.parametrize("search_range", [1, 2, 3, 5])
+def test_radius_search_matches_brute_force(geo, shops, search_range):
+    radius = range_to_meters(search_range)
+    # 同じ座標の店舗は行番号順
+    expected = sorted(
+        (haversine_meters(*MEGURO_STATION, shop["lat"], shop["lng"]), row, shop["id"]) for row, shop in enumerate(shops)
+    )
+    expected = [shop_id for distance, _, shop_id in expected if distance <= radius]
+
+    assert [shop_id for shop_id, _ in geo.nearby_ids(*MEGURO_STATION, radius)] == expected
+
+
+def test_station_search_is_sorted_and_limited(geo):
+    results = geo.near_station("中目黒駅", 500, limit=3)
+
+    assert 0 < len(results) <= 3
+    assert [distance for _, distance in results] == sorted(distance for _, distance in results)
+    assert geo.near_station("札幌", 500) == []
+
+
+def test_location_endpoint_uses_local_catalog(monkeypatch):
+    monkeypatch.setenv(hotpepper.LOCAL_CATALOG_ENV, "meguro_shops.json")
+    monkeypatch.setenv(hotpepper.LOCAL_MAX_AGE_ENV, "0")
+    monkeypatch.setattr(hotpepper, "get_hotpepper_client", lambda: pytest.fail("network call"))
+    client = TestClient(hotpepper.app)
+
+    response = client.get("/api/restaurants/location",
+                          params={"lat": MEGURO_STATION[0], "lng": MEGURO_STATION[1], "range": 1, "count": 5})
+
+    data = response.json()
+    assert response.status_code == 200
+    assert data["results_returned"] == 5 and data["results_available"] >= 5
+    distances = [haversine_meters(*MEGURO_STATION, shop["lat"], shop["lng"]) for shop in data["restaurants"]]
+    assert distances == sorted(distances) and max(distances) <= 300
+
+    response = client.get("/api/restaurants/location",
+                          params={"lat": MEGURO_STATION[0], "lng": MEGURO_STATION[1], "genre": "G013"})
+    assert {shop["genre"]["code"] for shop in response.json()["restaurants"]} == {"G013"}
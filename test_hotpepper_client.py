@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import hotpepper
+from fake_hotpepper_server import create_app
+from utils.hotpepper_client import HotpepperClient, UpstreamError
+
+
+def make_client(app, **options):
+    return HotpepperClient("test-key", "http://fake/hotpepper", transport=httpx.ASGITransport(app=app), **options)
+
+
+def test_identical_requests_share_one_upstream_call():
+    app = create_app({"Z011": 300}, latency=0.05)
+    client = make_client(app, ttl=60, rate=100)
+
+    async def run():
+        params = {"large_area": "Z011", "keyword": "焼き鳥", "count": 10, "start": 1}
+        results = await asyncio.gather(*(client.get("gourmet/v1/", params) for _ in range(10)))
+        # 空白やパラメータの順番が違っても同じ問い合わせとみなす
+        cached = await client.get("gourmet/v1/", {"start": 1, "count": 10, "keyword": " 焼き鳥 ", "large_area": "Z011"})
+        await client.aclose()
+        return results, cached
+
+    results, cached = asyncio.run(run())
+    assert app.state.stats["requests"] == 1
+    assert sorted(headers["X-Cache"] for _, headers in results) == ["COALESCED"] * 9 + ["MISS"]
+    assert cached[1]["X-Cache"] == "HIT" and cached[0] == results[0][0]
+    assert client.get_stats()["coalesced"] == 9 and client.get_stats()["hits"] == 1
+
+
+def test_rate_limited_upstream_is_retried_and_errors_are_not_cached():
+    app = create_app({"Z011": 300}, max_rps=2)
+    client = make_client(app, ttl=60, rate=100, max_retries=3)
+
+    async def run():
+        pages = await asyncio.gather(*(client.get("gourmet/v1/", {"large_area": "Z011", "start": start})
+                                       for start in (1, 11, 21)))
+        with pytest.raises(UpstreamError) as error:
+            await client.get("missing/v1/", {})
+        await client.aclose()
+        return pages, error.value
+
+    pages, error = asyncio.run(run())
+    assert [data["results"]["results_start"] for data, _ in pages] == [1, 11, 21]
+    assert app.state.stats["rate_limited"] >= 1 and client.get_stats()["retries"] >= 1
+    assert error.status_code == 404
+    assert client.get_stats()["entries"] == 3
+
+
+def test_error_body_with_status_200_is_not_cached():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(200, json={"results": {"error": [{"code": 1000, "message": "サーバ障害"}]}})
+        return httpx.Response(200, json={"results": {"results_available": 0, "shop": []}})
+
+    client = HotpepperClient("test-key", "http://fake/hotpepper", transport=httpx.MockTransport(handler), ttl=60, rate=100)
+
+    async def run():
+        with pytest.raises(UpstreamError) as error:
+            await client.get("gourmet/v1/", {"large_area": "Z011"})
+        data, headers = await client.get("gourmet/v1/", {"large_area": "Z011"})
+        await client.aclose()
+        return error.value, data, headers
+
+    error, data, headers = asyncio.run(run())
+    assert error.status_code == 502 and "サーバ障害" in error.detail
+    assert headers["X-Cache"] == "MISS" and data["results"]["results_available"] == 0 and len(calls) == 2
+
+
+def test_search_endpoint_sets_cache_headers(monkeypatch):
+    client = make_client(create_app({"Z011": 50}), ttl=60, rate=100)
+    monkeypatch.setattr(hotpepper, "get_hotpepper_client", lambda: client)
+
+    with TestClient(hotpepper.app) as http:
+        first = http.get("/api/restaurants/search", params={"area": "Z011", "count": 5})
+        second = http.get("/api/restaurants/search", params={"area": "Z011", "count": 5})
+        metrics = http.get("/api/metrics").json()["hotpepper_client"]
+
+    assert first.status_code == 200 and len(first.json()["restaurants"]) == 5
+    assert first.headers["X-Cache"] == "MISS" and second.headers["X-Cache"] == "HIT"
+    assert second.headers["Cache-Control"].startswith("public, max-age=")
+    assert metrics["hits"] == 1 and metrics["misses"] == 1 and metrics["upstream_requests"] == 1
@@ -0,0 +1,90 @@
+import asyncio, time
+
+import httpx
+
+from fake_hotpepper_server import create_app
+from utils.hotpepper_crawler import HotpepperCrawler
+from utils.rate_limit import TokenBucket
+
+
+def crawl(app, codes, **options):
+    pages = {}
+
+    def on_page(area_code, area_type, start, shops):
+        pages[(area_code, start)] = shops
+
+    async def run():
+        crawler = HotpepperCrawler("test-key", "http://fake/hotpepper", transport=httpx.ASGITransport(app=app),
+                                   backoff=0.01, **options)
+        async with crawler:
+            return await crawler.crawl(codes, on_page=on_page), crawler
+
+    completed, crawler = asyncio.run(run())
+    return completed, crawler, pages
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=50, capacity=5)
+        start = time.monotonic()
+        for _ in range(30):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 最初の5回はバースト、残り25回は50回/秒 → 約0.5秒
+    assert 0.4 <= asyncio.run(run()) < 1.5
+
+
+def test_crawls_all_pages_concurrently_with_retries(tmp_path):
+    app = create_app({"Z011": 950, "Z012": 120}, fail_pages={("Z011", 301)}, latency=0.02)
+    completed, crawler, pages = crawl(app, ["Z011", "Z012"], rate=1000, max_concurrency=6,
+                                      checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    assert completed == {"Z011": True, "Z012": True}
+    ids = [shop["id"] for key in sorted(pages) for shop in pages[key]]
+    assert len(ids) == len(set(ids)) == 1070
+    assert crawler.stats["retries"] == 1
+    # ページはエリアをまたいで並行に取得し、同時リクエスト数は上限を超えない
+    assert 1 < app.state.stats["max_in_flight"] <= 6
+
+
+def test_malformed_page_is_retried_then_left_incomplete(tmp_path):
+    app = create_app({"Z011": 300, "Z012": 300}, broken_pages={("Z011", 101), ("Z012", 201)})
+    completed, crawler, pages = crawl(app, ["Z011", "Z012"], rate=1000, checkpoint_path=str(tmp_path / "a.json"))
+    assert completed == {"Z011": True, "Z012": True} and crawler.stats["retries"] == 2
+
+    # リトライしても壊れていたページだけを取りこぼし、他のエリアは止めない
+    app = create_app({"Z011": 300, "Z012": 300}, broken_pages={("Z011", 101)})
+    completed, crawler, pages = crawl(app, ["Z011", "Z012"], rate=1000, max_retries=0,
+                                      checkpoint_path=str(tmp_path / "b.json"))
+    assert completed == {"Z011": False, "Z012": True}
+    assert ("Z011", 101) not in pages and ("Z011", 201) in pages and crawler.stats["failed_pages"] == 1
+
+
+def test_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    app = create_app({"Z011": 500}, fail_pages={("Z011", 201)})
+    # リトライなしだと1ページ取りこぼす
+    completed, _, pages = crawl(app, ["Z011"], rate=1000, max_retries=0, checkpoint_path=checkpoint)
+    assert completed == {"Z011": False}
+    assert (("Z011", 201)) not in pages
+
+    # 再実行では取りこぼしたページだけを取得する
+    app.state.stats["requests"] = 0
+    completed, _, pages = crawl(app, ["Z011"], rate=1000, checkpoint_path=checkpoint)
+    assert completed == {"Z011": True}
+    assert list(pages) == [("Z011", 201)]
+    assert app.state.stats["requests"] == 1
+
+    # 完了したエリアは取得しない
+    completed, _, pages = crawl(app, ["Z011"], rate=1000, checkpoint_path=checkpoint)
+    assert completed == {"Z011": True} and pages == {}
+
+
+def test_backs_off_when_rate_limited(tmp_path):
+    app = create_app({"Z011": 600}, max_rps=4)
+    completed, crawler, pages = crawl(app, ["Z011"], rate=20, burst=6, max_retries=8)
+
+    assert completed == {"Z011": True}
+    assert sum(len(shops) for shops in pages.values()) == 600
+    assert app.state.stats["rate_limited"] >= 1
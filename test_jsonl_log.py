@@ -0,0 +1,76 @@
+import asyncio, json
+
+from utils.chatroom_manager import ChatroomManager
+from utils.file_operations import get_last_conversation
+from utils.jsonl_log import JsonlLog
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_tail_reads_last_entries_across_blocks(tmp_path):
+    log = JsonlLog(str(tmp_path / "chat.jsonl"), fsync="never")
+    # 1行が長いので末尾5件でも複数ブロックにまたがる
+    run(log.append_many([{"i": i, "text": "寿司" * 2000} for i in range(20)]))
+
+    assert [entry["i"] for entry in run(log.tail(5))] == [15, 16, 17, 18, 19]
+    assert len(run(log.tail(100))) == 20
+    assert len(run(log.read_all())) == 20
+
+
+def test_torn_line_is_skipped_and_compaction_keeps_latest(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    log = JsonlLog(str(path), fsync="always", max_entries=3, compact_every=100)
+    for i in range(5):
+        run(log.append({"i": i}))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"i": 5, "tex')
+
+    assert [entry["i"] for entry in run(log.tail(2))] == [3, 4]
+    run(log.compact())
+    assert [json.loads(line)["i"] for line in path.read_text(encoding="utf-8").splitlines()] == [2, 3, 4]
+
+
+def test_append_after_torn_line_is_kept(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    log = JsonlLog(str(path), fsync="never")
+    run(log.append({"i": 0}))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"i": 1, "tex')
+
+    run(log.append({"i": 2}))
+    assert [entry["i"] for entry in run(log.read_all())] == [0, 2]
+    assert [entry["i"] for entry in run(log.tail(1))] == [2]
+
+
+def test_last_conversation_from_log(tmp_path):
+    log = JsonlLog(str(tmp_path / "chat.jsonl"), fsync="never")
+    messages = [{"role": "user", "content": "q1"}, {"role": "assistant", "content": "a1"}]
+    messages += [{"role": "user", "content": f"q{i}"} for i in range(2, 30)]
+    run(log.append_many(messages))
+
+    # 直近のやり取りが末尾の数件にない場合も、読む範囲を広げて見つける
+    pair = run(get_last_conversation(log))
+    assert pair["user"]["content"] == "q1"
+    assert pair["assistant"]["content"] == "a1"
+
+
+def test_chatroom_manager_appends_and_migrates(tmp_path):
+    data_dir = str(tmp_path)
+    manager = ChatroomManager(data_dir=data_dir)
+    run(manager.add_messages("u1", {"role": "user", "content": "hi"}))
+    run(manager.add_messages("u1", {"role": "assistant", "content": "hello"}))
+    assert run(manager.get_last_conversation_pair("u1"))["assistant"]["content"] == "hello"
+    assert (tmp_path / "chat_log_u1.jsonl").exists()
+
+    # クリアすると会話ログ・要約・履歴が空になる
+    run(manager.update_user_messages("u1", {"user": "hi", "assistant": "hello"}))
+    assert run(manager.clear_chat_data("u1")) is True
+    assert run(manager.get_chat_data("u1")) == ([], [], {})
+
+    # 以前のJSON配列の履歴は初回アクセス時に取り込まれる
+    legacy = tmp_path / "chat_log_u2.json"
+    legacy.write_text(json.dumps([{"role": "user", "content": "old"}]), encoding="utf-8")
+    chatroom = {"files": {"chat_log": str(legacy)}}
+    assert run(manager.chat_log(chatroom).read_all()) == [{"role": "user", "content": "old"}]
@@ -0,0 +1,56 @@
+import asyncio
+
+import httpx
+import pytest
+
+from utils.llm_clients import LLMClientRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    for name in ("OPENAI_API_KEY", "OPENROUTER_API_KEY", "ANTHROPIC_API_KEY"):
+        monkeypatch.setenv(name, "test")
+    return LLMClientRegistry()
+
+
+def test_clients_share_one_pool_per_provider_and_loop(registry):
+    async def get_clients():
+        return registry.openai(), registry.openai(), registry.openrouter(), registry.async_http("openai")
+
+    first, again, openrouter, http_client = asyncio.run(get_clients())
+    assert first is again
+    assert first._client is http_client
+    assert openrouter is not first and str(openrouter.base_url).startswith("https://openrouter.ai")
+
+    # 別のイベントループでは接続を使い回せないので、プールを作り直す
+    second, *_ = asyncio.run(get_clients())
+    assert second is not first
+    assert registry.get_stats()["providers"]["openai"]["pools_created"] == 2
+    # 作り直す前のプールは閉じている
+    assert first._client.is_closed
+
+
+def test_requests_are_metered(registry):
+    def handler(request):
+        return httpx.Response(500 if request.url.path == "/fail" else 200, json={})
+
+    async def send():
+        client = registry.async_http("openrouter")
+        client._transport.inner = httpx.MockTransport(handler)
+        await client.get("https://example.test/ok")
+        await client.get("https://example.test/fail")
+
+    asyncio.run(send())
+    stats = registry.get_stats()["providers"]["openrouter"]
+    assert stats["requests"] == 2 and stats["errors"] == 1 and stats["in_flight"] == 0
+
+
+def test_aclose_closes_pools(registry):
+    async def run():
+        client = registry.async_http("anthropic")
+        sync_client = registry.sync_http("openai")
+        await registry.aclose()
+        return client, sync_client
+
+    client, sync_client = asyncio.run(run())
+    assert client.is_closed and sync_client.is_closed
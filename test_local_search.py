@@ -0,0 +1,92 @@
+import json, os, time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import hotpepper
+from fake_hotpepper_server import create_app
+from utils.compact_catalog import CompactCatalog
+from utils.hotpepper_client import HotpepperClient
+from utils.keyword_index import KeywordIndex, normalize
+from utils.shop_shards import set_catalog_complete
+
+
+@pytest.fixture(scope="module")
+def shops():
+    with open("meguro_shops.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def text_of(shop):
+    genre = shop.get("genre") or {}
+    return normalize(" ".join(str(shop.get(field) or "") for field in ("name", "name_kana", "catch", "address", "station_name"))
+                     + " " + (genre.get("name") or "") + " " + (genre.get("catch") or ""))
+
+
+@pytest.mark.parametrize("keyword", ["焼き鳥", "目黒 ラーメン", "カフェ", "鮨", "ＢＡＲ", "存在しない店名"])
+def test_keyword_index_matches_substring_scan(shops, keyword):
+    index = KeywordIndex(CompactCatalog(shops))
+    words = normalize(keyword).split()
+    expected = [row for row, shop in enumerate(shops) if all(word in text_of(shop) for word in words)]
+    assert index.search(keyword) == expected
+
+
+@pytest.fixture
+def local_app(monkeypatch, tmp_path, shops):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(shops, ensure_ascii=False), encoding="utf-8")
+    set_catalog_complete(str(path), True)
+    upstream = create_app({"Z011": 30, "Z012": 30})
+    monkeypatch.setenv(hotpepper.LOCAL_CATALOG_ENV, str(path))
+    monkeypatch.setenv(hotpepper.LOCAL_MAX_AGE_ENV, "3600")
+    monkeypatch.setattr(hotpepper, "get_hotpepper_client", lambda: HotpepperClient(
+        "test-key", "http://fake/hotpepper", transport=httpx.ASGITransport(app=upstream), ttl=0, rate=100))
+    return path, upstream
+
+
+def test_search_is_answered_locally_with_pagination(local_app, shops):
+    _, upstream = local_app
+    with TestClient(hotpepper.app) as client:
+        first = client.get("/api/restaurants/search", params={"keyword": "目黒", "area": "Z011", "count": 5})
+        second = client.get("/api/restaurants/search", params={"keyword": "目黒", "area": "Z011", "count": 5, "start": 6})
+        genre = client.get("/api/restaurants/search", params={"genre": "G013", "count": 100})
+
+    assert first.headers["X-Source"] == "local" and upstream.state.stats["requests"] == 0
+    data = first.json()
+    expected = [shop["id"] for shop in shops if "目黒" in text_of(shop)]
+    assert data["results_available"] == len(expected) and data["results_returned"] == 5
+    assert [shop["id"] for shop in data["restaurants"] + second.json()["restaurants"]] == expected[:10]
+    assert {shop["genre"]["code"] for shop in genre.json()["restaurants"]} == {"G013"}
+
+
+def test_uncovered_or_stale_queries_use_the_api(local_app, monkeypatch):
+    path, upstream = local_app
+    with TestClient(hotpepper.app) as client:
+        # カタログにない大エリアはAPIに問い合わせる
+        other_area = client.get("/api/restaurants/search", params={"area": "Z012"})
+        assert other_area.headers["X-Source"] == "remote" and other_area.json()["results_available"] == 30
+        # 全国分の目印がないカタログでは、エリアを指定しない検索もAPIに問い合わせる
+        set_catalog_complete(str(path), False)
+        hotpepper.local_catalog().reload()
+        nationwide = client.get("/api/restaurants/search", params={"keyword": "ラーメン"})
+        assert nationwide.headers["X-Source"] == "remote"
+        set_catalog_complete(str(path), True)
+        hotpepper.local_catalog().reload()
+
+        # カタログの範囲外の地点もAPIに問い合わせる
+        osaka = client.get("/api/restaurants/location", params={"lat": 34.6937, "lng": 135.5023})
+        assert osaka.headers["X-Source"] == "remote"
+
+        # 古いカタログはAPIを優先し、APIが失敗したらローカルで答える
+        old = time.time() - 7200
+        os.utime(path, (old, old))
+        hotpepper.local_catalog().reload()
+        stale = client.get("/api/restaurants/search", params={"keyword": "ラーメン"})
+        assert stale.headers["X-Source"] == "remote"
+
+    monkeypatch.setattr(hotpepper, "get_hotpepper_client",
+                        lambda: HotpepperClient("k", "http://127.0.0.1:9", ttl=0, rate=100, max_retries=0))
+    with TestClient(hotpepper.app) as client:
+        fallback = client.get("/api/restaurants/search", params={"keyword": "ラーメン"})
+    assert fallback.headers["X-Source"] == "local-stale" and fallback.json()["results_available"] > 0
@@ -0,0 +1,180 @@
+import json
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from utils.embedding_cache import EmbeddingCache
+from utils.local_vector_store import LocalVectorStore
+from utils.vector_store import EMBEDDING_DIMENSION, BaseVectorStore, build_restaurant_text
+
+
+def fake_embedding(text):
+    """文字ごとのハッシュで作る決定的な埋め込み（APIを呼ばずにテストするため）"""
+    vector = np.zeros(EMBEDDING_DIMENSION, dtype=np.float32)
+    for char in text:
+        vector[zlib.crc32(char.encode("utf-8")) % EMBEDDING_DIMENSION] += 1.0
+    return vector.tolist()
+
+
+class FakeEmbeddingStore(LocalVectorStore):
+    def get_embedding(self, text):
+        return fake_embedding(text)
+
+
+@pytest.fixture
+def shops():
+    with open("meguro_shops.json", "r", encoding="utf-8") as f:
+        return json.load(f)[:40]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return FakeEmbeddingStore(index_dir=str(tmp_path / "index"), embedding_cache=EmbeddingCache(path=""))
+
+
+def test_search_returns_best_match_first(store, shops):
+    for shop in shops:
+        store.store_restaurant(shop["id"], shop, "")
+
+    target = shops[7]
+    results = store.search_restaurants(build_restaurant_text(target), top_k=5)
+
+    assert len(results) == 5
+    assert results[0]["id"] == target["id"]
+    assert results[0].metadata["name"] == target["name"]
+    assert results[0].score == pytest.approx(1.0, abs=1e-5)
+    assert [r.score for r in results] == sorted((r.score for r in results), reverse=True)
+
+
+def test_upsert_replaces_existing_row(store, shops):
+    store.store_restaurant(shops[0]["id"], shops[0], "")
+    store.store_restaurant(shops[0]["id"], dict(shops[0], name="renamed"), "")
+
+    assert len(store) == 1
+    assert store.search_restaurants("renamed", top_k=1)[0].metadata["name"] == "renamed"
+
+
+def test_upsert_does_not_modify_rows_a_query_is_reading(store, shops):
+    store.store_restaurant(shops[0]["id"], shops[0], "")
+    snapshot = store._buffer[:1]
+    before = snapshot.copy()
+    store.store_restaurant(shops[0]["id"], dict(shops[0], name="renamed"), "")
+
+    # 検索がロック外で使う参照の行は書き換わらない（コピーに書いてから差し替える）
+    assert np.array_equal(snapshot, before)
+    assert not np.array_equal(store._buffer[:1], before)
+
+
+def test_index_is_reloaded_from_disk(store, shops, monkeypatch):
+    for shop in shops:
+        store.store_restaurant(shop["id"], shop, "")
+
+    reloaded = FakeEmbeddingStore(index_dir=store.index_dir, embedding_cache=store.embedding_cache)
+
+    assert isinstance(reloaded.matrix, np.memmap)
+    assert reloaded.ids == store.ids
+    query = build_restaurant_text(shops[3])
+    assert reloaded.search_restaurants(query, 3)[0]["id"] == shops[3]["id"]
+
+
+def test_ivf_search_finds_exact_match(store, shops):
+    for shop in shops:
+        store.store_restaurant(shop["id"], shop, "")
+    store.build_ivf(nlist=4)
+    store.nprobe = 2
+
+    for shop in shops[:10]:
+        assert store.search_restaurants(build_restaurant_text(shop), 1)[0]["id"] == shop["id"]
+
+
+class FakeEmbeddingsAPI:
+    """埋め込みAPIの代わり（リクエスト数を数え、指定回数目で失敗させられる）"""
+    def __init__(self, fail_on_call=None):
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def create(self, input, model):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("simulated API failure")
+        texts = input if isinstance(input, list) else [input]
+        return SimpleNamespace(data=[SimpleNamespace(embedding=fake_embedding(text)) for text in texts])
+
+
+@pytest.fixture
+def bulk_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return LocalVectorStore(index_dir=str(tmp_path / "index"), embedding_cache=EmbeddingCache(path=""))
+
+
+def test_store_restaurants_batches_requests(bulk_store, shops):
+    api = FakeEmbeddingsAPI()
+    bulk_store.openai_client = SimpleNamespace(embeddings=api)
+
+    report = bulk_store.store_restaurants(iter(shops), batch_size=8, max_concurrency=2)
+
+    assert report["stored"] == len(shops)
+    assert api.calls == 5
+    assert len(bulk_store) == len(shops)
+    top = bulk_store.search_restaurants(build_restaurant_text(shops[12]), 1)[0]
+    assert top["id"] == shops[12]["id"]
+
+
+def test_store_restaurants_resumes_from_checkpoint(bulk_store, shops, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.txt")
+    bulk_store.openai_client = SimpleNamespace(embeddings=FakeEmbeddingsAPI(fail_on_call=3))
+
+    with pytest.raises(RuntimeError):
+        bulk_store.store_restaurants(shops, batch_size=10, max_concurrency=1, checkpoint_path=checkpoint, checkpoint_every=1)
+
+    # 失敗前の2バッチだけがチェックポイントに残る
+    with open(checkpoint, encoding="utf-8") as f:
+        assert len(f.read().split()) == 20
+
+    api = FakeEmbeddingsAPI()
+    bulk_store.openai_client = SimpleNamespace(embeddings=api)
+    report = bulk_store.store_restaurants(shops, batch_size=10, max_concurrency=1, checkpoint_path=checkpoint)
+
+    assert report == dict(report, stored=20, skipped=20)
+    assert api.calls == 2
+    assert len(LocalVectorStore(index_dir=bulk_store.index_dir, embedding_cache=EmbeddingCache(path=""))) == len(shops)
+
+
+def test_reindex_only_embeds_changed_shops(bulk_store, shops):
+    api = FakeEmbeddingsAPI()
+    bulk_store.openai_client = SimpleNamespace(embeddings=api)
+    bulk_store.embedding_cache = EmbeddingCache(path="", max_memory_items=0)
+
+    first = bulk_store.reindex_restaurants(shops, batch_size=10)
+    assert first["stored"] == len(shops)
+    assert api.calls == 4
+
+    updated = [dict(shop) for shop in shops[1:]]
+    updated[0]["name"] = "リニューアル店"
+    second = bulk_store.reindex_restaurants(updated, batch_size=10)
+
+    assert second["stored"] == 1
+    assert second["removed"] == 1
+    assert second["unchanged"] == len(updated) - 1
+    assert api.calls == 5
+    assert shops[0]["id"] not in bulk_store.row_by_id
+    assert bulk_store.search_restaurants(build_restaurant_text(updated[0]), 1)[0].metadata["name"] == "リニューアル店"
+
+    calls = api.calls
+    assert bulk_store.reindex_restaurants(updated, batch_size=10)["stored"] == 0
+    assert api.calls == calls
+
+
+def test_incomplete_store_fails_on_creation():
+    class NoDelete(BaseVectorStore):
+        def _upsert(self, vectors):
+            pass
+
+        def _query(self, vector, top_k, candidate_ids=None):
+            return []
+
+    with pytest.raises(TypeError):
+        NoDelete(embedding_cache=EmbeddingCache(path=""))
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from utils.response_cache import ResponseCache, estimate_cost
+
+PREFERENCES = {"location": "Meguro", "cuisine_type": "sushi", "english_menu_needed": "Yes",
+               "last_updated": "2025-05-06T10:49:37"}
+SHOPS = ["J001", "J002", "J003"]
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(ttl_seconds=60, max_entries=3, similarity_threshold=0.95, enabled=True)
+
+
+def test_exact_hit_ignores_whitespace_case_and_timestamp(cache):
+    cache.put("Sushi in Meguro,  English menu", PREFERENCES, SHOPS, "answer",
+              prompt_tokens=1000, completion_tokens=500)
+
+    later = dict(PREFERENCES, last_updated="2025-05-07T09:00:00")
+    assert cache.get(" sushi in meguro, english MENU ", later, SHOPS) == "answer"
+    assert cache.get("Sushi in Meguro, English menu", PREFERENCES, ["J003", "J002", "J001"]) is None
+
+    stats = cache.get_stats()
+    assert stats["exact_hits"] == 1 and stats["misses"] == 1
+    assert stats["saved_tokens"] == 1500
+    assert stats["saved_usd"] == pytest.approx(estimate_cost("gpt-4.1", 1000, 500))
+
+
+def test_semantic_hit_needs_same_context_and_close_embedding(cache):
+    cache.put("sushi in meguro with english menu", PREFERENCES, SHOPS, "answer", embedding=[1.0, 0.0, 0.0])
+
+    near, far = [0.99, 0.05, 0.0], [0.6, 0.8, 0.0]
+    assert cache.get("english-menu sushi near meguro", PREFERENCES, SHOPS, embedding=near) == "answer"
+    assert cache.get("english-menu sushi near meguro", PREFERENCES, SHOPS, embedding=far) is None
+    assert cache.get("english-menu sushi near meguro", PREFERENCES, ["J009"], embedding=near) is None
+    assert cache.get_stats()["semantic_hits"] == 1
+
+
+def test_entries_expire_and_are_evicted_lru(cache):
+    for i in range(3):
+        cache.put(f"summary {i}", PREFERENCES, SHOPS, f"answer {i}")
+    cache.get("summary 0", PREFERENCES, SHOPS)
+    cache.put("summary 3", PREFERENCES, SHOPS, "answer 3")
+
+    assert cache.get("summary 1", PREFERENCES, SHOPS) is None
+    assert cache.get("summary 0", PREFERENCES, SHOPS) == "answer 0"
+    assert cache.get_stats()["evictions"] == 1
+
+    cache.ttl_seconds = 0.01
+    time.sleep(0.02)
+    assert cache.get("summary 0", PREFERENCES, SHOPS) is None
+
+
+def test_bypass_skips_lookup_and_store(cache):
+    cache.put("summary", PREFERENCES, SHOPS, "answer", bypass=True)
+    assert cache.get("summary", PREFERENCES, SHOPS) is None
+
+    cache.put("summary", PREFERENCES, SHOPS, "answer")
+    assert cache.get("summary", PREFERENCES, SHOPS, bypass=True) is None
+    assert cache.get_stats()["bypassed"] == 1
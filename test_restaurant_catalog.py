@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+from utils.compact_catalog import CompactCatalog
+from utils.restaurant_catalog import RestaurantCatalog, get_catalog
+
+
+def write_catalog(path, shops):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(shops, f, ensure_ascii=False)
+
+
+def test_lookup_by_id_keeps_requested_order():
+    catalog = get_catalog("meguro_shops.json")
+    shops = catalog.all()
+
+    assert get_catalog(os.path.abspath("meguro_shops.json")) is catalog
+    assert catalog.get(shops[5]["id"]).to_dict() == shops[5].to_dict()
+    assert catalog.get("missing") is None
+    ids = [shops[3]["id"], "missing", shops[1]["id"]]
+    assert [shop["id"] for shop in catalog.get_many(ids)] == [shops[3]["id"], shops[1]["id"]]
+
+
+def test_reloads_in_background_when_file_changes(tmp_path):
+    path = str(tmp_path / "shops.json")
+    write_catalog(path, [{"id": "A", "name": "old"}])
+    catalog = RestaurantCatalog(path, check_interval=0)
+    catalog.filter()
+
+    write_catalog(path, [{"id": "A", "name": "new"}, {"id": "B", "name": "added"}])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    # 読み直しが終わるまでは古いデータを返す
+    assert catalog.get("A")["name"] in ("old", "new")
+    deadline = time.time() + 5
+    while (catalog.get("B") is None or catalog._filter.table is not catalog.table) and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert catalog.get("A")["name"] == "new"
+    assert len(catalog) == 2
+    # 使われていたインデックスは読み直しのスレッドで作り直されている
+    assert catalog._filter.table is catalog.table
+
+
+def test_compact_records_round_trip_original_shops():
+    with open("meguro_shops.json", "r", encoding="utf-8") as f:
+        shops = json.load(f)
+    table = CompactCatalog(shops)
+
+    assert len(table) == len(shops)
+    for shop, record in zip(shops, table):
+        assert record.to_dict() == shop
+        assert list(record) == list(shop)
+
+
+def test_compact_records_keep_irregular_values():
+    shops = [
+        {"id": "A", "name": "x"},
+        {"id": "B", "genre": {"name": "no code", "catch": "c"}, "lat": "", "capacity": "30"},
+        {"id": "C", "genre": {"code": "G001", "name": "居酒屋", "catch": "c"}, "wifi": "あり", "capacity": 12},
+    ]
+    table = CompactCatalog(shops)
+
+    assert [record.to_dict() for record in table] == shops
+    record = table.get("C")
+    assert record.flag("wifi") and not table.get("A").flag("wifi")
+    assert table.code(record.row, "genre") == "G001"
+    assert "lat" not in table.get("A") and table.get("A").get("lat", "-") == "-"
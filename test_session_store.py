@@ -0,0 +1,61 @@
+import asyncio
+
+from utils.session_store import SQLiteSessionStore, wait_for_updates
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_messages_are_appended_per_session(tmp_path):
+    store = SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite3"))
+    run(store.append_messages("alice", [{"role": "user", "content": f"a{i}"} for i in range(5)]))
+    run(store.append_messages("bob", [{"role": "user", "content": "b0"}]))
+
+    # 末尾だけを古い順に返し、他のセッションの行は混ざらない
+    assert [m["content"] for m in run(store.recent_messages("alice", limit=2))] == ["a3", "a4"]
+    assert [m["content"] for m in run(store.recent_messages("bob"))] == ["b0"]
+    assert run(store.recent_messages("carol")) == []
+
+
+def test_rallies_keep_latest(tmp_path):
+    store = SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite3"))
+    for i in range(5):
+        run(store.add_rally("alice", {"turn": i}, keep=3))
+    run(store.add_rally("bob", {"turn": 0}, keep=3))
+
+    assert run(store.rallies("alice")) == [{"turn": 2}, {"turn": 3}, {"turn": 4}]
+    assert run(store.rallies("bob")) == [{"turn": 0}]
+
+
+def test_state_survives_reopen_and_clear(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path=path)
+    run(store.set_summary("alice", [{"role": "developer", "content": "寿司が好き"}]))
+    run(store.set_preferences("alice", {"cuisine_type": "和食"}))
+    run(store.set_preferences("bob", {"cuisine_type": "ラーメン"}))
+    run(store.close())
+
+    reopened = SQLiteSessionStore(path=path)
+    assert run(reopened.summary("alice"))[0]["content"] == "寿司が好き"
+    assert run(reopened.preferences("alice")) == {"cuisine_type": "和食"}
+    assert reopened.get_stats()["sessions"] == 2
+
+    run(reopened.clear("alice"))
+    assert run(reopened.summary("alice")) == []
+    assert run(reopened.preferences("alice")) is None
+    assert run(reopened.preferences("bob")) == {"cuisine_type": "ラーメン"}
+
+
+def test_pending_updates_are_visible_to_other_workers(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    worker_a, worker_b = SQLiteSessionStore(path=path), SQLiteSessionStore(path=path)
+    run(worker_a.begin_update("alice"))
+
+    # 別のワーカー（別の接続）からも更新中であることが分かる
+    assert run(worker_b.pending_updates("alice")) == 1
+    assert run(wait_for_updates(worker_b, "alice", timeout=0.1)) is False
+    assert run(wait_for_updates(worker_b, "bob", timeout=0.1)) is True
+
+    run(worker_a.end_update("alice"))
+    assert run(wait_for_updates(worker_b, "alice", timeout=0.1)) is True
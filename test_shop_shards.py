@@ -0,0 +1,53 @@
+import csv, json, os
+
+from fake_hotpepper_server import fake_shop
+from utils.shop_shards import ShopShards
+
+
+def test_pages_are_deduplicated_and_rotated(tmp_path):
+    shards = ShopShards(str(tmp_path / "shards"), shard_size=25)
+    assert shards.write_page([fake_shop("Z011", i) for i in range(1, 21)]) == 20
+    # 前のページと重なる店舗は書かない
+    assert shards.write_page([fake_shop("Z011", i) for i in range(11, 41)]) == 20
+    # ページは分割せず、shard_size を超えたら次のページから新しいシャードにする
+    assert shards.write_page([fake_shop("Z011", i) for i in range(41, 51)]) == 10
+
+    assert shards.count() == 50
+    assert shards.shard_names() == ["shops-00000.jsonl", "shops-00001.jsonl"]
+    assert [shop["id"] for shop in shards.iter_shops()] == [fake_shop("Z011", i)["id"] for i in range(1, 51)]
+    assert shards.get(fake_shop("Z011", 33)["id"]) == fake_shop("Z011", 33)
+    assert shards.stats["duplicates"] == 10
+
+
+def test_uncommitted_tail_is_truncated_on_reopen(tmp_path):
+    directory = str(tmp_path / "shards")
+    shards = ShopShards(directory)
+    shards.write_page([fake_shop("Z011", i) for i in range(1, 6)])
+    shards.close()
+    # コミット前に落ちた書きかけ
+    with open(os.path.join(directory, "shops-00000.jsonl"), "ab") as f:
+        f.write(b'{"id": "JZ011000006", "na')
+
+    reopened = ShopShards(directory)
+    assert reopened.write_page([fake_shop("Z011", i) for i in range(5, 8)]) == 2
+    assert [shop["id"] for shop in reopened.iter_shops()] == [fake_shop("Z011", i)["id"] for i in range(1, 8)]
+
+
+def test_exports_stream_from_shards(tmp_path):
+    shards = ShopShards(str(tmp_path / "shards"), shard_size=10)
+    shards.write_page([fake_shop("Z011", i) for i in range(1, 16)])
+    shards.write_page([{**fake_shop("Z012", 1), "budget": {"name": "3000円"}}])
+
+    csv_path = str(tmp_path / "all_shops.csv")
+    assert shards.export_csv(csv_path) == 16
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 16 and rows[0]["id"] == "JZ011000001"
+    # 後から出てきた列も含め、入れ子の値はJSON文字列
+    assert json.loads(rows[-1]["budget"]) == {"name": "3000円"}
+    assert rows[0]["budget"] == ""
+
+    json_path = str(tmp_path / "Z012.json")
+    assert shards.export_json(json_path, lambda shop: shop["large_area"]["code"] == "Z012") == 1
+    with open(json_path, encoding="utf-8") as f:
+        assert [shop["id"] for shop in json.load(f)] == ["JZ012000001"]
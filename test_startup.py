@@ -0,0 +1,24 @@
+import os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_import_does_not_build_clients_or_touch_files():
+    # APIキーなしでもインポートでき、ネットワークに出るオブジェクトやSDKはまだ作られない
+    env = {key: value for key, value in os.environ.items()
+           if key not in ("OPENAI_API_KEY", "PINECONE_API_KEY", "OPENROUTER_API_KEY")}
+    preferences = os.path.join(ROOT, "user_preferences.json")
+    before = os.stat(preferences).st_mtime_ns if os.path.exists(preferences) else None
+    script = (
+        "import sys, wsgi\n"
+        "import utils.vector_store as vector_store, utils.restaurant_catalog as catalog\n"
+        "assert vector_store._shared_store is None\n"
+        "assert not catalog._catalogs\n"
+        "loaded = [m for m in ('openai', 'anthropic', 'pinecone', 'langchain_openai') if m in sys.modules]\n"
+        "assert not loaded, loaded\n"
+        "print(round(wsgi.IMPORT_MS))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    after = os.stat(preferences).st_mtime_ns if os.path.exists(preferences) else None
+    assert before == after
@@ -137,42 +137,21 @@
 #     main()
 
 import json, os
-from utils.vector_store import VectorStore
+from utils.vector_store import create_vector_store
+from utils.restaurant_catalog import get_catalog
 from dotenv import load_dotenv
 
 load_dotenv()
 
-vector_store = VectorStore()
+vector_store = create_vector_store()
 
 def import_restaurants_from_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    restaurants = data if isinstance(data, list) else [data]
-    vector_store = VectorStore()
+    restaurants = get_catalog(file_path).all()
 
     print(f"合計 {len(restaurants)} 店舗をインポートしています...")
-    for i, restaurant in enumerate(restaurants):
-        # Generate text_to_embed
-        text_to_embed = f"""
-        名前: {restaurant.get("name", "")}
-        ジャンル: {restaurant.get("genre", {}).get('name', '')} {restaurant.get("genre", {}).get('catch', '')}
-        サブジャンル: {restaurant.get("sub_genre", {}).get('name', '')}
-        エリア: {restaurant.get("large_area", {}).get('name', '')} {restaurant.get("middle_area", {}).get('name', '')} {restaurant.get("small_area", {}).get('name', '')}
-        アクセス: {restaurant.get("access", "")}
-        予算: {restaurant.get("budget", {}).get('name', '')} {restaurant.get("budget", {}).get('average', '')}
-        """
-        
-        # Use restaurant ID or generate a unique identifier
-        restaurant_id = restaurant.get('id', f'restaurant_{i+1}')
-        
-        result = vector_store.store_restaurant(
-            restaurant_id=restaurant_id, 
-            restaurant_data=restaurant, 
-            text_to_embed=text_to_embed
-        )
-        print(f"[{i+1}/{len(restaurants)}] {result['name']} - {result['status']}")
-    print("インポート完了")
+    # 前回から変わった店舗だけを100件ずつまとめて埋め込み・登録し、消えた店舗は削除
+    report = vector_store.reindex_restaurants(restaurants, batch_size=100)
+    print(f"インポート完了: {report}")
 
 if __name__ == "__main__":
     import_restaurants_from_file("meguro_shops.json")
\ No newline at end of file
@@ -3,11 +3,12 @@ from openai import AsyncOpenAI
 import os, re, json 
 from dotenv import load_dotenv
 
+from .llm_clients import get_llm_clients
+
 load_dotenv()
 
 class NinjaAgent:
     def __init__(self, restaurant_search_tool, greet_tool, faq_tool):
-        self.openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.tools = [restaurant_search_tool, greet_tool, faq_tool]
 
         # Update tools_definition to be more dynamic
@@ -83,6 +84,11 @@ class NinjaAgent:
         - ユーザーが選びやすいよう比較情報を提供してください
         """
 
+
+    @property
+    def openai_client(self) -> AsyncOpenAI:
+        return get_llm_clients().openai()
+
     async def get_tool_by_name(self, name):
         for tool in self.tools:
             if tool.name == name:
@@ -1,29 +1,23 @@
 # utils/ai_services.py
 import os, yaml, json, asyncio
-from openai import AsyncOpenAI
-from anthropic import AsyncAnthropic 
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Any, List, Optional
 from .yaml_manager import YAMLManager
+from .llm_clients import get_llm_clients
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
+    from openai import AsyncOpenAI
+
 load_dotenv()
 
 class AIService:
     def __init__(self):
         self.yaml_manager = YAMLManager(".")
-        self.openai_client = AsyncOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # クライアントは共有レジストリの接続プールを使う（下のプロパティを参照）
+        self.clients = get_llm_clients()
         self.openai_default_model = "gpt-4.1"
-
-        self.anthropic_client = AsyncAnthropic(
-            api_key=os.getenv("ANTHROPIC_API_KEY")
-        )
         self.anthropic_default_model = "anthropic/claude-3.7-sonnet"
-        self.openrouter_client = AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY")
-        )
         self.openrouter_default_model = "openai/gpt-4.1"
 
         self.summarize_prompt = None
@@ -32,6 +26,18 @@ class AIService:
         self.user_history_prompt = None
         self.quick_reply_prompt = None
     
+    @property
+    def openai_client(self) -> "AsyncOpenAI":
+        return self.clients.openai()
+
+    @property
+    def anthropic_client(self) -> "AsyncAnthropic":
+        return self.clients.anthropic()
+
+    @property
+    def openrouter_client(self) -> "AsyncOpenAI":
+        return self.clients.openrouter()
+
     async def initialize_prompt(self):
         self.summarize_prompt = await self.yaml_manager.load_prompt("prompts", "summarize")
         self.intent_prompt = await self.yaml_manager.load_prompt("prompts", "intent_classify")
@@ -87,7 +93,7 @@ class AIService:
             print(f"Error summarizing conversation: {e}")
             return "Failed to summarize conversation."
 
-    async def openrouter_generate_response(self, user_message: str, summary: list, user_history: list, last_two: list, user_preferences: list) -> str:
+    async def _restaurant_messages(self, user_message: str, summary: list, user_history: list, last_two: list, user_preferences: list) -> List[Dict[str, str]]:
         if not self.restaurant_prompt:
             await self.initialize_prompt()
         
@@ -102,19 +108,23 @@ class AIService:
             user_preferences_json=user_preferences
         )
         print(prompt_text)
+        return [
+            {
+                "role": "user",
+                "content": user_message
+            },
+            {
+                "role": "assistant",
+                "content": prompt_text
+            }
+        ]
+
+    async def openrouter_generate_response(self, user_message: str, summary: list, user_history: list, last_two: list, user_preferences: list) -> str:
+        messages = await self._restaurant_messages(user_message, summary, user_history, last_two, user_preferences)
         try:
             response = await self.openrouter_client.chat.completions.create(
                 model=self.openrouter_default_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": user_message
-                    },
-                    {
-                        "role": "assistant",
-                        "content": prompt_text
-                    }
-                ]
+                messages=messages
             )
             return response.choices[0].message.content.strip()
                 
@@ -122,6 +132,26 @@ class AIService:
             print(f"Error generating response: {e}")
             return "I'm sorry, I'm having trouble connecting to my services right now. Please try again later."
 
+    async def openrouter_stream_response(self, user_message: str, summary: list, user_history: list, last_two: list, user_preferences: list) -> AsyncIterator[str]:
+        """openrouter_generate_response と同じ応答を、生成されたそばから少しずつ返す"""
+        messages = await self._restaurant_messages(user_message, summary, user_history, last_two, user_preferences)
+        sent_any = False
+        try:
+            stream = await self.openrouter_client.chat.completions.create(
+                model=self.openrouter_default_model,
+                messages=messages,
+                stream=True
+            )
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    sent_any = True
+                    yield text
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            if not sent_any:
+                yield "I'm sorry, I'm having trouble connecting to my services right now. Please try again later."
+
     async def openrouter_generate_quick_summarize_response(self, user_message: str) -> str:
         if not self.user_history_prompt:
             await self.initialize_prompt()
@@ -0,0 +1,249 @@
+# utils/catalog_filter.py
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .compact_catalog import CompactCatalog
+
+# ジャンルコードごとのキーワード（日本語・英語）。ジャンル名そのものにも一致させる
+GENRE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "G001": ("居酒屋", "izakaya"),
+    "G002": ("ダイニングバー", "バル", "dining bar", "bal"),
+    "G003": ("創作", "fusion", "creative"),
+    "G004": ("和食", "日本料理", "寿司", "すし", "鮨", "天ぷら", "蕎麦", "そば", "うどん", "懐石", "割烹", "焼き鳥", "焼鳥",
+             "japanese", "sushi", "tempura", "soba", "udon", "kaiseki", "yakitori"),
+    "G005": ("洋食", "ハンバーグ", "オムライス", "western", "hamburg"),
+    "G006": ("イタリアン", "イタリア", "フレンチ", "フランス", "パスタ", "ピザ", "italian", "french", "pasta", "pizza"),
+    "G007": ("中華", "中国", "餃子", "chinese", "dim sum", "gyoza"),
+    "G008": ("焼肉", "ホルモン", "yakiniku", "bbq", "barbecue"),
+    "G009": ("アジア", "エスニック", "タイ", "ベトナム", "インド", "カレー", "asian", "ethnic", "thai", "vietnamese", "indian", "curry"),
+    "G010": ("各国", "スペイン", "メキシコ", "spanish", "mexican"),
+    "G011": ("カラオケ", "karaoke"),
+    "G012": ("バー", "カクテル", "bar", "cocktail"),
+    "G013": ("ラーメン", "らーめん", "つけ麺", "ramen"),
+    "G014": ("カフェ", "スイーツ", "cafe", "café", "coffee", "dessert", "sweets"),
+    "G016": ("お好み焼き", "もんじゃ", "okonomiyaki", "monja"),
+    "G017": ("韓国", "korean"),
+}
+
+# 予算コードと、ディナー予算の範囲（円）
+BUDGET_RANGES: Dict[str, Tuple[int, int]] = {
+    "B009": (0, 500), "B010": (501, 1000), "B011": (1001, 1500), "B001": (1501, 2000),
+    "B002": (2001, 3000), "B003": (3001, 4000), "B008": (4001, 5000), "B004": (5001, 7000),
+    "B005": (7001, 10000), "B006": (10001, 15000), "B012": (15001, 20000), "B013": (20001, 30000),
+    "B014": (30001, 10 ** 9),
+}
+BUDGET_LEVELS: Dict[str, Tuple[str, ...]] = {
+    "low": ("低", "安", "low", "cheap", "budget", "casual"),
+    "medium": ("中", "普通", "medium", "mid", "moderate"),
+    "high": ("高", "high", "expensive", "luxury", "高級"),
+}
+_LEVEL_CODES = {
+    "low": {"B009", "B010", "B011", "B001", "B002"},
+    "medium": {"B003", "B008", "B004"},
+    "high": {"B005", "B006", "B012", "B013", "B014"},
+}
+
+# ローマ字のエリア名 → カタログの表記
+AREA_ALIASES: Dict[str, str] = {
+    "nakameguro": "中目黒", "meguro": "目黒", "ebisu": "恵比寿", "fudomae": "不動前",
+    "musashikoyama": "武蔵小山", "gakugeidaigaku": "学芸大学", "nishikoyama": "西小山",
+    "jiyugaoka": "自由が丘", "daikanyama": "代官山", "komazawadaigaku": "駒沢大学",
+    "shibuya": "渋谷", "shinjuku": "新宿", "gotanda": "五反田", "shinagawa": "品川",
+    "tamachi": "田町", "hamamatsucho": "浜松町", "ginza": "銀座", "roppongi": "六本木",
+}
+
+# 設備の希望 → (フラグ項目, キーワード)
+FACILITY_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("private_room", ("個室", "private")),
+    ("tatami", ("座敷", "tatami")),
+    ("horigotatsu", ("掘りごたつ", "掘り炬燵", "horigotatsu")),
+    ("non_smoking", ("禁煙", "non-smoking", "non smoking", "no smoking")),
+    ("child", ("子供", "子ども", "こども", "お子様", "家族", "kid", "child", "family")),
+    ("wifi", ("wi-fi", "wifi")),
+    ("card", ("カード", "credit card")),
+    ("free_drink", ("飲み放題", "all-you-can-drink")),
+    ("lunch", ("ランチ", "lunch")),
+)
+
+_YES_ANSWERS = {"yes", "y", "true", "はい", "必要", "要", "あり", "希望"}
+# 絞り込みに使う順番（先のものほど優先。候補が0件になる条件は後ろから緩める）
+FILTER_PRIORITY = ("location", "cuisine", "budget", "english", "party_size") + tuple(f for f, _ in FACILITY_KEYWORDS)
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return " ".join(_text(item) for item in value)
+    return str(value).strip().lower()
+
+
+def _contains_keyword(text: str, keyword: str) -> bool:
+    # 英単語は単語境界で判定（"bar" が "barbecue" に一致しないように）
+    if keyword.isascii():
+        return re.search(rf"(?<![a-z]){re.escape(keyword)}(?![a-z])", text) is not None
+    return keyword in text
+
+
+def _is_yes(value: Any) -> bool:
+    if value is True:
+        return True
+    return _text(value) in _YES_ANSWERS
+
+
+class FilterResult:
+    """候補の店舗ID（None なら絞り込みなし）と、使った条件・緩めた条件"""
+    __slots__ = ("ids", "applied", "relaxed")
+
+    def __init__(self, ids: Optional[List[str]], applied: List[str], relaxed: List[str]):
+        self.ids = ids
+        self.applied = applied
+        self.relaxed = relaxed
+
+    def __repr__(self):
+        count = "all" if self.ids is None else len(self.ids)
+        return f"FilterResult(candidates={count}, applied={self.applied}, relaxed={self.relaxed})"
+
+
+class CatalogFilter:
+    """CompactCatalog の転置インデックス（エリア・ジャンル・予算・設備）で候補店舗を絞り込む
+
+    ユーザーの希望（抽出済みのpreferences）から候補集合を作り、ベクトル検索はその中だけで行う。
+    """
+    def __init__(self, table: CompactCatalog):
+        self.table = table
+        self.small_area: Dict[str, Set[int]] = {}
+        self.middle_area: Dict[str, Set[int]] = {}
+        self.station: Dict[str, Set[int]] = {}
+        self.genre: Dict[str, Set[int]] = {}
+        self.budget: Dict[str, Set[int]] = {}
+        self.facility: Dict[str, Set[int]] = {}
+        self.genre_names: Dict[str, str] = {}
+        self._capacity: List[Tuple[int, int]] = []
+        self._build()
+
+    def _build(self) -> None:
+        table = self.table
+        for row in range(len(table)):
+            for field, index in (("small_area", self.small_area), ("middle_area", self.middle_area)):
+                name = table.coded[field].get(row)
+                if isinstance(name, tuple) and name[1]:
+                    index.setdefault(name[1], set()).add(row)
+            station = table.interned["station_name"].get(row)
+            if isinstance(station, str) and station:
+                self.station.setdefault(station, set()).add(row)
+            for field in ("genre", "sub_genre"):
+                pair = table.coded[field].get(row)
+                if isinstance(pair, tuple) and pair[0]:
+                    self.genre.setdefault(pair[0], set()).add(row)
+                    self.genre_names.setdefault(pair[0], pair[1].lower())
+            code = table.code(row, "budget")
+            if code:
+                self.budget.setdefault(code, set()).add(row)
+            capacity = table.ints["capacity"][row]
+            if capacity > 0:
+                self._capacity.append((capacity, row))
+        for field, flags in table.flags.items():
+            self.facility[field] = {row for row, flag in enumerate(flags) if flag}
+        self._capacity.sort()
+
+    # --- 条件ごとの候補集合（None は「この条件では絞り込まない」） ---
+
+    def location_rows(self, location: Any) -> Optional[Set[int]]:
+        text = _text(location)
+        if not text:
+            return None
+        compact = re.sub(r"[\s\-・･]", "", text)
+        for alias, name in sorted(AREA_ALIASES.items(), key=lambda item: -len(item[0])):
+            if alias in compact:
+                compact = compact.replace(alias, name)
+        # 駅・小エリアで一致すればそれを使い、なければ中エリアの名前の一部で探す
+        names = [name for name in list(self.station) + list(self.small_area) if name in compact]
+        # 「中目黒」が一致したときに「目黒」も候補にしない
+        names = [name for name in names if not any(name != other and name in other for other in names)]
+        if names:
+            rows: Set[int] = set()
+            for name in names:
+                rows |= self.station.get(name, set()) | self.small_area.get(name, set())
+            return rows
+        rows = set()
+        for name, members in self.middle_area.items():
+            if any(part and part in compact for part in re.split(r"[･・]", name)):
+                rows |= members
+        return rows
+
+    def cuisine_rows(self, cuisine: Any) -> Optional[Set[int]]:
+        text = _text(cuisine)
+        if not text:
+            return None
+        codes = {code for code, keywords in GENRE_KEYWORDS.items()
+                 if any(_contains_keyword(text, keyword) for keyword in keywords)}
+        codes |= {code for code, name in self.genre_names.items() if name and name in text}
+        if not codes:
+            # 知らない料理名では絞り込まない（ベクトル検索に任せる）
+            return None
+        rows: Set[int] = set()
+        for code in codes:
+            rows |= self.genre.get(code, set())
+        return rows
+
+    def budget_rows(self, budget: Any) -> Optional[Set[int]]:
+        text = _text(budget)
+        if not text:
+            return None
+        amounts = [int(value.replace(",", "")) for value in re.findall(r"\d[\d,]*", text)]
+        if amounts:
+            limit = max(amounts) * (10000 if "万" in text else 1)
+            codes = {code for code, (low, _) in BUDGET_RANGES.items() if low <= limit}
+        else:
+            levels = [level for level, keywords in BUDGET_LEVELS.items() if any(_contains_keyword(text, k) for k in keywords)]
+            if not levels:
+                return None
+            codes = set().union(*(_LEVEL_CODES[level] for level in levels))
+        rows: Set[int] = set()
+        for code in codes:
+            rows |= self.budget.get(code, set())
+        return rows
+
+    def party_size_rows(self, party_size: Any) -> Optional[Set[int]]:
+        numbers = re.findall(r"\d+", _text(party_size))
+        if not numbers:
+            return None
+        start = bisect_left(self._capacity, (int(numbers[0]), -1))
+        return {row for _, row in self._capacity[start:]}
+
+    def constraints(self, preferences: Dict[str, Any]) -> List[Tuple[str, Optional[Set[int]]]]:
+        """preferences を (条件名, 候補行) のリストに変換（FILTER_PRIORITY順）"""
+        if not isinstance(preferences, dict):
+            preferences = {}
+        found = {
+            "location": self.location_rows(preferences.get("location")),
+            "cuisine": self.cuisine_rows(preferences.get("cuisine_type")),
+            "budget": self.budget_rows(preferences.get("budget_level")),
+            "english": self.facility["english"] if _is_yes(preferences.get("english_menu_needed")) else None,
+            "party_size": self.party_size_rows(preferences.get("party_size")),
+        }
+        wishes = _text([preferences.get("seating_preference"), preferences.get("occasion"),
+                        preferences.get("dietary_restrictions")])
+        for field, keywords in FACILITY_KEYWORDS:
+            if wishes and any(_contains_keyword(wishes, keyword) for keyword in keywords):
+                found[field] = self.facility[field]
+        return [(name, found[name]) for name in FILTER_PRIORITY if found.get(name) is not None]
+
+    def candidates(self, preferences: Dict[str, Any]) -> FilterResult:
+        """条件を優先度順に重ね、候補が0件になる条件は外して（緩めて）候補IDを返す"""
+        rows: Optional[Set[int]] = None
+        applied: List[str] = []
+        relaxed: List[str] = []
+        for name, members in self.constraints(preferences):
+            narrowed = set(members) if rows is None else rows & members
+            if narrowed:
+                rows = narrowed
+                applied.append(name)
+            else:
+                relaxed.append(name)
+        if rows is None:
+            return FilterResult(None, applied, relaxed)
+        ids = self.table.strings["id"]
+        return FilterResult([ids[row] for row in sorted(rows) if ids[row] is not None], applied, relaxed)
@@ -0,0 +1,116 @@
+# utils/catalog_index.py
+import os, sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .shop_shards import ShopShards, set_catalog_complete, write_json_array
+
+CATALOG_INDEX_NAME = "catalog_index.sqlite3"
+# {"code", "name"} を持つ項目（コードと名前のどちらでも引ける）
+CODED_KEYS = ("large_area", "middle_area", "small_area", "genre", "sub_genre")
+INDEXED_FIELDS = CODED_KEYS + ("station",)
+
+
+def shop_keys(shop: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """店舗から索引に載せる (項目, 値) を返す"""
+    for field in CODED_KEYS:
+        value = shop.get(field)
+        if isinstance(value, dict):
+            for key in ("code", "name"):
+                if value.get(key):
+                    yield field, value[key]
+    if shop.get("station_name"):
+        yield "station", shop["station_name"]
+
+
+class CatalogIndex:
+    """クロール結果のシャード（ShopShards）に対する、エリア・ジャンル・駅の永続インデックス
+
+    (項目, 値) → (シャード, バイト位置) をSQLiteに持ち、条件に合う店舗だけをシャードから直接読む。
+    インデックスはシャードごとに索引済みの位置を覚えていて、refresh() では追記された分だけを索引する。
+    """
+    def __init__(self, shards_dir: str, index_path: Optional[str] = None):
+        self.shards = ShopShards(shards_dir, readonly=True)
+        self.index_path = index_path or os.path.join(shards_dir, CATALOG_INDEX_NAME)
+        self._db = sqlite3.connect(self.index_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS keys (field TEXT, value TEXT, shard TEXT, offset INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS keys_field_value ON keys (field, value)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS indexed (shard TEXT PRIMARY KEY, size INTEGER)")
+        self._db.commit()
+
+    def refresh(self) -> int:
+        """まだ索引していない店舗を索引に追加する。追加した店舗数を返す"""
+        indexed = dict(self._db.execute("SELECT shard, size FROM indexed").fetchall())
+        added = 0
+        for name, size in self.shards.committed_sizes().items():
+            start = indexed.get(name, 0)
+            if size < start:
+                # シャードが作り直された（クロールをやり直した）ので索引し直す
+                self._db.execute("DELETE FROM keys WHERE shard = ?", (name,))
+                start = 0
+            if size == start:
+                continue
+            rows = []
+            for offset, shop in self.shards.scan(name, start, size):
+                rows.extend((field, value, name, offset) for field, value in shop_keys(shop))
+                added += 1
+            self._db.executemany("INSERT INTO keys VALUES (?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO indexed VALUES (?, ?)", (name, size))
+            self._db.commit()
+        return added
+
+    def _locations(self, filters: Dict[str, Sequence[str]]) -> List[Tuple[str, int]]:
+        """条件に合う店舗の位置（項目間はAND、同じ項目の複数の値はOR）"""
+        queries, params = [], []
+        for field, values in filters.items():
+            if field not in INDEXED_FIELDS:
+                raise ValueError(f"unknown field: {field} (expected one of {', '.join(INDEXED_FIELDS)})")
+            values = [values] if isinstance(values, str) else list(values)
+            # コードと名前の両方で当たる店舗もあるので DISTINCT
+            queries.append(f"SELECT DISTINCT shard, offset FROM keys "
+                           f"WHERE field = ? AND value IN ({','.join('?' * len(values))})")
+            params.extend([field, *values])
+        sql = " INTERSECT ".join(queries) + " ORDER BY shard, offset"
+        return self._db.execute(sql, params).fetchall()
+
+    def query(self, **filters: Sequence[str]) -> Iterator[Dict[str, Any]]:
+        """条件に合う店舗を返す（例: query(small_area=["目黒"], genre=["G001"])。条件なしは全店舗）"""
+        if not filters:
+            return self.shards.iter_shops()
+        return self.shards.read_at(self._locations(filters))
+
+    def count(self, **filters: Sequence[str]) -> int:
+        if not filters:
+            return self.shards.count()
+        return len(self._locations(filters))
+
+    def values(self, field: str) -> List[Tuple[str, int]]:
+        """項目の値と店舗数（多い順）"""
+        return self._db.execute(
+            "SELECT value, COUNT(*) AS n FROM keys WHERE field = ? GROUP BY value ORDER BY n DESC, value",
+            (field,),
+        ).fetchall()
+
+    def export(self, path: str, indent: Optional[int] = 2, **filters: Sequence[str]) -> int:
+        """条件に合う店舗をそのまま配信できるカタログファイル（JSON配列）に書き出す
+
+        全エリアを取り切ったクロールを条件なしで書き出したときだけ、全国分の目印を付ける
+        （目印はカタログより先に更新する。カタログの読み直しで古い目印を読まないように）。
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        set_catalog_complete(path, not any(filters.values()) and self.shards.is_complete())
+        return write_json_array(path, self.query(**filters), indent)
+
+    def export_many(self, output_dir: str, field: str, values: Iterable[str],
+                    indent: Optional[int] = 2, **filters: Sequence[str]) -> Dict[str, Tuple[str, int]]:
+        """値ごとに別のカタログファイルを書き出す（例: 小エリアごと）。値 → (パス, 件数)"""
+        written = {}
+        for value in values:
+            path = os.path.join(output_dir, f"{field}_{value}.json")
+            written[value] = (path, self.export(path, indent, **{**filters, field: [value]}))
+        return written
+
+    def close(self) -> None:
+        self._db.close()
+        self.shards.close()
@@ -4,12 +4,15 @@ import os, json
 from typing import Dict, List, Any, Optional, Tuple 
 from datetime import datetime
 
-from .file_operations import load_json, save_json, to_pretty_json
+from .file_operations import load_json, save_json, to_pretty_json, get_last_conversation
+from .jsonl_log import JsonlLog, get_jsonl_log
 
 class ChatroomManager:
-    def __init__(self, data_dir: str = "data", max_rallies: int = 6):
+    def __init__(self, data_dir: str = "data", max_rallies: int = 6, max_log_entries: int = 1000):
         self.data_dir = data_dir
         self.max_rallies = max_rallies
+        # 会話ログ（JSON Lines）に残す件数。超えた分はコンパクションで捨てる
+        self.max_log_entries = max_log_entries
         self.chatroom_file = os.path.join(data_dir, "cahtroom.json")
 
         os.makedirs(data_dir, exist_ok=True)
@@ -20,7 +23,7 @@ class ChatroomManager:
 
     async def get_user_files(self, user_id: str) -> Dict[str, str]:
         return {
-            "chat_log": os.path.join(self.data_dir, f"chat_log_{user_id}.json"),
+            "chat_log": os.path.join(self.data_dir, f"chat_log_{user_id}.jsonl"),
             "summary": os.path.join(self.data_dir, f"summary_{user_id}.json"),
             "user_history": os.path.join(self.data_dir, f"user_history_{user_id}.json")
         }
@@ -31,7 +34,6 @@ class ChatroomManager:
         if user_id not in chatrooms:
             user_files = await self.get_user_files(user_id)
 
-            await save_json(user_files["chat_log"], [])
             await save_json(user_files["summary"], [])
             await save_json(user_files["user_history"], {})
 
@@ -42,24 +44,23 @@ class ChatroomManager:
             await save_json(self.chatroom_file, chatrooms)
         return chatrooms[user_id]
 
+    def chat_log(self, chatroom: Dict[str, Any]) -> JsonlLog:
+        """チャットルームの会話ログ（以前のJSON配列のファイルは初回に取り込む）"""
+        path = chatroom["files"]["chat_log"]
+        if path.endswith(".json"):
+            log = get_jsonl_log(path + "l", max_entries=self.max_log_entries)
+            log.import_json_array(path)
+            return log
+        return get_jsonl_log(path, max_entries=self.max_log_entries)
+
     async def get_last_conversation_pair(self, user_id: str) -> Optional[Dict[str, Dict]]:
         chatroom = await self.get_or_create_chatroom(user_id)
-        history = await load_json(chatroom["files"]["chat_log"], [])
-
-        if len(history) < 2:
-            return None 
-        for i in range(len(history) - 2, -1, -1):
-            if history[i]["role"] == "user" and history[i + 1]["role"] == "assistant":
-                return {
-                    "user": history[i],
-                    "assistant": history[i + 1]
-                }
-        return None
+        return await get_last_conversation(self.chat_log(chatroom))
 
     async def update_user_messages(self, user_id: str, message_pair: Dict[str, Any]) -> None:
         chatroom = await self.get_or_create_chatroom(user_id)
         user_history = await load_json(chatroom["files"]["user_history"], {})
-        history = await load_json(chatroom["files"]["chat_log"], [])
+        history = await self.chat_log(chatroom).tail(3)
 
         if user_id not in user_history:
             user_history[user_id] = {
@@ -80,18 +81,19 @@ class ChatroomManager:
 
     async def add_messages(self, user_id: str, message: Dict[str, Any]) -> None:
         chatroom = await self.get_or_create_chatroom(user_id)
-        history = await load_json(chatroom["files"]["chat_log"], [])
-        history.append(message)
-        await save_json(chatroom["files"]["chat_log"], history)
+        # 1行追記するだけ（履歴全体は書き直さない）
+        await self.chat_log(chatroom).append(message)
 
-    async def clear_chat_data(self, user_id: str) -> None:
+    async def clear_chat_data(self, user_id: str) -> bool:
+        """会話ログ・要約・履歴を空にする"""
         try:
             chatroom = await self.get_or_create_chatroom(user_id)
             user_files = chatroom["files"]
 
-            await load_json(user_files["chat_log"], [])
-            await load_json(user_files["summary"], [])
-            await load_json(user_files["user_history"], {})
+            # 会話ログ（JSON Lines）は切り詰める。以前のJSON配列は取り込まれてから空になる
+            await self.chat_log(chatroom).clear()
+            await save_json(user_files["summary"], [])
+            await save_json(user_files["user_history"], {})
 
             return True
         except Exception as e:
@@ -103,7 +105,7 @@ class ChatroomManager:
             chatroom = await self.get_or_create_chatroom(user_id)
             user_files = chatroom["files"]
             
-            history = await load_json(user_files["chat_log"], [])
+            history = await self.chat_log(chatroom).read_all()
             summary = await load_json(user_files["summary"], [])
             user_history = await load_json(user_files["user_history"], {})
             
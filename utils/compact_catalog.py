@@ -0,0 +1,267 @@
+# utils/compact_catalog.py
+import json, math, zlib
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+_MISSING = object()
+_INT_MISSING = -2 ** 31
+_EMPTY_BLOB = b""
+
+# 短い文字列（店舗ごとに異なる）
+STRING_FIELDS = ("id", "name", "name_kana", "address")
+# {"code", "name"} を持つカテゴリ（code/nameの組をインターンし、それ以外のキーは長文側に置く）
+CODED_FIELDS = ("large_service_area", "service_area", "large_area", "middle_area", "small_area",
+                "genre", "sub_genre", "budget")
+# あり/なし系の設備・サービス項目（値の種類が少ないのでインターン）
+FLAG_FIELDS = ("private_room", "horigotatsu", "tatami", "card", "non_smoking", "charter", "parking",
+               "barrier_free", "show", "karaoke", "band", "tv", "lunch", "midnight", "english", "pet",
+               "child", "wifi", "course", "free_drink", "free_food")
+INTERNED_FIELDS = ("station_name",) + FLAG_FIELDS
+FLOAT_FIELDS = ("lat", "lng")
+INT_FIELDS = ("capacity", "party_capacity", "ktai_coupon")
+
+# 「あり ：詳細...」のような値の先頭部分で「あり」とみなすもの
+_YES_VALUES = {"あり", "利用可", "可", "全面禁煙", "お子様連れOK", "お子様連れ歓迎", "貸切可", "営業している"}
+
+
+def is_yes(value: Any) -> bool:
+    """HotPepperの設備項目の値が「あり」に当たるか"""
+    if not isinstance(value, str):
+        return False
+    head = value.split("：")[0].strip()
+    return head in _YES_VALUES or head.startswith("あり")
+
+
+class _InternedColumn:
+    """値のテーブルと、行ごとのテーブル番号（小さい整数配列）で持つ列"""
+    __slots__ = ("values", "index", "codes")
+
+    def __init__(self):
+        self.values: List[Any] = [_MISSING]
+        self.index: Optional[Dict[Any, int]] = {}
+        self.codes = array("H")
+
+    def append(self, value: Any) -> None:
+        code = 0
+        if value is not _MISSING:
+            code = self.index.get(value)
+            if code is None:
+                code = self.index[value] = len(self.values)
+                self.values.append(value)
+        if code > 0xFFFF and self.codes.typecode == "H":
+            self.codes = array("I", self.codes)
+        self.codes.append(code)
+
+    def get(self, row: int) -> Any:
+        return self.values[self.codes[row]]
+
+    def freeze(self) -> None:
+        # 構築後は逆引き用の辞書は不要
+        self.index = None
+
+
+class ShopRecord(Mapping):
+    """CompactCatalogの1行を、店舗の辞書と同じように読めるビュー（読み取り専用）"""
+    __slots__ = ("_table", "_row", "_extra")
+
+    def __init__(self, table: "CompactCatalog", row: int):
+        self._table = table
+        self._row = row
+        self._extra = None
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    def extra(self) -> Dict[str, Any]:
+        """列に入っていない長文などのフィールド（初回アクセス時に展開）"""
+        if self._extra is None:
+            self._extra = self._table.decode_extra(self._row)
+        return self._extra
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._table.value(self, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._table.value(self, key)
+        return default if value is _MISSING else value
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in self._table.key_order if self.get(key, _MISSING) is not _MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def flag(self, field: str) -> bool:
+        return self._table.flag(self._row, field)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class CompactCatalog:
+    """店舗データを列ごとに持つ省メモリなカタログ
+
+    - カテゴリ値（エリア・ジャンル・予算コード、あり/なし項目）はインターンして整数配列に
+    - 緯度経度・席数などは数値配列に
+    - それ以外の長文（キャッチ、アクセス、営業時間、写真URLなど）は行ごとにzlib圧縮し、
+      アクセスされたときだけ展開する
+    """
+    def __init__(self, restaurants: Iterable[Dict[str, Any]]):
+        self.strings: Dict[str, List[Optional[str]]] = {field: [] for field in STRING_FIELDS}
+        self.coded: Dict[str, _InternedColumn] = {field: _InternedColumn() for field in CODED_FIELDS}
+        self.interned: Dict[str, _InternedColumn] = {field: _InternedColumn() for field in INTERNED_FIELDS}
+        self.floats: Dict[str, array] = {field: array("d") for field in FLOAT_FIELDS}
+        self.ints: Dict[str, array] = {field: array("i") for field in INT_FIELDS}
+        self.flags: Dict[str, bytearray] = {field: bytearray() for field in FLAG_FIELDS}
+        self.extras: List[bytes] = []
+        self.row_by_id: Dict[str, int] = {}
+        self.key_order: List[str] = []
+        self.nested_order: Dict[str, List[str]] = {field: [] for field in CODED_FIELDS}
+        self._known_keys = set()
+
+        for restaurant in restaurants:
+            self._append(restaurant)
+        for column in list(self.coded.values()) + list(self.interned.values()):
+            column.freeze()
+        self._known_keys = None
+
+    @classmethod
+    def from_json(cls, json_path: str) -> "CompactCatalog":
+        with open(json_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.extras)
+
+    def __iter__(self) -> Iterator[ShopRecord]:
+        return (ShopRecord(self, row) for row in range(len(self)))
+
+    def _remember_keys(self, restaurant: Dict[str, Any]) -> None:
+        for key in restaurant:
+            if key not in self._known_keys:
+                self._known_keys.add(key)
+                self.key_order.append(key)
+        for field in CODED_FIELDS:
+            nested = restaurant.get(field)
+            if isinstance(nested, dict):
+                order = self.nested_order[field]
+                order.extend(key for key in nested if key not in order)
+
+    def _append(self, restaurant: Dict[str, Any]) -> None:
+        row = len(self.extras)
+        self._remember_keys(restaurant)
+        extra: Dict[str, Any] = {}
+        handled = set()
+
+        for field in STRING_FIELDS:
+            value = restaurant.get(field, _MISSING)
+            if isinstance(value, str):
+                self.strings[field].append(value)
+                handled.add(field)
+            else:
+                self.strings[field].append(None)
+
+        for field in CODED_FIELDS:
+            value = restaurant.get(field, _MISSING)
+            if isinstance(value, dict) and isinstance(value.get("code"), str) and isinstance(value.get("name"), str):
+                self.coded[field].append((value.get("code"), value.get("name")))
+                rest = {key: item for key, item in value.items() if key not in ("code", "name")}
+                if rest:
+                    extra[field] = rest
+                handled.add(field)
+            else:
+                self.coded[field].append(_MISSING)
+
+        for field in INTERNED_FIELDS:
+            value = restaurant.get(field, _MISSING)
+            if isinstance(value, str):
+                self.interned[field].append(value)
+                handled.add(field)
+            else:
+                self.interned[field].append(_MISSING)
+
+        for field in FLAG_FIELDS:
+            self.flags[field].append(1 if is_yes(restaurant.get(field)) else 0)
+
+        for field in FLOAT_FIELDS:
+            value = restaurant.get(field, _MISSING)
+            if isinstance(value, float) or (isinstance(value, int) and not isinstance(value, bool)):
+                self.floats[field].append(float(value))
+                handled.add(field)
+            else:
+                self.floats[field].append(math.nan)
+
+        for field in INT_FIELDS:
+            value = restaurant.get(field, _MISSING)
+            if isinstance(value, int) and not isinstance(value, bool) and _INT_MISSING < value < 2 ** 31:
+                self.ints[field].append(value)
+                handled.add(field)
+            else:
+                self.ints[field].append(_INT_MISSING)
+
+        for key, value in restaurant.items():
+            if key not in handled and key not in extra:
+                extra[key] = value
+
+        self.extras.append(
+            zlib.compress(json.dumps(extra, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            if extra else _EMPTY_BLOB
+        )
+        restaurant_id = self.strings["id"][row]
+        if restaurant_id is not None:
+            self.row_by_id[restaurant_id] = row
+
+    def decode_extra(self, row: int) -> Dict[str, Any]:
+        blob = self.extras[row]
+        return json.loads(zlib.decompress(blob).decode("utf-8")) if blob else {}
+
+    def value(self, record: ShopRecord, key: str) -> Any:
+        row = record.row
+        if key in self.strings:
+            value = self.strings[key][row]
+            if value is not None:
+                return value
+        elif key in self.coded:
+            pair = self.coded[key].get(row)
+            if pair is not _MISSING:
+                code, name = pair
+                rest = record.extra().get(key, {})
+                nested = {"code": code, "name": name, **rest}
+                order = self.nested_order[key]
+                return {item: nested[item] for item in order if item in nested}
+        elif key in self.interned:
+            value = self.interned[key].get(row)
+            if value is not _MISSING:
+                return value
+        elif key in self.floats:
+            value = self.floats[key][row]
+            if not math.isnan(value):
+                return value
+        elif key in self.ints:
+            value = self.ints[key][row]
+            if value != _INT_MISSING:
+                return value
+        return record.extra().get(key, _MISSING)
+
+    def get(self, restaurant_id: str) -> Optional[ShopRecord]:
+        row = self.row_by_id.get(restaurant_id)
+        return None if row is None else ShopRecord(self, row)
+
+    def record(self, row: int) -> ShopRecord:
+        return ShopRecord(self, row)
+
+    def flag(self, row: int, field: str) -> bool:
+        return bool(self.flags[field][row])
+
+    def code(self, row: int, field: str) -> str:
+        """エリア・ジャンル・予算のコード（ない場合は空文字）"""
+        pair = self.coded[field].get(row)
+        return "" if pair is _MISSING else pair[0] or ""
@@ -0,0 +1,108 @@
+# utils/embedding_cache.py
+import hashlib, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+
+
+class EmbeddingCache:
+    """モデル名+テキストのハッシュをキーにした埋め込みキャッシュ
+
+    メモリ上のLRUとSQLiteの2段構成で、SQLite側は再起動後も残る。
+    path に空文字を渡すとメモリのみで動作する。
+    メモリ上はfloat32の配列で持ち（Pythonのfloatのリストの約1/8）、返すときにリストにする。
+    """
+    def __init__(self, path: Optional[str] = None, max_memory_items: int = 4096):
+        self.path = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3") if path is None else path
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._db = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB, created_at REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """キャッシュにないテキストはNoneを返す"""
+        keys = [self.make_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            disk_lookup: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[i] = self._memory[key].tolist()
+                    self.stats["memory_hits"] += 1
+                else:
+                    disk_lookup.setdefault(key, []).append(i)
+
+            if disk_lookup and self._db is not None:
+                found = {}
+                pending = list(disk_lookup)
+                # SQLiteのパラメータ数上限に収まるように分割して問い合わせる
+                for start in range(0, len(pending), 500):
+                    chunk = pending[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    found.update(rows)
+                for key, blob in found.items():
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, vector)
+                    for i in disk_lookup.pop(key):
+                        results[i] = vector.tolist()
+                        self.stats["disk_hits"] += 1
+
+            self.stats["misses"] += sum(len(indexes) for indexes in disk_lookup.values())
+        return results
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(model, text)
+                vector = np.array(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model, len(vector), vector.tobytes(), now))
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        self.put_many(model, [text], [vector])
+
+    def get_stats(self) -> Dict[str, float]:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,74 +1,256 @@
 # uitls/file_operations.py
-from functools import lru_cache
-import asyncio, aiofiles, json, os 
-from typing import Any, Dict, List, Optional, Union 
+import asyncio, aiofiles, json, os, tempfile, weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union 
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .jsonl_log import JsonlLog
 
 CACHE_SIZE = 100
+LAST_CONVERSATION_TAIL = 8
+
+# パス → (ファイルの (mtime_ns, size)、読み込んだデータ)。ファイルがなければ署名はNone
+_json_cache: "OrderedDict[str, Tuple[Optional[Tuple[int, int]], Any]]" = OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+# ファイルがない・壊れているときにキャッシュに入れる目印（呼び出し側の default はキャッシュしない）
+_USE_DEFAULT = object()
+# イベントループごとの、パスごとのロック（asyncio.Lockは作ったループでしか使えないため）
+_path_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = weakref.WeakKeyDictionary()
+# 書き込み待ちのデータ（ループ → パス → 最新のデータと待っている呼び出し）
+_pending_writes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Dict[str, Any]]]" = weakref.WeakKeyDictionary()
+_write_stats = {"writes": 0, "coalesced": 0}
+
+def _signature(filepath: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _path_lock(filepath: str) -> asyncio.Lock:
+    locks = _path_locks.setdefault(asyncio.get_running_loop(), {})
+    lock = locks.get(filepath)
+    if lock is None:
+        lock = locks[filepath] = asyncio.Lock()
+    return lock
+
+def _copy(data: Any) -> Any:
+    """キャッシュの中身を呼び出し側が書き換えないように渡すコピー（JSONの型だけなのでdeepcopyより速い）"""
+    if isinstance(data, dict):
+        return {key: _copy(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_copy(value) for value in data]
+    return data
 
-_json_cache = {}
-_json_cache_ttl = {}
-CACHE_TTL = 60
+def _loaded(data: Any, default: Any) -> Any:
+    return _copy(default if data is _USE_DEFAULT else data)
+
+def _remember(filepath: str, signature: Optional[Tuple[int, int]], data: Any) -> None:
+    _json_cache[filepath] = (signature, data)
+    _json_cache.move_to_end(filepath)
+    while len(_json_cache) > CACHE_SIZE:
+        _json_cache.popitem(last=False)
+        _cache_stats["evictions"] += 1
+
+def _cached(filepath: str, signature: Optional[Tuple[int, int]]) -> Tuple[bool, Any]:
+    entry = _json_cache.get(filepath)
+    if entry is None or entry[0] != signature:
+        return False, None
+    _json_cache.move_to_end(filepath)
+    return True, entry[1]
 
 async def load_json(filepath: str, default: Any) -> Any:
-    curren_time = asyncio.get_event_loop().time() 
+    """JSONファイルを読み込む（ファイルの更新日時・サイズが変わっていなければキャッシュから返す）
 
-    if filepath in _json_cache and filepath in _json_cache_ttl:
-        if curren_time - _json_cache_ttl[filepath] < CACHE_TTL:
-            return _json_cache[filepath]
-    try:
-        if not os.path.exists(filepath):
-            _json_cache[filepath] = default
-            _json_cache_ttl[filepath] = curren_time
-            return default
-        async with aiofiles.open(filepath, "r", encoding='utf-8') as f:
-            content = await f.read()
+    他のワーカーが書き換えた場合も次の呼び出しで反映される。返す値はコピーなので、
+    呼び出し側で書き換えてもキャッシュには影響しない。ファイルがない・壊れているときは、
+    その呼び出しで渡した default のコピーを返す。
+    """
+    found, data = _cached(filepath, _signature(filepath))
+    if found:
+        _cache_stats["hits"] += 1
+        return _loaded(data, default)
+
+    # 同じファイルを同時に読み込もうとした場合は1回の読み込みにまとめる
+    async with _path_lock(filepath):
+        signature = _signature(filepath)
+        found, data = _cached(filepath, signature)
+        if found:
+            _cache_stats["coalesced"] += 1
+            return _loaded(data, default)
+
+        _cache_stats["misses"] += 1
+        data = _USE_DEFAULT
+        if signature is not None:
             try:
+                async with aiofiles.open(filepath, "r", encoding='utf-8') as f:
+                    content = await f.read()
                 data = json.loads(content)
-                _json_cache[filepath] = data 
-                _json_cache_ttl[filepath] = curren_time
-                return data 
-            except json.JSONDecodeError:
-                _json_cache[filepath] = default
-                _json_cache_ttl[filepath] = curren_time
-                return default
-    except FileNotFoundError:
-        _json_cache[filepath] = default
-        _json_cache_ttl[filepath] = current_time
-        return default
-
-async def save_json(filepath: str, data: Any) -> None:
+            except FileNotFoundError:
+                signature = None
+            except json.JSONDecodeError as e:
+                print(f"JSON読み込みエラー ({filepath}): {e}")
+                data = _USE_DEFAULT
+        _remember(filepath, signature, data)
+        return _loaded(data, default)
+
+def _lock_path(filepath: str) -> str:
+    return f"{filepath}.lock"
+
+@contextmanager
+def file_lock(filepath: str):
+    """別プロセス（uvicornの他のワーカー）とも排他する advisory lock（fcntlがないOSでは何もしない）"""
+    if fcntl is None:
+        yield
+        return
+    with open(_lock_path(filepath), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def atomic_writer(filepath: str, newline: Optional[str] = None):
+    """一時ファイルに書いてfsyncし、対象にrenameする（読み手には古い内容か新しい内容のどちらかが見える）
+
+    with atomic_writer(path) as f: で少しずつ書ける。例外で抜けた場合は元のファイルが残る。
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(filepath)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline=newline) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # renameをディスクに残すためにディレクトリもfsync
+        dir_fd = os.open(directory, os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def _replace_atomically(filepath: str, text: str) -> None:
+    with atomic_writer(filepath) as f:
+        f.write(text)
+
+def atomic_write_text(filepath: str, text: str) -> None:
+    with file_lock(filepath):
+        _replace_atomically(filepath, text)
+
+def write_json_sync(filepath: str, data: Any, indent: int = 2) -> None:
+    """同期版（起動時の初期化など、イベントループの外で使う）"""
+    atomic_write_text(filepath, json.dumps(data, indent=indent, ensure_ascii=False))
+
+async def write_json(filepath: str, data: Any, indent: int = 2) -> None:
+    """JSONファイルをアトミックに書き込む（失敗時は例外）
+
+    同じファイルへの書き込みが続いた場合はまとめ、最後のデータだけを書く
+    （書き込み中に来た分は、次の1回の書き込みで全員分を完了扱いにする）。
+    """
+    loop = asyncio.get_running_loop()
+    pending = _pending_writes.setdefault(loop, {})
+    future = loop.create_future()
+    entry = pending.setdefault(filepath, {"waiters": []})
+    entry["text"] = json.dumps(data, indent=indent, ensure_ascii=False)
+    entry["data"] = _copy(data)
+    entry["waiters"].append(future)
+
+    async with _path_lock(filepath):
+        if not future.done():
+            batch = pending.pop(filepath)
+            try:
+                await asyncio.to_thread(atomic_write_text, filepath, batch["text"])
+                _remember(filepath, _signature(filepath), batch["data"])
+                _write_stats["writes"] += 1
+                _write_stats["coalesced"] += len(batch["waiters"]) - 1
+                for waiter in batch["waiters"]:
+                    waiter.set_result(None)
+            except Exception as e:
+                for waiter in batch["waiters"]:
+                    waiter.set_exception(e)
+    await future
+
+async def update_json(filepath: str, default: Any, update: Callable[[Any], Any], indent: int = 2) -> Any:
+    """読み込み→update(data)→書き込みを、プロセス内外の他の書き手と排他して行う
+
+    update はデータをその場で書き換える（戻り値は呼び出し元にそのまま返す）。
+    """
+    def read_update_write():
+        with file_lock(filepath):
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = _copy(default)
+            result = update(data)
+            _replace_atomically(filepath, json.dumps(data, indent=indent, ensure_ascii=False))
+            return data, result
+
+    async with _path_lock(filepath):
+        data, result = await asyncio.to_thread(read_update_write)
+        _remember(filepath, _signature(filepath), data)
+        _write_stats["writes"] += 1
+    return result
+
+async def save_json(filepath: str, data: Any, indent: int = 2) -> None:
     try:
         if not filepath:
             print("Error: Empty filepath provided")
             return
-        # print(filepath)
-        # os.makedirs(os.path.dirname(filepath), exist_ok=True)
-
-        async with aiofiles.open(filepath, "w", encoding='utf-8') as f:
-            json_str = json.dumps(data, indent=2, ensure_ascii=False)
-            await f.write(json_str)
-        _json_cache[filepath] = data 
-        _json_cache_ttl[filepath] = asyncio.get_event_loop().time()
+        await write_json(filepath, data, indent)
     except Exception as e:
         print(f"保持エラー ({filepath}): {str(e)}")
 
+def get_cache_stats() -> Dict[str, Any]:
+    hits = _cache_stats["hits"] + _cache_stats["coalesced"]
+    total = hits + _cache_stats["misses"]
+    return {
+        **_cache_stats,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "entries": len(_json_cache),
+        "max_entries": CACHE_SIZE,
+        "writes": _write_stats["writes"],
+        "coalesced_writes": _write_stats["coalesced"],
+    }
+
 async def to_pretty_json(data: Any) -> str:
     return json.dumps(data, ensure_ascii=False, indent=2)
 
 def clear_cache(filepath: Optional[str] = None) -> None:
     if filepath:
-        if filepath in _json_cache:
-            del _json_cache[filepath]
-        if filepath in _json_cache_ttl:
-            del _json_cache_ttl[filepath]
+        _json_cache.pop(filepath, None)
     else:
         _json_cache.clear()
-        _json_cache_ttl.clear()
 
 
-async def get_last_conversation(history_json: list) -> Optional[Dict[str, Dict]]:
-    history = history_json
+async def get_last_conversation(history_json: Union[list, JsonlLog]) -> Optional[Dict[str, Dict]]:
+    """直近の (user, assistant) のやり取り。JsonlLogを渡すと末尾だけを読む"""
+    if isinstance(history_json, JsonlLog):
+        # 見つかるまで読む件数を増やす（通常は最初の数件で見つかる）
+        count = LAST_CONVERSATION_TAIL
+        while True:
+            history = await history_json.tail(count)
+            pair = _find_last_pair(history)
+            if pair is not None or len(history) < count:
+                return pair
+            count *= 4
+    return _find_last_pair(history_json)
 
+def _find_last_pair(history: list) -> Optional[Dict[str, Dict]]:
     if len(history) < 2:
         return None
     for i in range(len(history) - 2, -1, -1):
@@ -0,0 +1,116 @@
+# utils/geo_index.py
+import math
+from typing import Dict, List, Optional, Tuple
+
+from .compact_catalog import CompactCatalog
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+# HotPepper APIの range パラメータと同じ半径（メートル）
+RANGE_METERS = {1: 300, 2: 500, 3: 1000, 4: 2000, 5: 3000}
+
+
+def range_to_meters(search_range: int) -> int:
+    """HotPepperの range（1〜5）を半径（メートル）に変換"""
+    if search_range not in RANGE_METERS:
+        raise ValueError(f"range must be one of {sorted(RANGE_METERS)}: {search_range}")
+    return RANGE_METERS[search_range]
+
+
+def haversine_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """店舗の緯度経度を等間隔のグリッドに入れた空間インデックス
+
+    半径検索は、円に掛かるセルの店舗だけ距離を計算して近い順に返す。
+    """
+    def __init__(self, table: CompactCatalog, cell_meters: float = 250.0):
+        self.table = table
+        self.cell_meters = cell_meters
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.stations: Dict[str, Tuple[float, float]] = {}
+
+        lats, lngs = table.floats["lat"], table.floats["lng"]
+        rows = [row for row in range(len(table)) if not (math.isnan(lats[row]) or math.isnan(lngs[row]))]
+        # 経度方向のセル幅は、カタログの平均緯度で決める（都市内なら誤差は小さい）
+        mean_lat = sum(lats[row] for row in rows) / len(rows) if rows else 35.0
+        self.lat_step = cell_meters / METERS_PER_DEGREE_LAT
+        self.lng_step = cell_meters / (METERS_PER_DEGREE_LAT * max(0.01, math.cos(math.radians(mean_lat))))
+
+        station_sums: Dict[str, List[float]] = {}
+        stations = table.interned["station_name"]
+        for row in rows:
+            self.cells.setdefault(self._cell(lats[row], lngs[row]), []).append(row)
+            station = stations.get(row)
+            if isinstance(station, str) and station:
+                total = station_sums.setdefault(station, [0.0, 0.0, 0])
+                total[0] += lats[row]
+                total[1] += lngs[row]
+                total[2] += 1
+        # 駅の座標データはないので、その駅を最寄りとする店舗の重心で代用する
+        self.stations = {name: (lat / count, lng / count) for name, (lat, lng, count) in station_sums.items()}
+        self.size = len(rows)
+        # カタログの範囲（緯度・経度の最小・最大）。範囲外の地点はカタログでは答えられない
+        self.bounds = ((min(lats[row] for row in rows), min(lngs[row] for row in rows),
+                        max(lats[row] for row in rows), max(lngs[row] for row in rows)) if rows else None)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.lat_step)), int(math.floor(lng / self.lng_step))
+
+    def covers(self, lat: float, lng: float) -> bool:
+        """地点がカタログの範囲内で、その周り（隣のセルまで）に店舗があるか"""
+        if self.bounds is None:
+            return False
+        min_lat, min_lng, max_lat, max_lng = self.bounds
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+        center_lat, center_lng = self._cell(lat, lng)
+        return any((center_lat + d_lat, center_lng + d_lng) in self.cells
+                   for d_lat in (-1, 0, 1) for d_lng in (-1, 0, 1))
+
+    def nearby(self, lat: float, lng: float, radius_meters: float,
+               limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(行番号, 距離m) を近い順に返す"""
+        lat_cells = int(math.ceil(radius_meters / self.cell_meters)) + 1
+        lng_scale = max(0.01, math.cos(math.radians(lat)))
+        lng_cells = int(math.ceil(radius_meters / (self.lng_step * METERS_PER_DEGREE_LAT * lng_scale))) + 1
+        center_lat, center_lng = self._cell(lat, lng)
+        lats, lngs = self.table.floats["lat"], self.table.floats["lng"]
+
+        found = []
+        for cell_lat in range(center_lat - lat_cells, center_lat + lat_cells + 1):
+            for cell_lng in range(center_lng - lng_cells, center_lng + lng_cells + 1):
+                for row in self.cells.get((cell_lat, cell_lng), ()):
+                    distance = haversine_meters(lat, lng, lats[row], lngs[row])
+                    if distance <= radius_meters:
+                        found.append((row, distance))
+        found.sort(key=lambda item: (item[1], item[0]))
+        return found[:limit] if limit else found
+
+    def nearby_ids(self, lat: float, lng: float, radius_meters: float,
+                   limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        ids = self.table.strings["id"]
+        return [(ids[row], distance) for row, distance in self.nearby(lat, lng, radius_meters, limit)]
+
+    def station_location(self, station: str) -> Optional[Tuple[float, float]]:
+        """駅名（「駅」は省略可）の代表座標"""
+        name = station.strip()
+        if name.endswith("駅"):
+            name = name[:-1]
+        return self.stations.get(name)
+
+    def near_station(self, station: str, radius_meters: float,
+                     limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        location = self.station_location(station)
+        if location is None:
+            return []
+        return self.nearby(location[0], location[1], radius_meters, limit)
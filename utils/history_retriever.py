@@ -1,14 +1,19 @@
 # utils/history_retriever.py
-from openai import OpenAI
-import os
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from .llm_clients import get_llm_clients
+
 load_dotenv()
 
 class HistoryRetriever:
     def __init__(self, vector_store):
         self.vector_store = vector_store
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    @property
+    def openai_client(self) -> AsyncOpenAI:
+        # rephrase_query は await するので非同期クライアントを使う
+        return get_llm_clients().openai()
 
     async def rephrase_query(self, query, chat_history):
         if not chat_history:
@@ -0,0 +1,216 @@
+# utils/hotpepper_client.py
+import asyncio, json, os, re, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from .hotpepper_crawler import HOTPEPPER_BASE_URL, RETRY_STATUS
+from .rate_limit import TokenBucket
+
+# キャッシュキーに含めない（結果が変わらない）パラメータ
+IGNORED_PARAMS = {"key", "format"}
+REQUEST_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+
+
+class UpstreamError(Exception):
+    """HotPepper APIがエラーを返した・接続できなかった"""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def normalize_params(params: Dict[str, Any]) -> str:
+    """キャッシュキー（空の値を除き、空白を詰め、キーの順に並べたもの）"""
+    normalized = {}
+    for key, value in params.items():
+        if key in IGNORED_PARAMS or value is None or value == "":
+            continue
+        if isinstance(value, str):
+            value = re.sub(r"\s+", " ", value).strip()
+        elif isinstance(value, float):
+            value = round(value, 6)
+        normalized[key] = str(value)
+    return json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+
+
+class HotpepperClient:
+    """HotPepper APIの非同期クライアント（接続プール共有・TTLキャッシュ・同じ問い合わせの相乗り）
+
+    - 正規化したパラメータごとに成功した応答を ttl 秒キャッシュする（LRUで max_entries 件まで）
+    - 同じ問い合わせが実行中なら、新しく呼ばずにその結果を待つ（single-flight）
+    - 上流へのリクエストはトークンバケットで rate 回/秒に抑え、429・5xxは少し待ってリトライする
+    非同期のHTTPクライアントはイベントループごとに作る（接続は作成したループに紐づくため）。
+    """
+    def __init__(self, api_key: Optional[str] = None, base_url: str = HOTPEPPER_BASE_URL,
+                 ttl: Optional[float] = None, max_entries: int = 1024, rate: Optional[float] = None,
+                 burst: Optional[float] = None, max_connections: int = 20, max_retries: int = 2,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_key = api_key if api_key is not None else os.environ.get("HOTPEPPER_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.ttl = float(os.getenv("HOTPEPPER_CACHE_TTL", "300")) if ttl is None else ttl
+        self.max_entries = max_entries
+        self.rate = float(os.getenv("HOTPEPPER_RATE", "5")) if rate is None else rate
+        self.burst = burst if burst is not None else self.rate
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.transport = transport
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+        self._bucket: Optional[TokenBucket] = None
+        self._in_flight: Dict[str, "asyncio.Future"] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "upstream_requests": 0, "upstream_errors": 0,
+                      "retries": 0, "evictions": 0}
+
+    def _http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                transport=self.transport, timeout=REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+            self._bucket = TokenBucket(self.rate, self.burst)
+            self._in_flight = {}
+            self._loop = loop
+        return self._client
+
+    def _cached(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _remember(self, key: str, data: Dict[str, Any]) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    async def _fetch(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        client = self._http()
+        params = {**params, "key": self.api_key, "format": "json"}
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            self.stats["upstream_requests"] += 1
+            try:
+                response = await client.get(url, params=params)
+            except httpx.HTTPError as e:
+                self.stats["upstream_errors"] += 1
+                raise UpstreamError(502, f"Failed to connect to Hotpepper API: {e}") from e
+            if response.status_code == 200:
+                return self._decode(response)
+            self.stats["upstream_errors"] += 1
+            if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                raise UpstreamError(response.status_code, "Error from Hotpepper API")
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.replace(".", "", 1).isdigit():
+                self._bucket.pause(float(retry_after))
+            else:
+                await asyncio.sleep(0.2 * (2 ** attempt))
+            self.stats["retries"] += 1
+
+    def _decode(self, response: httpx.Response) -> Dict[str, Any]:
+        # HotPepper APIはパラメータ誤り・キー不正などでも200で results.error を返す（キャッシュしない）
+        try:
+            data = response.json()
+        except ValueError:
+            self.stats["upstream_errors"] += 1
+            raise UpstreamError(502, "Invalid response from Hotpepper API")
+        errors = data.get("results", {}).get("error") if isinstance(data, dict) else None
+        if errors:
+            self.stats["upstream_errors"] += 1
+            first = errors[0] if isinstance(errors, list) and isinstance(errors[0], dict) else {}
+            # 3000: パラメータ不正（呼び出し側の誤り）。それ以外（サーバー障害・キー不正）は上流の問題
+            status_code = 400 if str(first.get("code")) == "3000" else 502
+            raise UpstreamError(status_code, f"Error from Hotpepper API: {first.get('message', errors)}")
+        return data
+
+    async def get(self, endpoint: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """(APIの応答JSON, キャッシュ関連のレスポンスヘッダー) を返す"""
+        key = f"{endpoint}?{normalize_params(params)}"
+        entry = self._cached(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            expires_at, data = entry
+            age = self.ttl - (expires_at - time.monotonic())
+            return data, self._headers("HIT", expires_at, age)
+
+        self._http()
+        task = self._in_flight.get(key)
+        if task is not None:
+            # 同じ問い合わせが実行中: その結果を待つ
+            self.stats["coalesced"] += 1
+            status = "COALESCED"
+        else:
+            self.stats["misses"] += 1
+            status = "MISS"
+            # 上流の呼び出しはタスクにして、最初に呼んだリクエストがキャンセルされても待っている側には結果を返す
+            task = self._in_flight[key] = asyncio.ensure_future(self._fetch(endpoint, params))
+            task.add_done_callback(lambda done: self._finish(key, done))
+        data = await asyncio.shield(task)
+        return data, self._headers(status, time.monotonic() + self.ttl, 0)
+
+    def _finish(self, key: str, task: "asyncio.Future") -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled():
+            return
+        # 待っている側がいなくなっていても「例外が取得されなかった」警告を出さない
+        if task.exception() is None:
+            self._remember(key, task.result())
+
+    def _headers(self, status: str, expires_at: float, age: float) -> Dict[str, str]:
+        max_age = max(0, int(expires_at - time.monotonic())) if self.ttl > 0 else 0
+        return {"X-Cache": status, "Cache-Control": f"public, max-age={max_age}", "Age": str(max(0, int(age)))}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        served = self.stats["hits"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "in_flight": len(self._in_flight),
+            "ttl_seconds": self.ttl,
+            "rate_per_second": self.rate,
+            "rate_limiter": dict(self._bucket.stats) if self._bucket else None,
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_client: Optional[HotpepperClient] = None
+_client_lock = threading.Lock()
+
+
+def get_hotpepper_client() -> HotpepperClient:
+    """プロセス内で共有するクライアント（キャッシュと接続プールを共有する）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HotpepperClient()
+    return _client
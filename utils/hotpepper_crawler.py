@@ -0,0 +1,227 @@
+# utils/hotpepper_crawler.py
+import asyncio, json, logging, os, random, time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from .file_operations import write_json_sync
+from .rate_limit import TokenBucket
+
+HOTPEPPER_BASE_URL = "http://webservice.recruit.co.jp/hotpepper"
+PAGE_SIZE = 100  # gourmet APIの1回の最大取得件数
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+PageCallback = Callable[[str, str, int, List[Dict[str, Any]]], Optional[Awaitable[None]]]
+
+
+class CrawlError(Exception):
+    """リトライしても取得できなかったリクエスト"""
+
+
+class CrawlCheckpoint:
+    """エリアごとの総件数・取得済みページ・完了状態を記録するチェックポイント
+
+    {"areas": {"large_area:Z011": {"total": 12345, "pages": [1, 101, ...], "complete": false}}}
+    途中で止まっても、次回は取得済みのページを飛ばして続きから取得する。
+    """
+    def __init__(self, path: Optional[str], save_interval: float = 1.0):
+        self.path = path
+        self.save_interval = save_interval
+        self.areas: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.areas = json.load(f).get("areas", {})
+            except json.JSONDecodeError as e:
+                logger.warning(f"チェックポイントを読み込めません（最初から取得します）: {path} - {e}")
+
+    def area(self, key: str) -> Dict[str, Any]:
+        return self.areas.setdefault(key, {"total": None, "pages": [], "complete": False})
+
+    def done_pages(self, key: str) -> set:
+        return set(self.area(key)["pages"])
+
+    def set_total(self, key: str, total: int) -> None:
+        self.area(key)["total"] = total
+        self._dirty = True
+
+    def mark_page(self, key: str, start: int) -> None:
+        area = self.area(key)
+        if start not in area["pages"]:
+            area["pages"].append(start)
+            self._dirty = True
+        self.save()
+
+    def mark_complete(self, key: str) -> None:
+        area = self.area(key)
+        area["complete"] = True
+        area["pages"].sort()
+        self._dirty = True
+        self.save(force=True)
+
+    def is_complete(self, key: str) -> bool:
+        return self.area(key)["complete"]
+
+    def save(self, force: bool = False) -> None:
+        """変更があれば書き込む（ページごとに書くと多いので save_interval 秒に1回まで）"""
+        if not self.path or not self._dirty:
+            return
+        now = time.monotonic()
+        if force or now - self._saved_at >= self.save_interval:
+            write_json_sync(self.path, {"areas": self.areas})
+            self._dirty = False
+            self._saved_at = now
+
+
+class HotpepperCrawler:
+    """HotPepperグルメAPIの非同期クローラー
+
+    - 全リクエストでトークンバケットを共有し、APIの上限（rate 回/秒）を超えないようにする
+    - エリアの2ページ目以降は、最初のページで分かった総件数から一度に並行して取得する
+    - 429・5xx・通信エラーは指数バックオフでリトライ（Retry-Afterがあれば従う）
+    - 取得したページはすぐに on_page に渡し、チェックポイントに記録する
+    """
+    def __init__(self, api_key: str, base_url: str = HOTPEPPER_BASE_URL, rate: Optional[float] = None,
+                 burst: Optional[float] = None, max_concurrency: int = 8, max_retries: int = 5,
+                 backoff: float = 0.5, page_size: int = PAGE_SIZE, checkpoint_path: Optional[str] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None, timeout: float = 30.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        rate = float(os.getenv("HOTPEPPER_RATE", "5")) if rate is None else rate
+        self.bucket = TokenBucket(rate, burst if burst is not None else rate)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.page_size = page_size
+        self.checkpoint = CrawlCheckpoint(checkpoint_path)
+        self.transport = transport
+        self.timeout = timeout
+        self.client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"requests": 0, "retries": 0, "failed_pages": 0, "pages": 0, "shops": 0}
+
+    async def __aenter__(self) -> "HotpepperCrawler":
+        self.client = httpx.AsyncClient(
+            transport=self.transport, timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.checkpoint.save(force=True)
+        await self.client.aclose()
+        self.client = None
+
+    async def fetch(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """APIを呼び出してJSONを返す（リトライしても失敗したらCrawlError）"""
+        params = {**params, "key": self.api_key, "format": "json"}
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            error = None
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    response = await self.client.get(url, params=params)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    data = response.json()
+                    # 途中で切れた応答や想定外の形の応答もリトライする
+                    if isinstance(data, dict) and isinstance(data.get("results"), dict):
+                        return data
+                    error = "unexpected response body"
+                else:
+                    error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.replace(".", "", 1).isdigit():
+                    self.bucket.pause(float(retry_after))
+            except httpx.TransportError as e:
+                error = repr(e)
+            except ValueError as e:
+                error = f"invalid JSON: {e}"
+            except httpx.HTTPStatusError as e:
+                raise CrawlError(f"{endpoint} {params.get('start')}: {e}") from e
+
+            if attempt == self.max_retries:
+                raise CrawlError(f"{endpoint} failed after {attempt + 1} attempts: {error}")
+            self.stats["retries"] += 1
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            logger.warning(f"リトライ {attempt + 1}/{self.max_retries} ({error}): {delay:.1f}秒後")
+            await asyncio.sleep(delay)
+
+    async def fetch_page(self, area_code: str, area_type: str, start: int) -> Dict[str, Any]:
+        data = await self.fetch("gourmet/v1/", {area_type: area_code, "start": start, "count": self.page_size})
+        results = data["results"]
+        if "error" in results:
+            raise CrawlError(f"API error: {results['error']}")
+        try:
+            results["results_available"] = int(results.get("results_available", 0))
+        except (TypeError, ValueError) as e:
+            raise CrawlError(f"invalid results_available: {results.get('results_available')!r}") from e
+        if not isinstance(results.get("shop", []), list):
+            raise CrawlError(f"invalid shop list: {type(results['shop']).__name__}")
+        return results
+
+    async def _handle_page(self, key: str, area_code: str, area_type: str, start: int,
+                           shops: List[Dict[str, Any]], on_page: Optional[PageCallback]) -> None:
+        if on_page is not None:
+            result = on_page(area_code, area_type, start, shops)
+            if asyncio.iscoroutine(result):
+                await result
+        # ページを保存してから取得済みとして記録する（途中で落ちても取りこぼさない）
+        self.checkpoint.mark_page(key, start)
+        self.stats["pages"] += 1
+        self.stats["shops"] += len(shops)
+
+    async def crawl_area(self, area_code: str, area_type: str = "large_area",
+                         on_page: Optional[PageCallback] = None) -> bool:
+        """エリアの全ページを取得する（全ページ取得できたらTrue）"""
+        key = f"{area_type}:{area_code}"
+        if self.checkpoint.is_complete(key):
+            logger.info(f"エリア {area_code} は取得済み（チェックポイント）")
+            return True
+
+        done = self.checkpoint.done_pages(key)
+        total = self.checkpoint.area(key)["total"]
+        if total is None or 1 not in done:
+            try:
+                first = await self.fetch_page(area_code, area_type, 1)
+            except CrawlError as e:
+                logger.error(f"店舗情報の取得に失敗: {area_type}={area_code} - {e}")
+                self.stats["failed_pages"] += 1
+                return False
+            total = int(first.get("results_available", 0))
+            self.checkpoint.set_total(key, total)
+            await self._handle_page(key, area_code, area_type, 1, first.get("shop", []), on_page)
+            done.add(1)
+        logger.info(f"エリア {area_code} の総店舗数: {total}")
+
+        async def page(start: int) -> bool:
+            try:
+                results = await self.fetch_page(area_code, area_type, start)
+            except CrawlError as e:
+                logger.error(f"店舗情報の取得に失敗: {area_type}={area_code} start={start} - {e}")
+                self.stats["failed_pages"] += 1
+                return False
+            await self._handle_page(key, area_code, area_type, start, results.get("shop", []), on_page)
+            return True
+
+        starts = [start for start in range(1, total + 1, self.page_size) if start not in done]
+        results = await asyncio.gather(*(page(start) for start in starts))
+        if all(results):
+            self.checkpoint.mark_complete(key)
+            return True
+        self.checkpoint.save(force=True)
+        return False
+
+    async def crawl(self, area_codes: Iterable[str], area_type: str = "large_area",
+                    on_page: Optional[PageCallback] = None) -> Dict[str, bool]:
+        """複数エリアを並行して取得する（並行数とレートはエリアをまたいで共有）"""
+        codes = list(area_codes)
+        results = await asyncio.gather(*(self.crawl_area(code, area_type, on_page) for code in codes))
+        return dict(zip(codes, results))
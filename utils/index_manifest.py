@@ -0,0 +1,49 @@
+# utils/index_manifest.py
+import hashlib, json, os
+from typing import Dict, Iterable, List, Tuple
+
+
+class IndexManifest:
+    """インデックス済みの店舗IDと、埋め込みテキストのハッシュの対応表
+
+    再インデックス時にテキストが変わった店舗だけを埋め込み直すために使う。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.hashes = json.load(f)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def is_current(self, restaurant_id: str, text: str) -> bool:
+        return self.hashes.get(restaurant_id) == self.text_hash(text)
+
+    def update(self, stored: Iterable[Tuple[str, str]]) -> None:
+        """(id, 埋め込みテキスト) のペアを記録"""
+        for restaurant_id, text in stored:
+            self.hashes[restaurant_id] = self.text_hash(text)
+
+    def remove(self, restaurant_ids: Iterable[str]) -> None:
+        for restaurant_id in restaurant_ids:
+            self.hashes.pop(restaurant_id, None)
+
+    def missing_from(self, seen_ids: Iterable[str]) -> List[str]:
+        """今回のカタログに含まれていない（削除された）店舗ID"""
+        seen = set(seen_ids)
+        return [restaurant_id for restaurant_id in self.hashes if restaurant_id not in seen]
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,161 @@
+# utils/jsonl_log.py
+import asyncio, json, os, threading, time
+from typing import Any, Dict, List, Optional
+
+# fsyncの方針: always=追記のたび / interval=FSYNC_INTERVAL秒に1回まで / never=OSに任せる
+FSYNC_POLICIES = ("always", "interval", "never")
+FSYNC_INTERVAL = 1.0
+TAIL_BLOCK_SIZE = 8192
+
+
+class JsonlLog:
+    """1行に1件のJSONを追記していく履歴ファイル（JSON Lines）
+
+    JSON配列を毎回書き直す代わりに、メッセージごとに1行追記するだけにする。
+    末尾のN件はファイルの後ろからブロック単位で読むので、ファイル全体は解析しない。
+    max_entries を指定すると、compact_every 件追記するごとに古い行を捨てて書き直す（コンパクション）。
+    """
+    def __init__(self, path: str, fsync: Optional[str] = None, max_entries: Optional[int] = None,
+                 compact_every: int = 500):
+        self.path = path
+        self.fsync = (fsync or os.getenv("CHAT_LOG_FSYNC", "interval")).lower()
+        if self.fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}: {self.fsync}")
+        self.max_entries = max_entries
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._appended = 0
+        self._last_fsync = 0.0
+        self.stats = {"appends": 0, "fsyncs": 0, "compactions": 0, "skipped_lines": 0}
+
+    # --- 書き込み ---
+
+    def append_many_sync(self, entries: List[Dict[str, Any]]) -> None:
+        if not entries:
+            return
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        with self._lock:
+            with open(self.path, "a+b") as f:
+                # 前回が行の途中で落ちていたら改行を足し、壊れた行と新しい行がつながらないようにする
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        data = b"\n" + data
+                f.write(data)
+                f.flush()
+                now = time.monotonic()
+                if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= FSYNC_INTERVAL):
+                    os.fsync(f.fileno())
+                    self._last_fsync = now
+                    self.stats["fsyncs"] += 1
+            self.stats["appends"] += len(entries)
+            self._appended += len(entries)
+            if self.max_entries and self._appended >= self.compact_every:
+                self._compact(self.max_entries)
+
+    async def append(self, entry: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.append_many_sync, [entry])
+
+    async def append_many(self, entries: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self.append_many_sync, entries)
+
+    # --- 読み込み ---
+
+    def _parse(self, lines: List[bytes]) -> List[Dict[str, Any]]:
+        entries = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # 書き込み途中で落ちたときの壊れた行は読み飛ばす
+                self.stats["skipped_lines"] += 1
+        return entries
+
+    def tail_sync(self, count: int) -> List[Dict[str, Any]]:
+        """末尾のcount件（古い順）"""
+        if count <= 0 or not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b""
+            # count+1行目の改行が見つかるまで後ろからブロック単位で読む
+            while position > 0 and buffer.count(b"\n") <= count:
+                size = min(TAIL_BLOCK_SIZE, position)
+                position -= size
+                f.seek(position)
+                buffer = f.read(size) + buffer
+        lines = buffer.split(b"\n")
+        if position > 0:
+            lines = lines[1:]
+        return self._parse(lines)[-count:]
+
+    def read_all_sync(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            return self._parse(f.read().split(b"\n"))
+
+    async def tail(self, count: int) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.tail_sync, count)
+
+    async def read_all(self) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.read_all_sync)
+
+    # --- コンパクション ---
+
+    def _compact(self, keep_last: Optional[int]) -> None:
+        # 呼び出し側で self._lock を取っていること
+        entries = self.tail_sync(keep_last) if keep_last else self.read_all_sync()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._appended = 0
+        self.stats["compactions"] += 1
+
+    def compact_sync(self, keep_last: Optional[int] = None) -> None:
+        """壊れた行を除き、keep_last 件（省略時は max_entries 件）だけ残して書き直す"""
+        with self._lock:
+            self._compact(keep_last or self.max_entries)
+
+    async def compact(self, keep_last: Optional[int] = None) -> None:
+        await asyncio.to_thread(self.compact_sync, keep_last)
+
+    async def clear(self) -> None:
+        def clear():
+            with self._lock:
+                open(self.path, "wb").close()
+                self._appended = 0
+        await asyncio.to_thread(clear)
+
+    def import_json_array(self, json_path: str) -> int:
+        """従来のJSON配列のファイルを取り込む（ログがまだないときの移行用）"""
+        if os.path.exists(self.path) or not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            return 0
+        entries = entries if isinstance(entries, list) else []
+        self.append_many_sync(entries)
+        return len(entries)
+
+
+_logs: Dict[str, JsonlLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_jsonl_log(path: str, **options) -> JsonlLog:
+    """同じパスには同じインスタンス（＝同じロック）を返す"""
+    key = os.path.abspath(path)
+    with _logs_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = _logs[key] = JsonlLog(path, **options)
+        return log
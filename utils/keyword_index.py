@@ -0,0 +1,189 @@
+# utils/keyword_index.py
+import math, re, unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+from .compact_catalog import CompactCatalog
+
+# キーワード検索の対象（HotPepper APIのキーワード検索と同じく、店名・キャッチ・ジャンル・住所・駅）
+KEYWORD_FIELDS = ("name", "name_kana", "catch", "address", "station_name")
+KEYWORD_CODED_FIELDS = (("genre", "name"), ("genre", "catch"))
+# BM25の対象と重み（店名・読み・駅の一致を、説明文中の一致より重く数える）
+BM25_FIELDS = (("name", 3.0), ("name_kana", 2.0), ("station_name", 2.0), ("catch", 1.0), ("genre.catch", 1.0),
+               ("access", 1.0), ("other_memo", 1.0), ("shop_detail_memo", 1.0))
+_KATAKANA = re.compile(r"[\u30a1-\u30f6]")
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def to_hiragana(text: str) -> str:
+    """カタカナをひらがなにする（「ラーメン」で読みの「らーめん」にも一致させる）"""
+    return _KATAKANA.sub(lambda match: chr(ord(match.group()) - 0x60), text)
+
+
+def normalize(text: str) -> str:
+    """全角・半角、大文字・小文字、カタカナ・ひらがなの違いをなくす（KeywordIndex・BM25Index共通）"""
+    return to_hiragana(unicodedata.normalize("NFKC", text or "").lower())
+
+
+def ngrams(text: str, n: int = 2) -> Iterable[str]:
+    """正規化済みテキストの文字 n-gram（記号・空白をまたぐものは作らない）"""
+    for part in _SEPARATORS.split(text):
+        for i in range(len(part) - n + 1):
+            yield part[i:i + n]
+
+
+def tokenize(text: str) -> List[str]:
+    """BM25用の語（ngrams と同じ文字2-gram。1文字だけの部分はそのまま1語にする）"""
+    tokens = []
+    for part in _SEPARATORS.split(normalize(text)):
+        if len(part) == 1:
+            tokens.append(part)
+        else:
+            tokens.extend(ngrams(part))
+    return tokens
+
+
+def record_text(record) -> str:
+    """店舗の検索対象のテキスト（正規化済み、項目の間は空白）"""
+    parts = [record.get(field) or "" for field in KEYWORD_FIELDS]
+    for field, key in KEYWORD_CODED_FIELDS:
+        value = record.get(field)
+        if isinstance(value, dict):
+            parts.append(value.get(key) or "")
+    return normalize(" ".join(str(part) for part in parts))
+
+
+class KeywordIndex:
+    """店舗テキストの文字2-gram転置インデックス（日本語は分かち書きしないので n-gram で引く）
+
+    2-gram の転置リストの共通部分で候補を絞ってから、テキストに部分文字列として含まれるかを確かめる。
+    1文字のキーワードは2-gramで引けないので、候補の中から部分一致で探す。
+    確認用のテキストは正規化済みのUTF-8で行ごとに持つ（店舗の長文を毎回展開しないため）。
+    """
+    def __init__(self, table: CompactCatalog):
+        self.table = table
+        self.texts: List[bytes] = []
+        postings: Dict[str, List[int]] = {}
+        for row in range(len(table)):
+            text = record_text(table.record(row))
+            self.texts.append(text.encode("utf-8"))
+            for gram in set(ngrams(text)):
+                postings.setdefault(gram, []).append(row)
+        # 行番号は昇順に入るので、そのまま整数配列にして小さく持つ
+        self.postings: Dict[str, array] = {gram: array("i", rows) for gram, rows in postings.items()}
+
+    def _candidates(self, word: str) -> Optional[List[int]]:
+        grams = set(ngrams(word))
+        if not grams:
+            return None
+        lists = sorted((self.postings.get(gram, array("i")) for gram in grams), key=len)
+        rows = set(lists[0])
+        for other in lists[1:]:
+            if not rows:
+                break
+            rows.intersection_update(other)
+        return sorted(rows)
+
+    def search(self, keyword: str, rows: Optional[Sequence[int]] = None) -> List[int]:
+        """空白区切りの全ての語を含む店舗の行番号（カタログ順）。rows を渡すとその中だけを探す"""
+        words = normalize(keyword).split()
+        if not words:
+            return list(range(len(self.table))) if rows is None else sorted(rows)
+        candidates = None if rows is None else set(rows)
+        for word in sorted(words, key=len, reverse=True):
+            found = self._candidates(word)
+            if found is not None:
+                candidates = set(found) if candidates is None else candidates.intersection(found)
+        pool = sorted(candidates) if candidates is not None else range(len(self.table))
+        encoded = [word.encode("utf-8") for word in words]
+        texts = self.texts
+        return [row for row in pool if all(word in texts[row] for word in encoded)]
+
+
+def _field_text(record, field: str) -> str:
+    if "." in field:
+        parent, key = field.split(".", 1)
+        value = record.get(parent)
+        return str(value.get(key) or "") if isinstance(value, dict) else ""
+    value = record.get(field)
+    return str(value) if value else ""
+
+
+class BM25Index:
+    """店名・読み・キャッチ・アクセス・メモの文字2-gramに対するBM25のインデックス
+
+    語ごとに (行番号の配列, スコアへの寄与の配列) を前計算しておき、検索はクエリの語の配列を足すだけにする。
+    語の出現回数は項目ごとにその項目の平均の長さで正規化してから重み（BM25_FIELDS）を掛けて足す（BM25F）。
+    長いメモがあるだけで、駅名や店名での一致が弱くならないようにするため。
+    """
+    def __init__(self, table: CompactCatalog, k1: float = 1.2, b: float = 0.75):
+        self.table = table
+        self.k1, self.b = k1, b
+        total = len(table)
+        tokens = [[tokenize(_field_text(table.record(row), field)) for field, _ in BM25_FIELDS]
+                  for row in range(total)]
+        averages = [max(1.0, sum(len(fields[i]) for fields in tokens) / total) if total else 1.0
+                    for i in range(len(BM25_FIELDS))]
+
+        rows_by_term: Dict[str, List[int]] = {}
+        tfs_by_term: Dict[str, List[float]] = {}
+        for row, fields in enumerate(tokens):
+            counts: Counter = Counter()
+            for (_, weight), field_tokens, average in zip(BM25_FIELDS, fields, averages):
+                if not field_tokens:
+                    continue
+                scale = weight / (1 - b + b * len(field_tokens) / average)
+                for token in field_tokens:
+                    counts[token] += scale
+            for token, tf in counts.items():
+                rows_by_term.setdefault(token, []).append(row)
+                tfs_by_term.setdefault(token, []).append(tf)
+
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for token, rows in rows_by_term.items():
+            tf = np.asarray(tfs_by_term[token], dtype=np.float32)
+            idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            self.postings[token] = (np.asarray(rows, dtype=np.int32),
+                                    (idf * tf * (k1 + 1) / (tf + k1)).astype(np.float32))
+
+    def search(self, query: str, limit: int = 10, rows: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """(行番号, スコア) のスコア順。rows を渡すとその中だけを返す"""
+        terms = Counter(tokenize(query))
+        scores = np.zeros(len(self.table), dtype=np.float32)
+        for term, count in terms.items():
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1] * count
+        if rows is not None:
+            allowed = np.zeros(len(self.table), dtype=bool)
+            allowed[np.asarray(list(rows), dtype=np.int64)] = True
+            scores[~allowed] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) > limit:
+            hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(row), float(scores[row])) for row in hits]
+
+    def search_ids(self, query: str, limit: int = 10,
+                   candidate_ids: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """(店舗ID, スコア) のスコア順。candidate_ids を渡すとその店舗の中だけを返す"""
+        rows = None
+        if candidate_ids is not None:
+            row_by_id = self.table.row_by_id
+            rows = [row_by_id[shop_id] for shop_id in candidate_ids if shop_id in row_by_id]
+            if not rows:
+                return []
+        return [(self.table.record(row)["id"], score) for row, score in self.search(query, limit, rows)]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """複数の検索結果の順位を Reciprocal Rank Fusion でまとめる（スコアの尺度が違っても使える）"""
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
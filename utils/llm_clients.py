@@ -0,0 +1,272 @@
+# utils/llm_clients.py
+import asyncio, os, threading, time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+import httpx
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    # SDKの読み込みは重い（合わせて数秒）ので、最初にクライアントを作るときまで遅らせる
+    from anthropic import AsyncAnthropic
+    from openai import AsyncOpenAI, OpenAI
+
+load_dotenv()
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# プロバイダーごとの接続プール設定（環境変数 LLM_POOL_<NAME>_MAX / _KEEPALIVE で変更可）
+PROVIDERS: Dict[str, Dict[str, Any]] = {
+    "openai": {"api_key_env": "OPENAI_API_KEY", "base_url": None, "max_connections": 50, "max_keepalive": 20},
+    "openrouter": {"api_key_env": "OPENROUTER_API_KEY", "base_url": OPENROUTER_BASE_URL,
+                   "max_connections": 50, "max_keepalive": 20},
+    "anthropic": {"api_key_env": "ANTHROPIC_API_KEY", "base_url": None, "max_connections": 20, "max_keepalive": 10},
+}
+KEEPALIVE_EXPIRY_SECONDS = 30.0
+REQUEST_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+
+def http2_available() -> bool:
+    """httpxのHTTP/2にはh2パッケージが必要（なければHTTP/1.1のkeep-aliveで動く）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _Meter:
+    """プロバイダーごとのリクエスト数・実行中の数・エラー数・応答ヘッダーまでの時間
+
+    同期クライアントは複数のスレッドから使われるので、カウンターはロックを取って更新する。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "in_flight": 0, "errors": 0, "total_latency_ms": 0.0, "pools_created": 0}
+
+    def start(self) -> float:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+        return time.perf_counter()
+
+    def finish(self, started_at: float, failed: bool) -> None:
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        with self._lock:
+            self.stats["in_flight"] -= 1
+            self.stats["total_latency_ms"] += elapsed_ms
+            if failed:
+                self.stats["errors"] += 1
+
+    def pool_created(self) -> None:
+        with self._lock:
+            self.stats["pools_created"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+
+class _MeteredAsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncHTTPTransport, meter: _Meter):
+        self.inner = inner
+        self.meter = meter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started_at, failed = self.meter.start(), True
+        try:
+            response = await self.inner.handle_async_request(request)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self.meter.finish(started_at, failed)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    def __init__(self, inner: httpx.HTTPTransport, meter: _Meter):
+        self.inner = inner
+        self.meter = meter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started_at, failed = self.meter.start(), True
+        try:
+            response = self.inner.handle_request(request)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self.meter.finish(started_at, failed)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class LLMClientRegistry:
+    """プロセスで共有するLLMクライアント（プロバイダーごとに1つの接続プール）
+
+    リクエストのたびにクライアントを作ると接続プールとTLSハンドシェイクが毎回やり直しになるので、
+    各モジュールはここからクライアントを取得する。アプリ終了時に aclose() で閉じる。
+    非同期のクライアントはイベントループごとに作る（接続は作成したループに紐づくため）。
+    """
+    def __init__(self):
+        self.http2 = http2_available()
+        self._lock = threading.Lock()
+        self._async_http: Dict[str, httpx.AsyncClient] = {}
+        self._async_loops: Dict[str, Any] = {}
+        self._sync_http: Dict[str, httpx.Client] = {}
+        self._clients: Dict[str, Any] = {}
+        self._closing: set = set()
+        self.meters: Dict[str, _Meter] = {name: _Meter() for name in PROVIDERS}
+
+    # --- 接続プール ---
+
+    def _limits(self, provider: str) -> httpx.Limits:
+        config = PROVIDERS[provider]
+        prefix = f"LLM_POOL_{provider.upper()}"
+        return httpx.Limits(
+            max_connections=int(os.getenv(f"{prefix}_MAX", config["max_connections"])),
+            max_keepalive_connections=int(os.getenv(f"{prefix}_KEEPALIVE", config["max_keepalive"])),
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        )
+
+    def async_http(self, provider: str) -> httpx.AsyncClient:
+        """プロバイダー用の非同期HTTPクライアント（実行中のイベントループごとに1つ）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            client = self._async_http.get(provider)
+            previous_loop = self._async_loops.get(provider)
+            if client is None or client.is_closed or (loop is not None and previous_loop not in (None, loop)):
+                if client is not None and not client.is_closed:
+                    self._close_replaced(client, previous_loop, loop)
+                transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self._limits(provider))
+                client = httpx.AsyncClient(
+                    transport=_MeteredAsyncTransport(transport, self.meters[provider]),
+                    timeout=REQUEST_TIMEOUT, follow_redirects=True,
+                )
+                self._async_http[provider] = client
+                self._clients = {key: value for key, value in self._clients.items() if key != provider}
+                self.meters[provider].pool_created()
+            if loop is not None:
+                self._async_loops[provider] = loop
+            return client
+
+    def _close_replaced(self, client: httpx.AsyncClient, old_loop, loop) -> None:
+        """別のループ用に作り直したクライアントの接続プールを閉じる（ソケットを残さない）"""
+        if old_loop is not None and old_loop.is_running():
+            # 接続は作成したループでしか閉じられないので、そのループに頼む
+            asyncio.run_coroutine_threadsafe(client.aclose(), old_loop)
+        elif loop is not None:
+            # 元のループはもう終わっている: 今のループでソケットを閉じる（失敗しても無視する）
+            task = loop.create_task(client.aclose())
+            self._closing.add(task)
+            task.add_done_callback(lambda done: (self._closing.discard(done), done.cancelled() or done.exception()))
+
+    def sync_http(self, provider: str) -> httpx.Client:
+        """同期処理（埋め込みの一括作成などスレッドから呼ぶもの）用のHTTPクライアント"""
+        with self._lock:
+            client = self._sync_http.get(provider)
+            if client is None or client.is_closed:
+                transport = httpx.HTTPTransport(http2=self.http2, limits=self._limits(provider))
+                client = self._sync_http[provider] = httpx.Client(
+                    transport=_MeteredTransport(transport, self.meters[provider]),
+                    timeout=REQUEST_TIMEOUT, follow_redirects=True,
+                )
+            return client
+
+    # --- SDKクライアント ---
+
+    def _sdk_client(self, provider: str, factory) -> Any:
+        http_client = self.async_http(provider)
+        with self._lock:
+            client = self._clients.get(provider)
+            if client is None:
+                client = self._clients[provider] = factory(http_client)
+            return client
+
+    def openai(self) -> "AsyncOpenAI":
+        from openai import AsyncOpenAI
+        return self._sdk_client("openai", lambda http_client: AsyncOpenAI(
+            api_key=os.getenv(PROVIDERS["openai"]["api_key_env"]), http_client=http_client))
+
+    def openrouter(self) -> "AsyncOpenAI":
+        from openai import AsyncOpenAI
+        return self._sdk_client("openrouter", lambda http_client: AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL, api_key=os.getenv(PROVIDERS["openrouter"]["api_key_env"]),
+            http_client=http_client))
+
+    def anthropic(self) -> "AsyncAnthropic":
+        from anthropic import AsyncAnthropic
+        return self._sdk_client("anthropic", lambda http_client: AsyncAnthropic(
+            api_key=os.getenv(PROVIDERS["anthropic"]["api_key_env"]), http_client=http_client))
+
+    def openai_sync(self) -> "OpenAI":
+        with self._lock:
+            client = self._clients.get("openai_sync")
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=os.getenv(PROVIDERS["openai"]["api_key_env"]), http_client=self.sync_http("openai"))
+            with self._lock:
+                client = self._clients.setdefault("openai_sync", client)
+        return client
+
+    def langchain_http_clients(self) -> Dict[str, Any]:
+        """ChatOpenAI(http_client=..., http_async_client=...) に渡す共有クライアント"""
+        return {"http_client": self.sync_http("openai"), "http_async_client": self.async_http("openai")}
+
+    # --- 統計・終了処理 ---
+
+    @staticmethod
+    def _pool_connections(client: Any) -> Optional[int]:
+        # httpcoreの内部状態から開いている接続数を読む（取れない場合はNone）
+        transport = getattr(getattr(client, "_transport", None), "inner", None)
+        pool = getattr(transport, "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        providers = {}
+        for name, meter in self.meters.items():
+            stats = meter.snapshot()
+            completed = stats["requests"] - stats["in_flight"]
+            providers[name] = {
+                **stats,
+                "avg_latency_ms": round(stats["total_latency_ms"] / completed, 1) if completed else 0.0,
+                "total_latency_ms": round(stats["total_latency_ms"], 1),
+                "open_connections": self._pool_connections(self._async_http.get(name)),
+                "open_sync_connections": self._pool_connections(self._sync_http.get(name)),
+                "max_connections": self._limits(name).max_connections,
+            }
+        return {"http2": self.http2, "providers": providers}
+
+    async def aclose(self) -> None:
+        with self._lock:
+            async_clients = list(self._async_http.values())
+            sync_clients = list(self._sync_http.values())
+            self._async_http.clear()
+            self._async_loops.clear()
+            self._sync_http.clear()
+            self._clients.clear()
+        for client in async_clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"Error closing LLM client: {e}")
+        for client in sync_clients:
+            client.close()
+
+
+_registry: Optional[LLMClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_clients() -> LLMClientRegistry:
+    """プロセス内で共有するクライアントレジストリ"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LLMClientRegistry()
+    return _registry
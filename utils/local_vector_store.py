@@ -0,0 +1,242 @@
+# utils/local_vector_store.py
+import json, os, threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+from .embedding_cache import EmbeddingCache
+from .vector_store import BaseVectorStore, EMBEDDING_DIMENSION
+
+EMBEDDINGS_FILE = "embeddings.npy"
+IDS_FILE = "ids.json"
+METADATA_FILE = "metadata.json"
+CENTROIDS_FILE = "ivf_centroids.npy"
+ASSIGNMENTS_FILE = "ivf_assignments.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+class LocalMatch:
+    """Pineconeのマッチと同じように match['id'] / match.score で参照できる検索結果"""
+    __slots__ = ("id", "score", "metadata")
+
+    def __init__(self, id: str, score: float, metadata: Dict[str, Any]):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return f"LocalMatch(id={self.id!r}, score={self.score:.4f})"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorStore(BaseVectorStore):
+    """プロセス内で動くベクトルストア（VectorStoreと同じインターフェース）
+
+    埋め込みは正規化したfloat32のNumPy行列で保持し、コサイン類似度のtop-kを計算する。
+    IVFインデックス（build_ivf）があればクラスタを絞ってから検索する。
+    """
+    def __init__(self, index_dir: Optional[str] = None, mmap: bool = True, autosave: bool = True, nprobe: int = 8,
+                 embedding_cache: EmbeddingCache = None):
+        super().__init__(embedding_cache)
+        self.index_dir = index_dir or os.getenv("LOCAL_VECTOR_INDEX_DIR", "vector_index")
+        self.mmap = mmap
+        self.autosave = autosave
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.row_by_id: Dict[str, int] = {}
+        # 行数より大きめに確保したバッファ（追加のたびに行列全体をコピーしないため）
+        self._buffer = np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+        self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._buffer[:len(self.ids)]
+
+    def _ensure_writable(self, extra_rows: int) -> None:
+        needed = len(self.ids) + extra_rows
+        if self._buffer.flags.writeable and len(self._buffer) >= needed:
+            return
+        # メモリマップは読み取り専用なので、書き込み時はメモリ上にコピーする
+        capacity = max(needed, len(self._buffer) * 2, 1024)
+        buffer = np.empty((capacity, EMBEDDING_DIMENSION), dtype=np.float32)
+        buffer[:len(self.ids)] = self.matrix
+        self._buffer = buffer
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._path(EMBEDDINGS_FILE)):
+            return
+        with open(self._path(IDS_FILE), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        with open(self._path(METADATA_FILE), "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self._buffer = np.load(self._path(EMBEDDINGS_FILE), mmap_mode="r" if self.mmap else None)
+        self.row_by_id = {restaurant_id: row for row, restaurant_id in enumerate(self.ids)}
+
+        if os.path.exists(self._path(CENTROIDS_FILE)) and os.path.exists(self._path(ASSIGNMENTS_FILE)):
+            self.centroids = np.load(self._path(CENTROIDS_FILE))
+            self.assignments = np.load(self._path(ASSIGNMENTS_FILE))
+            if len(self.assignments) != len(self.ids):
+                self.centroids = self.assignments = None
+        print(f"Local vector index loaded: {len(self.ids)} vectors from {self.index_dir}")
+
+    def save(self) -> None:
+        """インデックスをディスクに保存（一時ファイルに書いてから置き換える）"""
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            tmp = self._path(EMBEDDINGS_FILE + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+            os.replace(tmp, self._path(EMBEDDINGS_FILE))
+            for name, data in ((IDS_FILE, self.ids), (METADATA_FILE, self.metadata)):
+                tmp = self._path(name + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp, self._path(name))
+
+            if self.centroids is not None and self.assignments is not None:
+                np.save(self._path(CENTROIDS_FILE), self.centroids)
+                np.save(self._path(ASSIGNMENTS_FILE), self.assignments)
+            else:
+                for name in (CENTROIDS_FILE, ASSIGNMENTS_FILE):
+                    if os.path.exists(self._path(name)):
+                        os.remove(self._path(name))
+
+    def _upsert(self, vectors):
+        if not vectors:
+            return
+        with self._lock:
+            new_rows = _normalize(np.asarray([vector for _, vector, _ in vectors], dtype=np.float32))
+            self._ensure_writable(len(vectors))
+            if any(restaurant_id in self.row_by_id for restaurant_id, _, _ in vectors):
+                # 既存の行を書き換えるときはコピーに書いてから参照を差し替える
+                # （ロック外でスコアを計算中の検索が、書きかけのベクトルを読まないように）
+                self._buffer = self._buffer.copy()
+                self.metadata = list(self.metadata)
+            for (restaurant_id, _, metadata), row_vector in zip(vectors, new_rows):
+                row = self.row_by_id.get(restaurant_id)
+                if row is None:
+                    row = len(self.ids)
+                    self.row_by_id[restaurant_id] = row
+                    self.ids.append(restaurant_id)
+                    self.metadata.append(metadata)
+                else:
+                    self.metadata[row] = metadata
+                self._buffer[row] = row_vector
+            # 行が変わったのでIVFは作り直しが必要
+            self.centroids = self.assignments = None
+            if self.autosave:
+                self.save()
+
+    def _delete(self, restaurant_ids):
+        remove = set(restaurant_ids)
+        with self._lock:
+            keep = [row for row, restaurant_id in enumerate(self.ids) if restaurant_id not in remove]
+            if len(keep) == len(self.ids):
+                return
+            self._buffer = np.array(self._buffer[keep], dtype=np.float32)
+            self.ids = [self.ids[row] for row in keep]
+            self.metadata = [self.metadata[row] for row in keep]
+            self.row_by_id = {restaurant_id: row for row, restaurant_id in enumerate(self.ids)}
+            self.centroids = self.assignments = None
+            if self.autosave:
+                self.save()
+
+    def default_manifest_path(self):
+        return self._path(MANIFEST_FILE)
+
+    def store_restaurants(self, restaurants, *args, **kwargs):
+        # 一括登録中はバッチごとに保存せず、チェックポイントのタイミングでまとめて保存する
+        autosave, self.autosave = self.autosave, False
+        try:
+            return super().store_restaurants(restaurants, *args, **kwargs)
+        finally:
+            self.autosave = autosave
+
+    def _flush(self):
+        self.save()
+
+    def _query(self, vector, top_k, candidate_ids=None):
+        with self._lock:
+            # 既存の行を書き換えるときは _upsert がバッファをコピーしてから差し替えるので、
+            # ここで取った参照の先頭n行はロック外でも変わらない（追加は n 行目より後に書かれる）
+            n = len(self.ids)
+            matrix, ids, metadata = self._buffer[:n], self.ids, self.metadata
+            centroids, assignments = self.centroids, self.assignments
+            if candidate_ids is not None:
+                row_by_id = self.row_by_id
+                candidate_rows = np.fromiter(
+                    (row_by_id[i] for i in candidate_ids if i in row_by_id), dtype=np.int64
+                )
+        if n == 0:
+            return []
+
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        if candidate_ids is not None:
+            # 候補が決まっている場合は、その行だけを全件スコアリングする
+            rows = np.sort(candidate_rows)
+            if len(rows) == 0:
+                return []
+        elif centroids is not None:
+            probe = np.argsort(centroids @ query)[::-1][:self.nprobe]
+            rows = np.flatnonzero(np.isin(assignments, probe))
+            if len(rows) < top_k:
+                rows = np.arange(n)
+        else:
+            rows = None
+
+        scores = matrix @ query if rows is None else matrix[rows] @ query
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            result_rows, result_scores = rows[top], scores[top]
+        else:
+            result_rows, result_scores = top, scores[top]
+        return [
+            LocalMatch(ids[row], float(score), metadata[row])
+            for row, score in zip(result_rows, result_scores)
+        ]
+
+    def build_ivf(self, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        """球面k-meansでIVFインデックスを作成（件数が多いカタログ向け）"""
+        with self._lock:
+            matrix = np.asarray(self.matrix, dtype=np.float32)
+            n = len(matrix)
+            if n == 0:
+                return
+            nlist = min(nlist or max(1, int(np.sqrt(n))), n)
+            rng = np.random.default_rng(seed)
+            centroids = matrix[rng.choice(n, nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = np.argmax(matrix @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = matrix[assignments == c]
+                    if len(members):
+                        centroids[c] = members.sum(axis=0)
+                centroids = _normalize(centroids)
+            self.centroids = centroids.astype(np.float32)
+            self.assignments = np.argmax(matrix @ self.centroids.T, axis=1).astype(np.int32)
+            if self.autosave:
+                self.save()
+            print(f"IVF index built: {nlist} lists over {n} vectors")
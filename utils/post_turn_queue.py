@@ -0,0 +1,71 @@
+# utils/post_turn_queue.py
+import asyncio, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class PostTurnQueue:
+    """レスポンス送信後の処理（要約・履歴更新など）を実行するプロセス内ジョブキュー
+
+    同じセッションのジョブは投入順に1つずつ実行し、異なるセッション同士は並行に動く。
+    次のターンは wait_idle() で前ターンのジョブ完了を待ってから状態を読む。
+    """
+    def __init__(self, max_wait: float = 30.0):
+        self.max_wait = max_wait
+        self._jobs: Dict[str, Deque[Job]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._idle: Dict[str, asyncio.Event] = {}
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "wait_timeouts": 0}
+
+    def submit(self, key: str, job: Job) -> None:
+        """ジョブを投入（awaitせずにすぐ戻る）"""
+        self._jobs.setdefault(key, deque()).append(job)
+        self._idle.setdefault(key, asyncio.Event()).clear()
+        self.stats["submitted"] += 1
+
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: str) -> None:
+        jobs = self._jobs[key]
+        try:
+            while jobs:
+                job = jobs.popleft()
+                start = time.perf_counter()
+                try:
+                    await job()
+                    self.stats["completed"] += 1
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    print(f"Post-turn job error ({key}): {e}")
+                finally:
+                    print(f"⏱️ [post-turn:{key}] job={(time.perf_counter() - start) * 1000:.0f}ms")
+        finally:
+            # キューが空になったらワーカーを終了（アイドルなセッションのタスクを残さない）
+            self._workers.pop(key, None)
+            self._jobs.pop(key, None)
+            self._idle.pop(key).set()
+
+    def pending(self, key: str) -> int:
+        return len(self._jobs.get(key, ())) + (1 if key in self._workers else 0)
+
+    async def wait_idle(self, key: str, timeout: Optional[float] = None) -> bool:
+        """セッションの未完了ジョブが全て終わるまで待つ（タイムアウト時はFalse）"""
+        event = self._idle.get(key)
+        if event is None:
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout or self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            self.stats["wait_timeouts"] += 1
+            print(f"Post-turn jobs for {key} still running after {timeout or self.max_wait}s")
+            return False
+
+    async def shutdown(self) -> None:
+        """シャットダウン時に残っているジョブを全て完了させる"""
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,45 @@
+# utils/rate_limit.py
+import asyncio, time
+from typing import Dict
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（非同期）
+
+    rate 個/秒でトークンが貯まり、最大 capacity 個まで貯められる（その分だけバーストを許す）。
+    acquire() はトークンが貯まるまで待ってから1つ消費する。
+    """
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive: {rate}")
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = None
+        self.stats: Dict[str, float] = {"acquired": 0, "waited": 0, "wait_seconds": 0.0}
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # 待つ順番を守るためロックの中で待つ（後から来たものが先に取らない）
+        async with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                wait = (tokens - self._tokens) / self.rate
+                self.stats["waited"] += 1
+                self.stats["wait_seconds"] += wait
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= tokens
+            self.stats["acquired"] += 1
+
+    def pause(self, seconds: float) -> None:
+        """サーバーから待つよう指示されたとき（429のRetry-Afterなど）に、その間トークンを空にする"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - seconds * self.rate
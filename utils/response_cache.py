@@ -0,0 +1,166 @@
+# utils/response_cache.py
+import hashlib, json, os, re, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+# 1Mトークンあたりの料金（USD）。キャッシュで節約できた額の目安に使う
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+# キーに含めない（毎ターン変わるがプロンプトの意味は変わらない）項目
+IGNORED_PREFERENCE_KEYS = {"last_updated"}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "")).strip().lower()
+
+
+class CachedResponse:
+    __slots__ = ("content", "created_at", "context_key", "embedding", "prompt_tokens", "completion_tokens",
+                 "cost_usd", "hits")
+
+    def __init__(self, content: str, context_key: str, embedding: Optional[np.ndarray],
+                 prompt_tokens: int, completion_tokens: int, cost_usd: float):
+        self.content = content
+        self.created_at = time.time()
+        self.context_key = context_key
+        self.embedding = embedding
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cost_usd = cost_usd
+        self.hits = 0
+
+
+class ResponseCache:
+    """おすすめ文（gpt-4.1）の生成結果のキャッシュ
+
+    - 完全一致: 正規化した会話要約・希望条件・候補店舗IDのハッシュ
+    - 意味的な一致: 希望条件と候補店舗が同じで、要約の埋め込みのコサイン類似度が閾値以上
+    エントリはTTLとLRUで捨て、生成にかかったトークン数・料金とヒット数を記録する。
+    """
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: int = 512,
+                 similarity_threshold: Optional[float] = None, enabled: Optional[bool] = None):
+        self.ttl_seconds = float(os.getenv("RESPONSE_CACHE_TTL", "3600")) if ttl_seconds is None else ttl_seconds
+        self.similarity_threshold = (float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+                                     if similarity_threshold is None else similarity_threshold)
+        self.enabled = os.getenv("RESPONSE_CACHE", "on").lower() not in ("off", "0", "false") if enabled is None else enabled
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0,
+                      "saved_tokens": 0, "saved_usd": 0.0}
+
+    @staticmethod
+    def context_key(preferences: Any, shop_ids: Sequence[str]) -> str:
+        """要約以外のプロンプト入力（希望条件と候補店舗）のハッシュ"""
+        if isinstance(preferences, dict):
+            preferences = {key: value for key, value in preferences.items() if key not in IGNORED_PREFERENCE_KEYS}
+        payload = json.dumps([preferences, list(shop_ids)], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def make_key(cls, summary: str, preferences: Any, shop_ids: Sequence[str]) -> str:
+        context = cls.context_key(preferences, shop_ids)
+        return hashlib.sha256(f"{context}\0{normalize_text(summary)}".encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: CachedResponse, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _hit(self, key: str, entry: CachedResponse, kind: str) -> str:
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        self.stats[kind] += 1
+        self.stats["saved_tokens"] += entry.prompt_tokens + entry.completion_tokens
+        self.stats["saved_usd"] += entry.cost_usd
+        return entry.content
+
+    def get(self, summary: str, preferences: Any, shop_ids: Sequence[str],
+            embedding: Optional[Sequence[float]] = None, bypass: bool = False) -> Optional[str]:
+        """キャッシュ済みの応答（なければNone）。embeddingを渡すと意味的な一致も探す"""
+        if bypass or not self.enabled:
+            self.stats["bypassed"] += 1
+            return None
+        key = self.make_key(summary, preferences, shop_ids)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry, now):
+                    return self._hit(key, entry, "exact_hits")
+                del self._entries[key]
+
+            if embedding is not None:
+                query = _unit(embedding)
+                context = self.context_key(preferences, shop_ids)
+                best_key, best_score = None, self.similarity_threshold
+                for candidate_key, candidate in list(self._entries.items()):
+                    if self._expired(candidate, now):
+                        del self._entries[candidate_key]
+                        continue
+                    if candidate.context_key != context or candidate.embedding is None:
+                        continue
+                    score = float(candidate.embedding @ query)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+                if best_key is not None:
+                    return self._hit(best_key, self._entries[best_key], "semantic_hits")
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, summary: str, preferences: Any, shop_ids: Sequence[str], content: str,
+            embedding: Optional[Sequence[float]] = None, model: str = "gpt-4.1",
+            prompt_tokens: int = 0, completion_tokens: int = 0, bypass: bool = False) -> None:
+        if bypass or not self.enabled or not content:
+            return
+        key = self.make_key(summary, preferences, shop_ids)
+        entry = CachedResponse(
+            content, self.context_key(preferences, shop_ids),
+            _unit(embedding) if embedding is not None else None,
+            prompt_tokens, completion_tokens, estimate_cost(model, prompt_tokens, completion_tokens)
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            lookups = hits + self.stats["misses"]
+            cached_cost = sum(entry.cost_usd for entry in self._entries.values())
+            return {
+                **self.stats,
+                "saved_usd": round(self.stats["saved_usd"], 6),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "cached_cost_usd": round(cached_cost, 6),
+                "enabled": self.enabled,
+            }
+
+    def top_entries(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """ヒット数の多いエントリ（どの問い合わせがよく再利用されているかの確認用）"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry.hits, reverse=True)[:limit]
+            return [{"hits": entry.hits, "cost_usd": round(entry.cost_usd, 6), "preview": entry.content[:80]}
+                    for entry in entries]
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
@@ -0,0 +1,176 @@
+# utils/restaurant_catalog.py
+import json, os, threading, time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .catalog_filter import CatalogFilter
+from .compact_catalog import CompactCatalog, ShopRecord
+from .geo_index import GeoIndex
+from .keyword_index import BM25Index, KeywordIndex
+from .shop_shards import catalog_is_complete
+
+DEFAULT_CATALOG_PATH = "meguro_shops.json"
+# 読み直しのときに作り直すインデックス（属性名, クラス）
+INDEX_TYPES = (("_filter", CatalogFilter), ("_geo", GeoIndex), ("_keywords", KeywordIndex), ("_bm25", BM25Index))
+
+
+class RestaurantCatalog:
+    """店舗JSONを1回だけ読み込み、IDで引けるようにした読み取り専用のカタログ
+
+    店舗は CompactCatalog（列指向の省メモリ形式）で持ち、辞書のように読める
+    ShopRecord を返す。辞書が必要な場合は ShopRecord.to_dict() を使う。
+    ファイルの更新時刻が変わったら、バックグラウンドで読み直してから差し替える
+    （読み直し中のリクエストは古いデータをそのまま使う）。使われていたインデックスも
+    読み直しのスレッドで作っておくので、差し替え後の最初のリクエストで作り直さない。
+    """
+    def __init__(self, json_path: str = DEFAULT_CATALOG_PATH, check_interval: float = 2.0):
+        self.json_path = json_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._last_checked = 0.0
+        self.table = CompactCatalog([])
+        self._filter: Optional[CatalogFilter] = None
+        self._geo: Optional[GeoIndex] = None
+        self._keywords: Optional[KeywordIndex] = None
+        self._bm25: Optional[BM25Index] = None
+        self._area_codes: Tuple[Any, Set[str]] = (None, set())
+        self.mtime = None
+        self.complete = False
+        self.reload()
+
+    def reload(self) -> None:
+        """ファイルを読み込んでカタログを差し替える"""
+        start = time.perf_counter()
+        mtime = os.stat(self.json_path).st_mtime_ns
+        with open(self.json_path, "r", encoding="utf-8") as f:
+            table = CompactCatalog(json.load(f))
+        indexes = {name: index_type(table) for name, index_type in INDEX_TYPES if getattr(self, name) is not None}
+        # 参照を一度に差し替えるので、読み込み中でも検索側は一貫したデータを見る
+        self.table, self.mtime = table, mtime
+        # 全国分の目印があるか（ないカタログは、含まれる大エリアの検索にしか答えない）
+        self.complete = catalog_is_complete(self.json_path)
+        for name, index in indexes.items():
+            setattr(self, name, index)
+        print(f"Restaurant catalog loaded: {len(table)} shops from {self.json_path} "
+              f"({(time.perf_counter() - start) * 1000:.0f}ms)")
+
+    def _reload_in_background(self) -> None:
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"Restaurant catalog reload failed ({self.json_path}): {e}")
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def _check_for_update(self) -> None:
+        now = time.monotonic()
+        if now - self._last_checked < self.check_interval:
+            return
+        with self._lock:
+            if self._reloading or now - self._last_checked < self.check_interval:
+                return
+            self._last_checked = now
+            try:
+                changed = os.stat(self.json_path).st_mtime_ns != self.mtime
+            except OSError:
+                return
+            if not changed:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload_in_background, daemon=True).start()
+
+    def get(self, restaurant_id: str) -> Optional[ShopRecord]:
+        self._check_for_update()
+        return self.table.get(restaurant_id)
+
+    def get_many(self, restaurant_ids: Iterable[str]) -> List[ShopRecord]:
+        """IDの順番で店舗を返す（カタログにないIDは飛ばす）"""
+        self._check_for_update()
+        table = self.table
+        records = (table.get(restaurant_id) for restaurant_id in restaurant_ids)
+        return [record for record in records if record is not None]
+
+    def all(self) -> List[ShopRecord]:
+        self._check_for_update()
+        return list(self.table)
+
+    def filter(self) -> CatalogFilter:
+        """現在のカタログに対する絞り込みインデックス（読み直し後の初回に作り直す）"""
+        self._check_for_update()
+        table, current = self.table, self._filter
+        if current is None or current.table is not table:
+            current = self._filter = CatalogFilter(table)
+        return current
+
+    def geo(self) -> GeoIndex:
+        """現在のカタログに対する空間インデックス（読み直し後の初回に作り直す）"""
+        self._check_for_update()
+        table, current = self.table, self._geo
+        if current is None or current.table is not table:
+            current = self._geo = GeoIndex(table)
+        return current
+
+    def keywords(self) -> KeywordIndex:
+        """現在のカタログに対するキーワードの全文インデックス（読み直し後の初回に作り直す）"""
+        self._check_for_update()
+        table, current = self.table, self._keywords
+        if current is None or current.table is not table:
+            current = self._keywords = KeywordIndex(table)
+        return current
+
+    def bm25(self) -> BM25Index:
+        """現在のカタログに対するBM25のインデックス（読み直し後の初回に作り直す）"""
+        self._check_for_update()
+        table, current = self.table, self._bm25
+        if current is None or current.table is not table:
+            current = self._bm25 = BM25Index(table)
+        return current
+
+    def large_area_codes(self) -> Set[str]:
+        """カタログに含まれる大エリアのコード（どの範囲をローカルで答えられるかの判定用）"""
+        self._check_for_update()
+        table, (cached_table, codes) = self.table, self._area_codes
+        if cached_table is not table:
+            codes = {table.code(row, "large_area") for row in range(len(table))} - {""}
+            self._area_codes = (table, codes)
+        return codes
+
+    def age_seconds(self) -> float:
+        """読み込んでいるファイルの更新からの経過秒数"""
+        return max(0.0, time.time() - self.mtime / 1e9)
+
+    def nearby(self, lat: float, lng: float, radius_meters: float,
+               limit: Optional[int] = None) -> List[Tuple[ShopRecord, float]]:
+        """指定地点から半径内の店舗を (店舗, 距離m) の近い順で返す"""
+        geo = self.geo()
+        return [(geo.table.record(row), distance) for row, distance in geo.nearby(lat, lng, radius_meters, limit)]
+
+    def candidates(self, preferences: Dict[str, Any]):
+        """ユーザーの希望に合う候補店舗（CatalogFilter.candidates を参照）"""
+        return self.filter().candidates(preferences)
+
+    def __contains__(self, restaurant_id: str) -> bool:
+        return restaurant_id in self.table.row_by_id
+
+    def __iter__(self) -> Iterator[ShopRecord]:
+        return iter(self.all())
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+_catalogs: Dict[str, RestaurantCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(json_path: Optional[str] = None) -> RestaurantCatalog:
+    """プロセス内で共有するカタログを取得（パスごとに1回だけ読み込む）"""
+    path = os.path.abspath(json_path or os.getenv("RESTAURANT_CATALOG_PATH", DEFAULT_CATALOG_PATH))
+    catalog = _catalogs.get(path)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(path)
+            if catalog is None:
+                catalog = _catalogs[path] = RestaurantCatalog(path)
+    return catalog
@@ -0,0 +1,268 @@
+# utils/session_store.py
+import asyncio, json, os, sqlite3, threading, time
+from typing import Any, Dict, List, Optional
+
+# 1ターンで読む会話履歴の件数（直前のやり取りが分かれば足りる）
+HISTORY_TAIL = 20
+# 他のワーカーの未完了の更新を待つときの確認間隔と、古い（落ちたワーカーの）印とみなすまでの秒数
+UPDATE_POLL_INTERVAL = 0.05
+UPDATE_STALE_SECONDS = 60.0
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class SQLiteSessionStore:
+    """セッションIDごとの会話状態（履歴・要約・直近のラリー・希望条件）のSQLiteストア
+
+    全ユーザー共通のJSONファイルを毎ターン読み書きする代わりに、そのセッションの行だけを読み、
+    追記する。書き込みは履歴の長さによらず一定のコスト。WALモードなので読み込みは書き込みを待たない。
+    """
+    backend = "sqlite"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = os.getenv("SESSION_DB_PATH", "sessions.sqlite3") if path is None else path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, payload TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);"
+            "CREATE TABLE IF NOT EXISTS rallies ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, payload TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS rallies_session ON rallies (session_id, id);"
+            "CREATE TABLE IF NOT EXISTS state ("
+            "session_id TEXT NOT NULL, name TEXT NOT NULL, payload TEXT NOT NULL, updated_at REAL,"
+            "PRIMARY KEY (session_id, name));"
+        )
+        self._db.commit()
+
+    def _execute(self, sql: str, params=(), many: bool = False) -> List[tuple]:
+        with self._lock:
+            cursor = self._db.executemany(sql, params) if many else self._db.execute(sql, params)
+            rows = cursor.fetchall()
+            self._db.commit()
+            return rows
+
+    async def _run(self, sql: str, params=(), many: bool = False) -> List[tuple]:
+        # sqlite3は同期APIなのでスレッドで実行（イベントループを止めない）
+        return await asyncio.to_thread(self._execute, sql, params, many)
+
+    # --- 会話履歴 ---
+
+    async def recent_messages(self, session_id: str, limit: int = HISTORY_TAIL) -> List[Dict[str, Any]]:
+        """直近limit件のメッセージ（古い順）"""
+        rows = await self._run(
+            "SELECT payload FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?", (session_id, limit)
+        )
+        return [json.loads(payload) for payload, in reversed(rows)]
+
+    async def append_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        if messages:
+            await self._run("INSERT INTO messages (session_id, payload) VALUES (?, ?)",
+                            [(session_id, _dumps(message)) for message in messages], many=True)
+
+    # --- 直近のラリー（ユーザー発言と短い応答の組） ---
+
+    async def rallies(self, session_id: str) -> List[Dict[str, Any]]:
+        rows = await self._run("SELECT payload FROM rallies WHERE session_id = ? ORDER BY id", (session_id,))
+        return [json.loads(payload) for payload, in rows]
+
+    async def add_rally(self, session_id: str, pair: Dict[str, Any], keep: int) -> None:
+        """ラリーを追加し、古いものはkeep件を残して消す"""
+        def add():
+            with self._lock:
+                self._db.execute("INSERT INTO rallies (session_id, payload) VALUES (?, ?)", (session_id, _dumps(pair)))
+                self._db.execute(
+                    "DELETE FROM rallies WHERE session_id = ? AND id NOT IN "
+                    "(SELECT id FROM rallies WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                    (session_id, session_id, keep),
+                )
+                self._db.commit()
+        await asyncio.to_thread(add)
+
+    # --- 要約・希望条件（セッションごとに1つの値） ---
+
+    async def _get_state(self, session_id: str, name: str) -> Any:
+        rows = await self._run("SELECT payload FROM state WHERE session_id = ? AND name = ?", (session_id, name))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def _set_state(self, session_id: str, name: str, value: Any) -> None:
+        await self._run("INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+                        (session_id, name, _dumps(value), time.time()))
+
+    async def summary(self, session_id: str) -> List[Dict[str, Any]]:
+        return await self._get_state(session_id, "summary") or []
+
+    async def set_summary(self, session_id: str, summary: List[Dict[str, Any]]) -> None:
+        await self._set_state(session_id, "summary", summary)
+
+    async def preferences(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self._get_state(session_id, "preferences")
+
+    async def set_preferences(self, session_id: str, preferences: Dict[str, Any]) -> None:
+        await self._set_state(session_id, "preferences", preferences)
+
+    # --- レスポンス送信後の更新中の印（別のワーカーが処理した前のターンの完了を待つため） ---
+
+    async def begin_update(self, session_id: str) -> None:
+        await self._run(
+            "INSERT INTO state VALUES (?, 'pending_updates', '1', ?) ON CONFLICT (session_id, name) "
+            "DO UPDATE SET payload = CAST(payload AS INTEGER) + 1, updated_at = excluded.updated_at",
+            (session_id, time.time()),
+        )
+
+    async def end_update(self, session_id: str) -> None:
+        await self._run(
+            "UPDATE state SET payload = MAX(CAST(payload AS INTEGER) - 1, 0) "
+            "WHERE session_id = ? AND name = 'pending_updates'", (session_id,)
+        )
+
+    async def pending_updates(self, session_id: str) -> int:
+        rows = await self._run("SELECT payload, updated_at FROM state WHERE session_id = ? AND name = 'pending_updates'",
+                               (session_id,))
+        if not rows or time.time() - rows[0][1] > UPDATE_STALE_SECONDS:
+            return 0
+        return int(rows[0][0])
+
+    async def clear(self, session_id: str) -> None:
+        def clear():
+            with self._lock:
+                for table in ("messages", "rallies", "state"):
+                    self._db.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+                self._db.commit()
+        await asyncio.to_thread(clear)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions, = self._db.execute("SELECT COUNT(DISTINCT session_id) FROM state WHERE name != 'pending_updates'").fetchone()
+            messages, = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()
+        return {"backend": self.backend, "sessions": sessions, "messages": messages}
+
+    async def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class RedisSessionStore:
+    """SQLiteSessionStore と同じ操作をRedis（互換サーバー）のリスト・文字列で行うストア
+
+    複数サーバーで状態を共有するとき用。SESSION_TTL（秒）を指定すると最後の更新から期限切れにする。
+    """
+    backend = "redis"
+
+    def __init__(self, url: Optional[str] = None, ttl_seconds: Optional[int] = None, prefix: str = "session"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError("SESSION_STORE=redis requires the redis package (pip install redis)")
+        self.redis = redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        self.ttl_seconds = int(os.getenv("SESSION_TTL", "0")) if ttl_seconds is None else ttl_seconds
+        self.prefix = prefix
+
+    def _key(self, session_id: str, name: str) -> str:
+        return f"{self.prefix}:{session_id}:{name}"
+
+    async def _touch(self, pipe, *keys: str) -> None:
+        if self.ttl_seconds > 0:
+            for key in keys:
+                pipe.expire(key, self.ttl_seconds)
+        await pipe.execute()
+
+    async def recent_messages(self, session_id: str, limit: int = HISTORY_TAIL) -> List[Dict[str, Any]]:
+        return [json.loads(item) for item in await self.redis.lrange(self._key(session_id, "messages"), -limit, -1)]
+
+    async def append_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        if messages:
+            key = self._key(session_id, "messages")
+            pipe = self.redis.pipeline()
+            pipe.rpush(key, *[_dumps(message) for message in messages])
+            await self._touch(pipe, key)
+
+    async def rallies(self, session_id: str) -> List[Dict[str, Any]]:
+        return [json.loads(item) for item in await self.redis.lrange(self._key(session_id, "rallies"), 0, -1)]
+
+    async def add_rally(self, session_id: str, pair: Dict[str, Any], keep: int) -> None:
+        key = self._key(session_id, "rallies")
+        pipe = self.redis.pipeline()
+        pipe.rpush(key, _dumps(pair))
+        pipe.ltrim(key, -keep, -1)
+        await self._touch(pipe, key)
+
+    async def _get_state(self, session_id: str, name: str) -> Any:
+        value = await self.redis.get(self._key(session_id, name))
+        return json.loads(value) if value is not None else None
+
+    async def _set_state(self, session_id: str, name: str, value: Any) -> None:
+        key = self._key(session_id, name)
+        pipe = self.redis.pipeline()
+        pipe.set(key, _dumps(value))
+        await self._touch(pipe, key)
+
+    async def summary(self, session_id: str) -> List[Dict[str, Any]]:
+        return await self._get_state(session_id, "summary") or []
+
+    async def set_summary(self, session_id: str, summary: List[Dict[str, Any]]) -> None:
+        await self._set_state(session_id, "summary", summary)
+
+    async def preferences(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self._get_state(session_id, "preferences")
+
+    async def set_preferences(self, session_id: str, preferences: Dict[str, Any]) -> None:
+        await self._set_state(session_id, "preferences", preferences)
+
+    async def begin_update(self, session_id: str) -> None:
+        key = self._key(session_id, "pending_updates")
+        pipe = self.redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, int(UPDATE_STALE_SECONDS))
+        await pipe.execute()
+
+    async def end_update(self, session_id: str) -> None:
+        key = self._key(session_id, "pending_updates")
+        if await self.redis.decr(key) <= 0:
+            await self.redis.delete(key)
+
+    async def pending_updates(self, session_id: str) -> int:
+        return max(0, int(await self.redis.get(self._key(session_id, "pending_updates")) or 0))
+
+    async def clear(self, session_id: str) -> None:
+        await self.redis.delete(*[self._key(session_id, name) for name in ("messages", "rallies", "summary", "preferences")])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "ttl_seconds": self.ttl_seconds}
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+async def wait_for_updates(store, session_id: str, timeout: float = 30.0) -> bool:
+    """セッションの更新中の印が消えるまで待つ（タイムアウト時はFalse）
+
+    マルチワーカーでは前のターンの要約・履歴更新が別のワーカーで動いていることがあるので、
+    プロセス内のキューだけでなくストアの印も確認する。
+    """
+    deadline = time.monotonic() + timeout
+    while await store.pending_updates(session_id) > 0:
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(UPDATE_POLL_INTERVAL)
+    return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """プロセスで共有するセッションストア（SESSION_STORE=sqlite|redis、既定はsqlite）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.getenv("SESSION_STORE", "sqlite").lower()
+                _store = RedisSessionStore() if backend == "redis" else SQLiteSessionStore()
+    return _store
@@ -0,0 +1,226 @@
+# utils/shop_shards.py
+import csv, glob, json, logging, os, sqlite3, threading, time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .file_operations import atomic_writer
+
+SHARD_SIZE = 10000  # 1シャードあたりの店舗数
+INDEX_NAME = "shards.sqlite3"
+# 全ての大エリアを取り切ったクロールの記録（シャードのディレクトリに置く）
+COMPLETE_NAME = "crawl_complete.json"
+# カタログファイルが全国分であることを示す目印（カタログファイル名 + この拡張子）
+COMPLETE_SUFFIX = ".complete"
+
+logger = logging.getLogger(__name__)
+
+
+def write_json_array(path: str, items: Iterable[Dict[str, Any]], indent: Optional[int] = None) -> int:
+    """JSON配列のファイルに1件ずつ書き出す（件数に関係なくメモリは一定）。書いた件数を返す"""
+    written = 0
+    with atomic_writer(path) as f:
+        f.write("[")
+        for item in items:
+            text = json.dumps(item, ensure_ascii=False, indent=indent)
+            if indent:
+                text = text.replace("\n", "\n" + " " * indent)
+            f.write(",\n" if written else "\n")
+            f.write(" " * (indent or 0) + text)
+            written += 1
+        f.write("\n]\n" if written else "]\n")
+    return written
+
+
+def set_catalog_complete(catalog_path: str, complete: bool) -> None:
+    """カタログファイルが全国分か（エリアを指定しない検索にも答えられるか）の目印を付ける・外す"""
+    marker = catalog_path + COMPLETE_SUFFIX
+    if complete:
+        with atomic_writer(marker) as f:
+            f.write("")
+    elif os.path.exists(marker):
+        os.remove(marker)
+
+
+def catalog_is_complete(catalog_path: str) -> bool:
+    return os.path.exists(catalog_path + COMPLETE_SUFFIX)
+
+
+class ShopShards:
+    """取得した店舗を JSON Lines のシャード（shops-00000.jsonl, ...）に追記していく保存先
+
+    - 店舗IDの重複はSQLite（ディスク上の集合）で判定するので、全店舗をメモリに持たない
+    - 各店舗のシャードとバイト位置も記録する（IDから1件だけ読み出せる）
+    - シャードごとに確定済みのサイズを記録し、開き直すときに確定前の書きかけを切り詰める
+      （書き込み中に落ちても、再実行でそのページを取り直せば重複も欠けもない）
+    readonly=True で開くと切り詰めを行わない（クロール中のシャードを別プロセスから読むとき）。
+    """
+    def __init__(self, directory: str, shard_size: int = SHARD_SIZE, fsync: bool = True, readonly: bool = False):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self.stats = {"pages": 0, "written": 0, "duplicates": 0, "missing_id": 0}
+        os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(directory, INDEX_NAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS shops (id TEXT PRIMARY KEY, shard TEXT, offset INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS shards (name TEXT PRIMARY KEY, size INTEGER, count INTEGER)")
+        self._db.commit()
+        if not readonly:
+            self._recover()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _recover(self) -> None:
+        """確定済みのサイズより後ろ（コミット前に落ちた書きかけ）を切り詰める"""
+        committed = dict(self._db.execute("SELECT name, size FROM shards").fetchall())
+        for path in glob.glob(self._path("shops-*.jsonl")):
+            name = os.path.basename(path)
+            size = committed.get(name, 0)
+            if os.path.getsize(path) > size:
+                logger.warning(f"シャードの未確定部分を切り詰めます: {name} ({os.path.getsize(path)} -> {size} bytes)")
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _current_shard(self) -> tuple:
+        row = self._db.execute("SELECT name, size, count FROM shards ORDER BY name DESC LIMIT 1").fetchone()
+        if row is None or row[2] >= self.shard_size:
+            number = 0 if row is None else int(row[0][len("shops-"):-len(".jsonl")]) + 1
+            row = (f"shops-{number:05d}.jsonl", 0, 0)
+            self._db.execute("INSERT INTO shards VALUES (?, 0, 0)", (row[0],))
+        return row
+
+    def write_page(self, shops: List[Dict[str, Any]]) -> int:
+        """1ページ分の店舗を追記する（既に保存済みのIDは飛ばす）。新しく書いた件数を返す"""
+        with self._lock:
+            name, size, count = self._current_shard()
+            lines, offset = [], size
+            for shop in shops:
+                shop_id = shop.get("id")
+                if not shop_id:
+                    self.stats["missing_id"] += 1
+                    continue
+                cursor = self._db.execute("INSERT OR IGNORE INTO shops VALUES (?, ?, ?)", (shop_id, name, offset))
+                if cursor.rowcount == 0:
+                    self.stats["duplicates"] += 1
+                    continue
+                line = (json.dumps(shop, ensure_ascii=False) + "\n").encode("utf-8")
+                lines.append(line)
+                offset += len(line)
+
+            try:
+                if lines:
+                    with open(self._path(name), "ab") as f:
+                        f.write(b"".join(lines))
+                        f.flush()
+                        if self.fsync:
+                            os.fsync(f.fileno())
+                self._db.execute("UPDATE shards SET size = ?, count = ? WHERE name = ?",
+                                 (offset, count + len(lines), name))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                self._recover()
+                raise
+            self.stats["pages"] += 1
+            self.stats["written"] += len(lines)
+            return len(lines)
+
+    def shard_names(self) -> List[str]:
+        return [row[0] for row in self._db.execute("SELECT name FROM shards ORDER BY name").fetchall()]
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM shops").fetchone()[0]
+
+    def committed_sizes(self) -> Dict[str, int]:
+        """シャード名 → 確定済みのバイト数"""
+        return dict(self._db.execute("SELECT name, size FROM shards ORDER BY name").fetchall())
+
+    def scan(self, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """1シャードの (バイト位置, 店舗) を start から end まで順に返す（end を省略すると確定済みの範囲まで）"""
+        size = self.committed_sizes().get(name, 0) if end is None else end
+        position = start
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            for line in f:
+                if position + len(line) > size:
+                    break
+                yield position, json.loads(line)
+                position += len(line)
+
+    def iter_shard(self, name: str) -> Iterator[Dict[str, Any]]:
+        """1シャードの店舗を順に返す（確定済みの範囲だけ）"""
+        for _, shop in self.scan(name):
+            yield shop
+
+    def iter_shops(self, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[Dict[str, Any]]:
+        """全シャードの店舗を順に返す（一度に1件ずつしかメモリに載せない）"""
+        for name in self.shard_names():
+            for shop in self.iter_shard(name):
+                if predicate is None or predicate(shop):
+                    yield shop
+
+    def read_at(self, locations: Iterable[Tuple[str, int]]) -> Iterator[Dict[str, Any]]:
+        """(シャード名, バイト位置) の店舗を順に読む（同じシャードが続く間はファイルを開いたまま）"""
+        current, f = None, None
+        try:
+            for name, offset in locations:
+                if name != current:
+                    if f is not None:
+                        f.close()
+                    current, f = name, open(self._path(name), "rb")
+                f.seek(offset)
+                yield json.loads(f.readline())
+        finally:
+            if f is not None:
+                f.close()
+
+    def get(self, shop_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT shard, offset FROM shops WHERE id = ?", (shop_id,)).fetchone()
+        if row is None:
+            return None
+        return next(self.read_at([row]))
+
+    def export_json(self, path: str, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                    indent: Optional[int] = None) -> int:
+        """店舗をJSON配列のファイルに書き出す（1件ずつ書くので件数に関係なくメモリは一定）"""
+        return write_json_array(path, self.iter_shops(predicate), indent)
+
+    def export_csv(self, path: str) -> int:
+        """全店舗をCSVに書き出す
+
+        1回目で列（キーの和集合、出現順）を集め、2回目で1行ずつ書く。
+        入れ子の値（エリアやジャンルなど）はJSON文字列にする。
+        """
+        columns: Dict[str, None] = {}
+        for shop in self.iter_shops():
+            for key in shop:
+                columns.setdefault(key, None)
+
+        written = 0
+        with atomic_writer(path, newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(columns))
+            writer.writeheader()
+            for shop in self.iter_shops():
+                writer.writerow({
+                    key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                    for key, value in shop.items()
+                })
+                written += 1
+        return written
+
+    def mark_complete(self, area_codes: Iterable[str]) -> None:
+        """全ての大エリアを取り切ったことを記録する（全国分のカタログを書き出せる）"""
+        with atomic_writer(self._path(COMPLETE_NAME)) as f:
+            json.dump({"large_areas": sorted(area_codes), "completed_at": time.time()}, f)
+
+    def clear_complete(self) -> None:
+        if os.path.exists(self._path(COMPLETE_NAME)):
+            os.remove(self._path(COMPLETE_NAME))
+
+    def is_complete(self) -> bool:
+        return os.path.exists(self._path(COMPLETE_NAME))
+
+    def close(self) -> None:
+        self._db.close()
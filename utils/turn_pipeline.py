@@ -0,0 +1,40 @@
+# utils/turn_pipeline.py
+import asyncio, time
+from typing import Any, Awaitable, Dict, List, Optional
+
+
+class TurnTimer:
+    """1ターン内の各ステージの処理時間を計測する"""
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    async def run(self, name: str, awaitable: Awaitable) -> Any:
+        """awaitableを実行して、ステージ名で処理時間(ms)を記録する"""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    async def gather(self, stages: Dict[str, Awaitable]) -> List[Any]:
+        """依存関係のないステージを並行実行する（結果はstagesの順）"""
+        return await asyncio.gather(*(self.run(name, aw) for name, aw in stages.items()))
+
+    def record(self, name: str, ms: float) -> None:
+        """awaitableにできない処理（ストリーミングなど）の時間を記録する"""
+        self.timings[name] = ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def server_timing_header(self) -> str:
+        """Server-Timingヘッダーの値を作成（ブラウザのDevToolsで確認できる）"""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.timings.items()]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
+
+    def report(self, label: Optional[str] = None) -> str:
+        stages = " ".join(f"{name}={ms:.0f}ms" for name, ms in self.timings.items())
+        prefix = f"[{label}] " if label else ""
+        return f"⏱️ {prefix}{stages} total={self.total_ms():.0f}ms"
@@ -2,6 +2,8 @@
 import json, os, uuid, aiofiles 
 from typing import Optional
 
+from .file_operations import update_json, write_json
+
 USERS_FILE = "users.json"
 
 async def load_users():
@@ -10,23 +12,24 @@ async def load_users():
         return json.loads(content)
 
 async def save_users(users: list):
-    async with aiofiles.open("users.json", "w", encoding="utf-8") as f:
-        await f.write(json.dumps(users, ensure_ascii=False, indent=2))
+    await write_json(USERS_FILE, users)
 
 async def add_user(username: str, email: str, password: str) -> dict:
-    users = await load_users()
-    if any(u["email"] == email or u["username"] == username for u in users):
-        raise ValueError("既に存在するユーザーです")
-
     new_user = {
         "id": str(uuid.uuid4()),
         'username': username,
         "email": email,
         "password": password
     }
-    users.append(new_user)
-    await save_users(users)
-    return new_user
+
+    # 重複チェックから保存までを他のワーカーの登録と排他する
+    def append_user(users: list) -> dict:
+        if any(u["email"] == email or u["username"] == username for u in users):
+            raise ValueError("既に存在するユーザーです")
+        users.append(new_user)
+        return new_user
+
+    return await update_json(USERS_FILE, [], append_user)
 
 async def get_user_by_email_or_username(identifier: str) -> Optional[dict]:
     users = await load_users()
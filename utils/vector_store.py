@@ -1,115 +1,348 @@
 # utils/vector_store.py
-from operator import index
-import os
-from pydoc import text
-from unittest import result 
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
+import os, threading, time
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 from dotenv import load_dotenv
 
+from .embedding_cache import EmbeddingCache
+from .index_manifest import IndexManifest
+from .llm_clients import get_llm_clients
+from .restaurant_catalog import get_catalog
+
 load_dotenv()
 
-class VectorStore:
-    def __init__(self):
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSION = 1536
+# Pineconeのメタデータフィルタ（$in）に渡せるIDの上限
+PINECONE_MAX_FILTER_IDS = 10000
+
+
+def build_restaurant_text(restaurant_data: Dict[str, Any]) -> str:
+    """埋め込み用のテキストを作成"""
+    genre = restaurant_data.get("genre", {}) or {}
+    sub_genre = restaurant_data.get("sub_genre", {}) or {}
+    budget = restaurant_data.get("budget", {}) or {}
+    area_data = {
+        "large_area": restaurant_data.get("large_area", {}) or {},
+        "middle_area": restaurant_data.get("middle_area", {}) or {},
+        "small_area": restaurant_data.get("small_area", {}) or {},
+    }
+    return f"""
+        名前: {restaurant_data.get("name", "")}
+        ジャンル: {genre.get('name', '')} {genre.get('catch', '')}
+        サブジャンル: {sub_genre.get('name', '')}
+        エリア: {area_data['large_area'].get('name', '')} {area_data['middle_area'].get('name', '')} {area_data['small_area'].get('name', '')}
+        アクセス: {restaurant_data.get("access", "")}
+        予算: {budget.get('name', '')} {budget.get('average', '')}
+        営業時間: {restaurant_data.get('open', '')}
+        定休日: {restaurant_data.get('close', '')}
+        その他: {restaurant_data.get('other_name', '')} {restaurant_data.get('shop_detail_memo', '')}
+        """
+
+
+def build_restaurant_metadata(restaurant_data: Dict[str, Any]) -> Dict[str, Any]:
+    """検索結果と一緒に返すメタデータを作成"""
+    photo = restaurant_data.get("photo", {}) or {}
+    return {
+        "id": restaurant_data.get("id", "unknown_id"),
+        "name": restaurant_data.get("name", ""),
+        "name_kana": restaurant_data.get("name_kana", ""),
+        "genre": restaurant_data.get("genre", {}).get("name", ""),
+        "sub_genre": restaurant_data.get("sub_genre", {}).get("name", ""),
+        "catch": restaurant_data.get("catch", ""),
+        "photo_url": photo.get("pc", {}).get("m", ""),
+        "logo_url": restaurant_data.get("logo_image", ""),
+        "area": restaurant_data.get("middle_area", {}).get("name", ""),
+        "address": restaurant_data.get("address", ""),
+        "access": restaurant_data.get("access", ""),
+        "station": restaurant_data.get("station_name", ""),
+        "budget": restaurant_data.get("budget", {}).get("average", ""),
+        "open": restaurant_data.get("open", ""),
+        "close": restaurant_data.get("close", ""),
+        "urls_pc": restaurant_data.get("urls", {}).get("pc", ""),
+        "lunch": restaurant_data.get("lunch", ""),
+        "wifi": restaurant_data.get("wifi", ""),
+        "child": restaurant_data.get("child", ""),
+        "card": restaurant_data.get("card", ""),
+        "non_smoking": restaurant_data.get("non_smoking", ""),
+        "capacity": str(restaurant_data.get("capacity", "")),
+    }
+
+
+class BaseVectorStore(ABC):
+    """埋め込みの作成と、店舗の保存・検索の共通処理（保存先はサブクラスで実装）
+
+    _upsert・_query・_delete を実装していないサブクラスは、インデックス作成の途中ではなく
+    インスタンス作成の時点でエラーになる。
+    """
+    def __init__(self, embedding_cache: EmbeddingCache = None):
+        # 埋め込みはスレッドから同期で呼ぶので、共有の同期クライアント（接続プール）を使う
+        self.openai_client = get_llm_clients().openai_sync()
+        # 同じテキストの埋め込みはAPIを呼ばずにキャッシュから返す
+        self.embedding_cache = embedding_cache or EmbeddingCache()
+
+    def get_embedding(self, text):
+        cached = self.embedding_cache.get(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
+
+        response = self.openai_client.embeddings.create(
+            input=text,
+            model=EMBEDDING_MODEL
+        )
+
+        embedding = response.data[0].embedding
+        self.embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+        return embedding
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """複数テキストの埋め込みをまとめて取得（キャッシュにないものだけ1リクエストで送る）"""
+        vectors = self.embedding_cache.get_many(EMBEDDING_MODEL, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            response = self.openai_client.embeddings.create(
+                input=missing,
+                model=EMBEDDING_MODEL
+            )
+            embeddings = [item.embedding for item in response.data]
+            self.embedding_cache.put_many(EMBEDDING_MODEL, missing, embeddings)
+            by_text = dict(zip(missing, embeddings))
+            vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def store_restaurant(self, restaurant_id, restaurant_data, text_to_embed):
+        restaurant_id = restaurant_data.get("id", "unknown_id")
+        text_to_embed = build_restaurant_text(restaurant_data)
+        vector = self.get_embedding(text_to_embed)
+        metadata = build_restaurant_metadata(restaurant_data)
+
+        self._upsert([(restaurant_id, vector, metadata)])
+        return {"id": restaurant_id, "status": "stored", "name": metadata["name"]}
+
+    def _store_batch(self, batch: List[Dict[str, Any]], upsert_batch_size: int) -> List[Tuple[str, str]]:
+        """1バッチ分を埋め込んで保存し、(id, 埋め込みテキスト) のリストを返す"""
+        ids = [restaurant.get("id", "unknown_id") for restaurant in batch]
+        texts = [build_restaurant_text(restaurant) for restaurant in batch]
+        vectors = self.get_embeddings(texts)
+        items = [
+            (restaurant_id, vector, build_restaurant_metadata(restaurant))
+            for restaurant_id, vector, restaurant in zip(ids, vectors, batch)
+        ]
+        for start in range(0, len(items), upsert_batch_size):
+            self._upsert(items[start:start + upsert_batch_size])
+        return list(zip(ids, texts))
+
+    def store_restaurants(self, restaurants: Iterable[Dict[str, Any]], batch_size: int = 100,
+                          upsert_batch_size: int = 100, max_concurrency: int = 4,
+                          checkpoint_path: Optional[str] = None, checkpoint_every: int = 10,
+                          on_batch: Optional[Callable[[List[Tuple[str, str]]], None]] = None) -> Dict[str, Any]:
+        """店舗をまとめてインデックスに登録する
+
+        restaurants はイテレータでもよく、batch_size 件ずつ埋め込みAPIに送る。
+        同時に処理するバッチは max_concurrency 個まで。checkpoint_path を指定すると
+        保存済みのIDを記録し、中断後に再実行すると続きから処理する。
+        """
+        done: Set[str] = set()
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                done = {line.strip() for line in f if line.strip()}
+            print(f"Resuming from checkpoint: {len(done)} shops already stored")
+
+        def batches():
+            batch = []
+            for restaurant in restaurants:
+                if restaurant.get("id", "unknown_id") in done:
+                    continue
+                batch.append(restaurant)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        started = time.perf_counter()
+        progress = {"stored": 0, "batches": 0}
+        uncheckpointed: List[str] = []
+
+        def collect(future):
+            results = future.result()
+            progress["stored"] += len(results)
+            progress["batches"] += 1
+            uncheckpointed.extend(restaurant_id for restaurant_id, _ in results)
+            if on_batch:
+                on_batch(results)
+
+        def write_checkpoint():
+            # 保存先に書き込まれてからIDを記録する（ローカルストアはここでディスクに保存）
+            self._flush()
+            if checkpoint_path and uncheckpointed:
+                with open(checkpoint_path, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{restaurant_id}\n" for restaurant_id in uncheckpointed))
+            uncheckpointed.clear()
+            progress["batches"] = 0
+            elapsed = time.perf_counter() - started
+            print(f"Stored {progress['stored']} shops ({progress['stored'] / elapsed if elapsed else 0:.1f} shops/sec)")
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            in_flight = set()
+            for batch in batches():
+                in_flight.add(executor.submit(self._store_batch, batch, upsert_batch_size))
+                if len(in_flight) < max_concurrency:
+                    continue
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future)
+                if progress["batches"] >= checkpoint_every:
+                    write_checkpoint()
+            for future in in_flight:
+                collect(future)
+            write_checkpoint()
+
+        elapsed = time.perf_counter() - started
+        return {
+            "stored": progress["stored"],
+            "skipped": len(done),
+            "elapsed_sec": round(elapsed, 2),
+            "shops_per_sec": round(progress["stored"] / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def reindex_restaurants(self, restaurants: Optional[Iterable[Dict[str, Any]]] = None,
+                            manifest_path: Optional[str] = None, **bulk_options) -> Dict[str, Any]:
+        """カタログとインデックスを同期する（変更・追加された店舗だけ埋め込み、消えた店舗は削除）
+
+        restaurants を省略した場合は共有の RestaurantCatalog を使う。
+        """
+        if restaurants is None:
+            restaurants = get_catalog().all()
+        manifest = IndexManifest(manifest_path or self.default_manifest_path())
+        seen_ids = set()
+        changed = []
+        for restaurant in restaurants:
+            restaurant_id = restaurant.get("id", "unknown_id")
+            seen_ids.add(restaurant_id)
+            if not manifest.is_current(restaurant_id, build_restaurant_text(restaurant)):
+                changed.append(restaurant)
+        removed = manifest.missing_from(seen_ids)
+        print(f"Reindex: {len(seen_ids)} shops, {len(changed)} new or changed, {len(removed)} removed")
+
+        report = {"stored": 0}
+        if changed:
+            report = self.store_restaurants(changed, on_batch=manifest.update, **bulk_options)
+        if removed:
+            self._delete(removed)
+            manifest.remove(removed)
+        self._flush()
+        manifest.save()
+
+        return {
+            **report,
+            "total": len(seen_ids),
+            "unchanged": len(seen_ids) - len(changed),
+            "removed": len(removed),
+        }
+
+    def default_manifest_path(self) -> str:
+        return os.getenv("VECTOR_INDEX_MANIFEST", "vector_index_manifest.json")
+
+    def search_restaurants(self, query, top_k=5, candidate_ids: Optional[Sequence[str]] = None):
+        """クエリに近い店舗を返す（candidate_ids を渡すとその店舗の中だけで検索）"""
+        if candidate_ids is not None and len(candidate_ids) == 0:
+            return []
+        query_vector = self.get_embedding(query)
+        return self._query(query_vector, top_k, candidate_ids)
+
+    @abstractmethod
+    def _upsert(self, vectors: List[Tuple[str, List[float], Dict[str, Any]]]) -> None:
+        """(ID, ベクトル, メタデータ) を保存する"""
+
+    @abstractmethod
+    def _query(self, vector: List[float], top_k: int, candidate_ids: Optional[Sequence[str]] = None) -> List[Any]:
+        """ベクトルに近い順の一致結果（id・score・metadata を持つ）"""
+
+    @abstractmethod
+    def _delete(self, restaurant_ids: List[str]) -> None:
+        """店舗をストアから削除する"""
+
+    def _flush(self) -> None:
+        """バッファしている書き込みを永続化する（必要なストアのみ実装）"""
+
+
+class VectorStore(BaseVectorStore):
+    """Pineconeを使ったベクトルストア"""
+    def __init__(self, embedding_cache: EmbeddingCache = None):
+        from pinecone import Pinecone, ServerlessSpec
+
+        super().__init__(embedding_cache)
         pc = Pinecone(
             api_key=os.getenv("PINECONE_API_KEY"),
             environment="us-east-1-aws"
         )
         print(pc.list_indexes())
-        
+
         index_name = os.getenv("PINECONE_INDEX")
         index_name_list = [idx["name"] for idx in pc.list_indexes()]
-        
-
-        self.openai_client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
 
         if index_name not in index_name_list:
             print("Index not found, creating...")
             pc.create_index(
                 name=index_name,
-                dimension=1536,
+                dimension=EMBEDDING_DIMENSION,
                 metric="cosine",
                 spec=ServerlessSpec(
                     cloud="aws",
                     region="us-east-1"
                 )
             )
-        else: 
+        else:
             print("Index already exists")
-        
+
         self.index = pc.Index(index_name)
-    
-    def get_embedding(self, text):
-        response = self.openai_client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
 
-        return response.data[0].embedding
+    def _upsert(self, vectors):
+        self.index.upsert(vectors=vectors)
 
-    def store_restaurant(self, restaurant_id, restaurant_data, text_to_embed):
-        restaurant_id = restaurant_data.get("id", "unknown_id")
+    def _delete(self, restaurant_ids):
+        for start in range(0, len(restaurant_ids), 1000):
+            self.index.delete(ids=restaurant_ids[start:start + 1000])
 
-        genre = restaurant_data.get("genre", {}) or {}
-        sub_genre = restaurant_data.get("sub_genre", {}) or {}
-        budget = restaurant_data.get("budget", {}) or {}
-        area_data = {
-            "large_area": restaurant_data.get("large_area", {}) or {},
-            "middle_area": restaurant_data.get("middle_area", {}) or {},
-            "small_area": restaurant_data.get("small_area", {}) or {},
-        }
-        text_to_embed = f"""
-        名前: {restaurant_data.get("name", "")}
-        ジャンル: {genre.get('name', '')} {genre.get('catch', '')}
-        サブジャンル: {sub_genre.get('name', '')}
-        エリア: {area_data['large_area'].get('name', '')} {area_data['middle_area'].get('name', '')} {area_data['small_area'].get('name', '')}
-        アクセス: {restaurant_data.get("access", "")}
-        予算: {budget.get('name', '')} {budget.get('average', '')}
-        営業時間: {restaurant_data.get('open', '')}
-        定休日: {restaurant_data.get('close', '')}
-        その他: {restaurant_data.get('other_name', '')} {restaurant_data.get('shop_detail_memo', '')}
-        """
-        vector = self.get_embedding(text_to_embed)
-        photo = restaurant_data.get("photo", {}) or {}
-        usls = restaurant_data.get("urls", {}) or {}
-        metadata = {
-            "id": restaurant_id,
-            "name": restaurant_data.get("name", ""),
-            "name_kana": restaurant_data.get("name_kana", ""),
-            "genre": restaurant_data.get("genre", {}).get("name", ""),
-            "sub_genre": restaurant_data.get("sub_genre", {}).get("name", ""),
-            "catch": restaurant_data.get("catch", ""),
-            "photo_url": photo.get("pc", {}).get("m", ""),
-            "logo_url": restaurant_data.get("logo_image", ""),
-            "area": restaurant_data.get("middle_area", {}).get("name", ""),
-            "address": restaurant_data.get("address", ""),
-            "access": restaurant_data.get("access", ""),
-            "station": restaurant_data.get("station_name", ""),
-            "budget": restaurant_data.get("budget", {}).get("average", ""),
-            "open": restaurant_data.get("open", ""),
-            "close": restaurant_data.get("close", ""),
-            "urls_pc": restaurant_data.get("urls", {}).get("pc", ""),
-            "lunch": restaurant_data.get("lunch", ""),
-            "wifi": restaurant_data.get("wifi", ""),
-            "child": restaurant_data.get("child", ""),
-            "card": restaurant_data.get("card", ""),
-            "non_smoking": restaurant_data.get("non_smoking", ""),
-            "capacity": str(restaurant_data.get("capacity", "")),
-        }
-
-        self.index.upsert(
-            vectors=[(restaurant_id, vector, metadata)]
-        )
-        return {"id": restaurant_id, "status": "stored", "name": metadata["name"]}
-    
-    def search_restaurants(self, query, top_k=5):
-        query_vector = self.get_embedding(query)
-        
+    def _query(self, vector, top_k, candidate_ids=None):
+        options = {}
+        # Pineconeの$inは件数に上限があるので、候補が多すぎるときは絞り込まずに検索する
+        if candidate_ids is not None and len(candidate_ids) <= PINECONE_MAX_FILTER_IDS:
+            options["filter"] = {"id": {"$in": list(candidate_ids)}}
         result = self.index.query(
-            vector=query_vector,
+            vector=vector,
             top_k=top_k,
-            include_metadata=True
+            include_metadata=True,
+            **options
         )
         return result.matches
+
+
+def create_vector_store() -> BaseVectorStore:
+    """VECTOR_STORE_BACKEND の設定に応じてベクトルストアを作成（pinecone / local）"""
+    backend = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+    if backend == "local":
+        from .local_vector_store import LocalVectorStore
+        return LocalVectorStore()
+    if backend != "pinecone":
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {backend}")
+    return VectorStore()
+
+
+_shared_store: Optional[BaseVectorStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_vector_store(create: bool = True) -> Optional[BaseVectorStore]:
+    """プロセスで共有するベクトルストア（最初に使うときに作成。Pineconeへの問い合わせもその時だけ）
+
+    create=False のときは作成済みの場合だけ返す（統計の表示などで作成を起こさないため）。
+    """
+    global _shared_store
+    if _shared_store is None and create:
+        with _shared_store_lock:
+            if _shared_store is None:
+                _shared_store = create_vector_store()
+    return _shared_store
@@ -1,7 +1,10 @@
 # wsgi.py
+import time
+# 起動レポート用（インポートにかかった時間）
+_import_started = time.perf_counter()
 import json
 from fastapi import FastAPI, Request, Response, Cookie
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
@@ -9,29 +12,39 @@ from pydantic import BaseModel
 import os
 import json
 import uuid
+import asyncio
+import importlib
 from datetime import datetime
-from openai import AsyncOpenAI
 import sys
 import os
 import uvicorn
 import traceback
-from typing import Optional, Dict, Any, Union
+from typing import TYPE_CHECKING, Optional, Dict, Any, Union
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from utils.file_operations import load_json, save_json, to_pretty_json, get_last_conversation, clear_chat_data
-from utils.ai_services import AIService
-from utils.vector_store import VectorStore
-
-vector_store = VectorStore()
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
+from utils.file_operations import to_pretty_json, get_last_conversation, get_cache_stats, write_json, write_json_sync
+from utils.ai_services import AIService
+from utils.vector_store import get_vector_store
+from utils.turn_pipeline import TurnTimer
+from utils.post_turn_queue import PostTurnQueue
+from utils.restaurant_catalog import get_catalog
+from utils.response_cache import ResponseCache
+from utils.llm_clients import get_llm_clients
+from utils.session_store import get_session_store, wait_for_updates
+
+# ベクトルストア（Pinecone）・カタログ・LLMクライアントはインポート時には作らない。
+# 最初に使うときか、起動後のウォームアップ（lifespan）で作る
 ai_service = AIService()
 
 
 import re
 from development import RestaurantSearchTool
-from langchain.schema import HumanMessage, AIMessage
 # from test_restaurant_search import run_ai_generated_tests, generate_test_queries_with_ai
         
 restaurant_search_tool = RestaurantSearchTool()
@@ -50,7 +63,7 @@ async def predict_missing_preferences(user_message: str, existing_preferences: d
         'environment': {
             'openai_key_exists': bool(os.getenv("OPENAI_API_KEY")),
             'python_version': sys.version,
-            'async_openai_version': getattr(AsyncOpenAI, '__version__', 'unknown')
+            'async_openai_version': getattr(sys.modules.get('openai'), '__version__', 'unknown')
         }
     }
     
@@ -105,7 +118,7 @@ IMPORTANT RULES:
         
         # Use OpenAI to generate predictions
         print("🤖 Calling OpenAI API for predictions...")
-        client = AsyncOpenAI(api_key=api_key)
+        client = get_llm_clients().openai()
         
         try:
             response = await client.chat.completions.create(
@@ -268,6 +281,7 @@ async def execute_restaurant_search(summary: str, user_preferences: Union[str, d
         user_preferences = await predict_missing_preferences(summary, user_preferences)
         
         # チャット履歴を構築
+        from langchain_core.messages import HumanMessage, AIMessage
         chat_history = []
         if user_history_json:
             try:
@@ -289,7 +303,7 @@ async def execute_restaurant_search(summary: str, user_preferences: Union[str, d
         
         # RestaurantSearchToolを実行
         try:
-            search_result = await restaurant_search_tool.invoke(search_query, chat_history)
+            search_result = await restaurant_search_tool.invoke(search_query, chat_history, user_preferences)
         except Exception as search_error:
             print(f"Search tool invocation error: {search_error}")
             search_result = None
@@ -307,7 +321,6 @@ async def execute_restaurant_search(summary: str, user_preferences: Union[str, d
 class AsyncRestaurantInfoExtractor:
     def __init__(self, api_key: str, json_file_path: str = "user_preferences.json"):
         self.api_key = api_key
-        self.client = AsyncOpenAI(api_key=self.api_key)
         self.json_file_path = json_file_path
         
         self.REQUIRED_INFO = {
@@ -322,10 +335,19 @@ class AsyncRestaurantInfoExtractor:
             "english_menu_needed": None,
             "last_updated": None
         }
-
-        self._initialize_json_file()
-
-    async def _load_from_json(self) -> Dict[str, Any]:
+        # user_preferences.json はセッションIDなしで使うときだけ必要なので、その時に初期化する
+        self._json_file_ready = False
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        return get_llm_clients().openai()
+
+    async def _load_from_json(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        # セッションIDがあればセッションストア、なければ従来のJSONファイル
+        if session_id is not None:
+            saved = await get_session_store().preferences(session_id)
+            return {**self.REQUIRED_INFO, **saved} if saved else self.REQUIRED_INFO.copy()
+        self._ensure_json_file()
         try:
             with open(self.json_file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
@@ -333,33 +355,39 @@ class AsyncRestaurantInfoExtractor:
         except (FileNotFoundError, json.JSONDecodeError):
             return self.REQUIRED_INFO.copy()
 
-    async def _save_to_json(self, data: Dict[str, Any]):
+    async def _save_to_json(self, data: Dict[str, Any], session_id: Optional[str] = None):
         data['last_updated'] = datetime.now().isoformat()
-        with open(self.json_file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        if session_id is not None:
+            await get_session_store().set_preferences(session_id, data)
+            return
+        self._ensure_json_file()
+        await write_json(self.json_file_path, data, indent=4)
+
+    def _ensure_json_file(self):
+        if not self._json_file_ready:
+            self._json_file_ready = True
+            self._initialize_json_file()
 
     def _initialize_json_file(self):
         try: 
             if not os.path.exists(self.json_file_path):
-                with open(self.json_file_path, 'w') as f:
-                    json.dump(self.REQUIRED_INFO, f, indent=4)
+                write_json_sync(self.json_file_path, self.REQUIRED_INFO, indent=4)
             else:
                 with open(self.json_file_path, 'r') as f:
                     existing_data = json.load(f)
                 
                 updated_data = {**self.REQUIRED_INFO, **existing_data}
                 
-                with open(self.json_file_path, 'w') as f:
-                    json.dump(updated_data, f, indent=4)
+                if updated_data != existing_data:
+                    write_json_sync(self.json_file_path, updated_data, indent=4)
         except json.JSONDecodeError as e:
             print(f"JSON読み込みエラー: {e}")
-            with open(self.json_file_path, 'w') as f:
-                json.dump(self.REQUIRED_INFO, f, indent=4)
+            write_json_sync(self.json_file_path, self.REQUIRED_INFO, indent=4)
         except IOError as e:
             print(f"ファイル操作エラー: {e}")
 
-    async def extract_restaurant_info(self, user_message: str) -> Dict[str, Any]:
-        current_info = await self._load_from_json()
+    async def extract_restaurant_info(self, user_message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        current_info = await self._load_from_json(session_id)
         prompt = f"""あなたはレストラン予約アシスタントです。ユーザーの発言から以下の情報を抽出してください。
         
             ユーザーの発言："{user_message}"
@@ -395,7 +423,7 @@ class AsyncRestaurantInfoExtractor:
                     else:
                         current_info[key] = value
             
-            await self._save_to_json(current_info)
+            await self._save_to_json(current_info, session_id)
             
             return current_info
             
@@ -403,8 +431,8 @@ class AsyncRestaurantInfoExtractor:
             print(f"エラーが発生しました: {e}")
             raise HTTPException(status_code=500, detail=f"OpenAI APIエラー: {str(e)}")
     
-    async def get_null_fields(self):
-        current_info = await self._load_from_json()
+    async def get_null_fields(self, session_id: Optional[str] = None):
+        current_info = await self._load_from_json(session_id)
         null_fields = []
         
         for key, value in current_info.items():
@@ -452,43 +480,60 @@ class AsyncRestaurantInfoExtractor:
 
         return "\n".join(output)
     
-    async def reset_info(self):
-        await self._save_to_json(self.REQUIRED_INFO.copy())
+    async def reset_info(self, session_id: Optional[str] = None):
+        await self._save_to_json(self.REQUIRED_INFO.copy(), session_id)
 
 
 
 extractor = AsyncRestaurantInfoExtractor(os.getenv("OPENAI_API_KEY"))
-user_preferences_file = "user_preferences.json"
-chat_log_file = "chat_log.json"
-summary_file = "chatsummary.json"
-user_history_file = "user_history.json"
 max_rallies = 7
 image_options = "https://images.pexels.com/photos/67468/pexels-photo-67468.jpeg?cs=srgb&dl=pexels-life-of-pix-67468.jpg&fm=jpg"
 
-async def update_user_messages(phone_number, message_pair):
-  user_history = await load_json(user_history_file, {})
-
-  if user_history is None or isinstance(user_history, list):
-    user_history = {}
-
-  if phone_number not in user_history:
-    user_history[phone_number] = {
-    "user_id": str(uuid.uuid4()),
-    "created_at": datetime.now().isoformat(),
-    "messages": []
-    }
-
-  if phone_number in user_history and "messages" not in user_history[phone_number]:
-    user_history[phone_number]["messages"] =[]
-
-  user_history[phone_number]["messages"].append(message_pair)
+# 要約・履歴更新などのレスポンス送信後の処理を実行するキュー
+post_turn_queue = PostTurnQueue()
+# おすすめ文（"ready"のときのgpt-4.1）の生成結果のキャッシュ
+response_cache = ResponseCache()
+RECOMMEND_MODEL = "gpt-4.1"
 
-  if len(user_history[phone_number]["messages"]) > max_rallies:
-    user_history[phone_number]["messages"] = user_history[phone_number]["messages"][-max_rallies:]
-  await save_json(user_history_file, user_history)
+async def warm_up(timer: TurnTimer) -> None:
+    """重いオブジェクトを起動後にバックグラウンドで作る（失敗しても起動は止めず、最初の利用時に作り直す）"""
+    async def build(name: str, factory) -> None:
+        try:
+            await timer.run(name, asyncio.to_thread(factory))
+        except Exception as e:
+            print(f"Warm-up failed ({name}): {e}")
+
+    await asyncio.gather(
+        build("catalog", lambda: get_catalog().filter()),
+        build("vector_store", get_vector_store),
+        build("openai_sdk", lambda: importlib.import_module("openai")),
+    )
+    print(timer.report("startup"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timer = TurnTimer()
+    timer.record("import", IMPORT_MS)
+    llm_clients = await timer.run("llm_clients", asyncio.to_thread(get_llm_clients))
+    session_store = await timer.run("session_store", asyncio.to_thread(get_session_store))
+    print(f"LLM clients ready (HTTP/2: {llm_clients.http2}), session store: {session_store.backend}")
+    app.state.startup_timer = timer
+    # STARTUP_WARMUP=0 なら全て最初のリクエストで作る
+    warm_up_task = None
+    if os.getenv("STARTUP_WARMUP", "1").lower() not in ("0", "false", "off"):
+        warm_up_task = asyncio.create_task(warm_up(timer))
+    else:
+        print(timer.report("startup"))
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    # シャットダウン前に未完了の要約・履歴更新を終わらせる
+    await post_turn_queue.shutdown()
+    await session_store.close()
+    await llm_clients.aclose()
 
 # Create a FastAPI app
-app = FastAPI(title="Ninja.AI Restaurant Recommendation System")
+app = FastAPI(title="Ninja.AI Restaurant Recommendation System", lifespan=lifespan)
 
 # Create a directory for templates if it doesn't exist
 os.makedirs('templates', exist_ok=True)
@@ -513,6 +558,8 @@ app.add_middleware(
 # Define request model
 class MessageRequest(BaseModel):
     message: str
+    # Trueならおすすめ文のキャッシュを使わずに必ず生成する
+    bypass_cache: bool = False
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -522,53 +569,123 @@ async def read_root(request: Request):
 async def favicon():
     return Response(status_code=204)
 
-@app.post("/api/chat")
-async def process_message(message_request: MessageRequest, session_id: Optional[str] = Cookie(None)):
-    body = message_request.message
-
-    #extract info and update json
-    extraction_info = await extractor.extract_restaurant_info(body)
-    await extractor._save_to_json(extraction_info)
-    
-    user_id = str(uuid.uuid4())
-    
-    history = await load_json(chat_log_file, [])
-    summary = await load_json(summary_file, [])
-    user_history_for_json = await load_json(user_history_file, {})
-    user_preferences = await load_json(user_preferences_file, {})
-
-    last_pair = await get_last_conversation(history)
+def session_key(session_id: Optional[str]) -> str:
+    return session_id or "default"
+
+async def run_post_turn_updates(session: str, body: str, new_messages: list, user_message: dict, user_id: str, summary_json: str, user_history_json: str, last_two_json: str) -> None:
+    """次のターン用の状態更新（post_turn_queueでレスポンス送信後に実行）"""
+    timer = TurnTimer()
+    store = get_session_store()
+    # このターンのメッセージだけを追記する（履歴全体は書き直さない）
+    await timer.run("save_history", store.append_messages(session, new_messages))
+
+    async def update_quick_history():
+        quick_response = await timer.run("quick_summarize", ai_service.openrouter_generate_quick_summarize_response(body))
+        quick_assistant_response = {
+            "role": "assistant",
+            "id": str(uuid.uuid4()),
+            "content": quick_response,
+            "user_id": user_id,
+            "timestamp": datetime.now().isoformat()
+        }
+        message_pair = {
+            "user": user_message,
+            "assistant": quick_assistant_response,
+            "timestamp": datetime.now().isoformat()
+        }
+        await store.add_rally(session, message_pair, max_rallies)
 
-    if last_pair:
-        last_two_json = await to_pretty_json(last_pair)
-    else:
-        last_two_json = ""
-    
-    user_history_json = await to_pretty_json(user_history_for_json)
-    summary_json = await to_pretty_json(summary)
-    user_preferences_json = await to_pretty_json(user_preferences)
-    
-    user_message = {
-        "role": "user", 
-        "content": body, 
-        "user_id": user_id, 
-        "timestamp": datetime.now().isoformat()
-    }
-    
-    history.append(user_message)
-    
-    text_response = await ai_service.openrouter_generate_response(body, summary_json, user_history_json, last_two_json, user_preferences_json)
+    async def update_summary():
+        summarize_response = await timer.run("summarize", ai_service.openrouter_summarize_conversation(summary_json, user_history_json, last_two_json))
+        summary = [{"role": "developer", "content": summarize_response}]
+        await store.set_summary(session, summary)
 
-    intent = await ai_service.openrouter_classify_intent(text_response)
-    print(intent)
-    if intent == "ready":
-        with open("meguro_shops.json", "r", encoding="utf-8") as f:
-            meguro_shops = json.load(f)
-        restaurant_results = vector_store.search_restaurants(summary[0]["content"], top_k=5)
+    try:
+        # 2つの更新は互いの結果を使わないので並行実行
+        await asyncio.gather(update_quick_history(), update_summary())
+    except Exception as e:
+        print(f"Post-turn update error: {e}")
+    print(timer.report("post-turn"))
+
+class ChatTurn:
+    """1ターン分の会話状態（/api/chat と /api/chat/stream で共通）"""
+    def __init__(self, body: str, session_id: str, timer: TurnTimer, bypass_cache: bool = False):
+        self.body = body
+        self.session_id = session_id
+        self.timer = timer
+        self.bypass_cache = bypass_cache
+        self.session = session_key(session_id)
+        self.user_id = str(uuid.uuid4())
+
+    async def load(self) -> None:
+        body, timer, session = self.body, self.timer, self.session
+        # 前のターンの要約・履歴更新が終わってから状態を読む
+        # （前のターンを別のワーカーが処理した場合はストアの印で待つ）
+        store = get_session_store()
+        await timer.run("wait_post_turn", post_turn_queue.wait_idle(session))
+        await timer.run("wait_other_workers", wait_for_updates(store, session, post_turn_queue.max_wait))
+
+        # 1. 情報抽出と会話状態の読み込みは互いに独立しているので並行実行
+        #    （状態はこのセッションの分だけ読む。履歴は直前のやり取りが分かる末尾だけ）
+        self.user_preferences, self.history, self.summary, rallies = await timer.gather({
+            "extract": extractor.extract_restaurant_info(body, session),
+            "load_state": store.recent_messages(session),
+            "load_summary": store.summary(session),
+            "load_user_history": store.rallies(session),
+        })
+        user_history_for_json = {session: {"messages": rallies}} if rallies else {}
+
+        last_pair = await get_last_conversation(self.history)
+
+        if last_pair:
+            self.last_two_json = await to_pretty_json(last_pair)
+        else:
+            self.last_two_json = ""
+        
+        self.user_history_json = await to_pretty_json(user_history_for_json)
+        self.summary_json = await to_pretty_json(self.summary)
+        self.user_preferences_json = await to_pretty_json(self.user_preferences)
+        
+        self.user_message = {
+            "role": "user", 
+            "content": body, 
+            "user_id": self.user_id, 
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        self.history.append(self.user_message)
+
+    def response_args(self):
+        return (self.body, self.summary_json, self.user_history_json, self.last_two_json, self.user_preferences_json)
+
+    async def classify_and_quick_reply(self, text_response: str):
+        # 2. クイックリプライはintentの結果に依存しないため、分類と同時に先行して生成する
+        #    （"ready"の場合は使わずに捨てる）
+        intent, quick_reply_response = await self.timer.gather({
+            "classify_intent": ai_service.openrouter_classify_intent(text_response),
+            "quick_reply": ai_service.openrouter_generate_quick_reply(self.body, text_response, self.summary_json),
+        })
+        print(intent)
+        return intent, quick_reply_response
+
+    async def recommendation_request(self):
+        """"ready"のときのおすすめ生成プロンプトと、表示する写真URLを作る"""
+        timer = self.timer
+        # 希望条件（エリア・ジャンル・予算・設備）でカタログから候補を絞り、その中だけをベクトル検索する
+        # （読み直し直後は絞り込みインデックスを作ることがあるので、スレッドで実行する）
+        candidates = await asyncio.to_thread(get_catalog().candidates, self.user_preferences)
+        print(f"Catalog filter: {candidates}")
+        # ベクトル検索は同期APIなのでスレッドで実行（イベントループを止めない）
+        restaurant_results = await timer.run(
+            "vector_search",
+            asyncio.to_thread(get_vector_store().search_restaurants, self.summary[0]["content"], 5, candidates.ids)
+        )
         ids = [item["id"] for item in restaurant_results]
-        id_set = set(ids)
-        matched_shops = [shop for shop in meguro_shops if shop["id"] in id_set]
-        conversation_summary = summary[0]["content"]
+        # 起動時に読み込んだカタログからIDで引く（検索スコア順）
+        matched_shops = [shop.to_dict() for shop in get_catalog().get_many(ids)]
+        conversation_summary = self.summary[0]["content"]
+        # プロンプトは要約・希望条件・候補店舗だけで決まるので、これをキャッシュのキーにする
+        self.cache_inputs = (conversation_summary, self.user_preferences, [shop.get("id") for shop in matched_shops])
 
         photo_urls  = []   # 写真 URL 一覧
         detail_urls = []
@@ -592,7 +709,7 @@ async def process_message(message_request: MessageRequest, session_id: Optional[
         {conversation_summary}
         
         【ユーザーの設定情報】
-        {user_preferences_json}
+        {self.user_preferences_json}
         
         【検索結果のレストラン情報】
         {matched_shops}
@@ -609,95 +726,229 @@ async def process_message(message_request: MessageRequest, session_id: Optional[
         8. Add the detail_url from {detail_urls} to each restaurant introduction. Do not use Markdown syntax for images - just provide the URLs in your text.
 
         """
-
+        return search_prompt, photo_urls
+
+    async def cached_recommendation(self) -> Optional[str]:
+        """同じ（または要約がほぼ同じ）問い合わせのおすすめ文がキャッシュにあれば返す"""
+        if self.bypass_cache or not response_cache.enabled:
+            response_cache.get(*self.cache_inputs, bypass=True)
+            return None
+        summary = self.cache_inputs[0]
         try:
-            openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            search_response = await openai_client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": search_prompt}
-                ]
-            )
-            assistant_content = search_response.choices[0].message.content
+            # ベクトル検索で同じテキストを埋め込み済みなので、埋め込みキャッシュから返る
+            self.summary_embedding = await asyncio.to_thread(get_vector_store().get_embedding, summary)
         except Exception as e:
-            print(f"Error generating response: {e}")
-            assistant_content = ""
+            print(f"Response cache embedding error: {e}")
+            self.summary_embedding = None
+        return response_cache.get(*self.cache_inputs, embedding=self.summary_embedding)
+
+    def remember_recommendation(self, content: str, usage: Any = None) -> None:
+        response_cache.put(
+            *self.cache_inputs, content,
+            embedding=getattr(self, "summary_embedding", None),
+            model=RECOMMEND_MODEL,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            bypass=self.bypass_cache,
+        )
+
+    async def finish_chat(self, text_response) -> str:
+        """"ready"以外のターンの応答を履歴に追加し、要約・履歴の更新をキューに積む"""
+        response_text = text_response
+        assistant_response = {
+            "id": text_response.id if hasattr(text_response, 'id') else str(uuid.uuid4()),
+            "role": "assistant",
+            "content": response_text,
+            "user_id": self.user_id,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.history.append(assistant_response)
+
+        # 履歴の保存・要約の更新は次のターンでしか使わないので、キューに積んですぐに返す
+        session, body, user_message, user_id = self.session, self.body, self.user_message, self.user_id
+        new_messages = [user_message, assistant_response]
+        summary_json, user_history_json, last_two_json = self.summary_json, self.user_history_json, self.last_two_json
+        store = get_session_store()
+        await store.begin_update(session)
+
+        async def job():
+            try:
+                await run_post_turn_updates(session, body, new_messages, user_message, user_id, summary_json, user_history_json, last_two_json)
+            finally:
+                await store.end_update(session)
+
+        post_turn_queue.submit(session, job)
+        return response_text
+
+@app.post("/api/chat")
+async def process_message(message_request: MessageRequest, session_id: Optional[str] = Cookie(None)):
+    timer = TurnTimer()
+    # クッキーがない場合は新しいセッションIDを発行（ジョブの順序保証のキーに使う）
+    session_id = session_id or str(uuid.uuid4())
+    turn = ChatTurn(message_request.message, session_id, timer, message_request.bypass_cache)
+    await turn.load()
+    
+    text_response = await timer.run("generate_response", ai_service.openrouter_generate_response(*turn.response_args()))
+
+    intent, quick_reply_response = await turn.classify_and_quick_reply(text_response)
+    if intent == "ready":
+        search_prompt, photo_urls = await turn.recommendation_request()
+
+        assistant_content = await timer.run("response_cache", turn.cached_recommendation())
+        if assistant_content is None:
+            try:
+                openai_client = get_llm_clients().openai()
+                search_response = await timer.run("recommend", openai_client.chat.completions.create(
+                    model=RECOMMEND_MODEL,
+                    messages=[
+                        {"role": "system", "content": search_prompt}
+                    ]
+                ))
+                assistant_content = search_response.choices[0].message.content
+                turn.remember_recommendation(assistant_content, getattr(search_response, "usage", None))
+            except Exception as e:
+                print(f"Error generating response: {e}")
+                assistant_content = ""
+        print(timer.report("ready"))
         response = JSONResponse(
             content={
                 "response": assistant_content, 
                 "image_urls": photo_urls,
-                }
+                },
+            headers={"Server-Timing": timer.server_timing_header()}
         )
         response.set_cookie(key="session_id", value=session_id)
         return response
-            
-        
-
-
-    response_text = text_response
-    assistant_response = {
-        "id": text_response.id if hasattr(text_response, 'id') else str(uuid.uuid4()),
-        "role": "assistant",
-        "content": response_text,
-        "user_id": user_id,
-        "timestamp": datetime.now().isoformat()
-    }
 
     result = {
-        "response": response_text
+        "response": await turn.finish_chat(text_response)
     }
 
-    quick_response = await ai_service.openrouter_generate_quick_summarize_response(body)
-
-    quick_assistant_response = {
-        "role": "assistant",
-        "id": str(uuid.uuid4()),
-        "content": quick_response,
-        "user_id": user_id,
-        "timestamp": datetime.now().isoformat()
-    }
-        
-    result = {
-        "response": response_text
-    }
-    
-    # Update history and user messages
-    history.append(assistant_response)
-    await save_json(chat_log_file, history)
-
-    quick_reply_response = await ai_service.openrouter_generate_quick_reply(body, response_text, summary_json)
-
     result["quickReplies"] = quick_reply_response
-
-
-
-    
-    
-    message_pair = {
-        "user": user_message,
-        "assistant": quick_assistant_response,
-        "timestamp": datetime.now().isoformat()
-    }
-    
-    await update_user_messages(user_id, message_pair)
-    
-    summarize_response = await ai_service.openrouter_summarize_conversation(summary_json, user_history_json, last_two_json)
-    
-    summary = [{"role": "developer", "content": summarize_response}]
-    await save_json(summary_file, summary)
+    print(timer.report("chat"))
     
     # Create a response with a cookie to track the session
-    response = JSONResponse(content=result)
+    response = JSONResponse(
+        content=result,
+        headers={"Server-Timing": timer.server_timing_header()}
+    )
     response.set_cookie(key="session_id", value=session_id)
     
     return response
 
+def sse_event(event: str, data: Any) -> str:
+    """Server-Sent Eventsの1イベント（dataはJSON）"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_recommendation(search_prompt: str, usage: Dict[str, Any]):
+    """おすすめ文（gpt-4.1）をストリーミングで生成（トークン数はusageに入れる）"""
+    openai_client = get_llm_clients().openai()
+    stream = await openai_client.chat.completions.create(
+        model=RECOMMEND_MODEL,
+        messages=[
+            {"role": "system", "content": search_prompt}
+        ],
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage["usage"] = chunk.usage
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if text:
+            yield text
+
+async def chat_event_stream(turn: ChatTurn):
+    """/api/chat/stream のイベント列
+
+    token（応答の断片）→ quick_replies → done の順に送る。
+    分類の結果が"ready"の場合は、reset で表示中の応答を消してから、おすすめ文の token → images を送る。
+    """
+    timer = turn.timer
+    try:
+        await turn.load()
+
+        # 応答は生成されたそばから送る（first_tokenはリクエスト開始から最初のトークンまで）
+        start = timer.total_ms()
+        chunks = []
+        async for text in ai_service.openrouter_stream_response(*turn.response_args()):
+            if not chunks:
+                timer.record("first_token", timer.total_ms())
+            chunks.append(text)
+            yield sse_event("token", {"text": text})
+        text_response = "".join(chunks).strip()
+        timer.record("generate_response", timer.total_ms() - start)
+
+        intent, quick_reply_response = await turn.classify_and_quick_reply(text_response)
+        if intent == "ready":
+            yield sse_event("reset", {})
+            search_prompt, photo_urls = await turn.recommendation_request()
+            cached = await timer.run("response_cache", turn.cached_recommendation())
+            if cached is not None:
+                yield sse_event("token", {"text": cached})
+            else:
+                start = timer.total_ms()
+                chunks, usage = [], {}
+                try:
+                    async for text in stream_recommendation(search_prompt, usage):
+                        chunks.append(text)
+                        yield sse_event("token", {"text": text})
+                    turn.remember_recommendation("".join(chunks), usage.get("usage"))
+                except Exception as e:
+                    print(f"Error generating response: {e}")
+                timer.record("recommend", timer.total_ms() - start)
+            yield sse_event("images", {"image_urls": photo_urls})
+            print(timer.report("ready-stream"))
+        else:
+            await turn.finish_chat(text_response)
+            yield sse_event("quick_replies", {"quickReplies": quick_reply_response})
+            print(timer.report("chat-stream"))
+        yield sse_event("done", {"timing": timer.server_timing_header()})
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        traceback.print_exc()
+        yield sse_event("error", {"message": "Failed to generate a response"})
+
+@app.post("/api/chat/stream")
+async def stream_message(message_request: MessageRequest, session_id: Optional[str] = Cookie(None)):
+    """/api/chat と同じ処理で、応答をServer-Sent Eventsで少しずつ返す"""
+    session_id = session_id or str(uuid.uuid4())
+    turn = ChatTurn(message_request.message, session_id, TurnTimer(), message_request.bypass_cache)
+    response = StreamingResponse(
+        chat_event_stream(turn),
+        media_type="text/event-stream",
+        # プロキシにバッファされないようにする
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.set_cookie(key="session_id", value=session_id)
+    return response
+
+@app.get("/api/metrics")
+async def metrics():
+    """キャッシュ・バックグラウンドキューの統計"""
+    embedding_cache = getattr(get_vector_store(create=False), "embedding_cache", None)
+    return JSONResponse(content={
+        "response_cache": response_cache.get_stats(),
+        "response_cache_top": response_cache.top_entries(),
+        "embedding_cache": embedding_cache.get_stats() if embedding_cache else None,
+        "post_turn_queue": dict(post_turn_queue.stats),
+        "llm_clients": get_llm_clients().get_stats(),
+        "session_store": get_session_store().get_stats(),
+        "json_cache": get_cache_stats(),
+        "startup_ms": {name: round(ms, 1) for name, ms in getattr(app.state, "startup_timer", TurnTimer()).timings.items()},
+    })
+
 @app.post("/clear")
-async def Clear():
-    await clear_chat_data()
-    await extractor.reset_info()
+async def Clear(session_id: Optional[str] = Cookie(None)):
+    # 未完了の更新がクリア後に書き戻さないよう先に待つ
+    session = session_key(session_id)
+    await post_turn_queue.wait_idle(session)
+    await get_session_store().clear(session)
     return JSONResponse(content={"status": "success", "message": "Clear chat history and reset info"})
 
+# インポートにかかった時間（起動レポートに出す）
+IMPORT_MS = (time.perf_counter() - _import_started) * 1000
+
 if __name__ == "__main__":
     # Ensure index.html is in templates directory
     if not os.path.exists('templates/index.html'):
@@ -707,4 +958,4 @@ if __name__ == "__main__":
         sys.exit(1)
         
     # Run the FastAPI application with uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=5000)